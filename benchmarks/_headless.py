@@ -0,0 +1,32 @@
+# Lets the benchmarks import omegalambda on machines without MaxIm DL or the pywin32 COM bindings (i.e. Linux CI).
+# Import this before omegalambda.  Nothing is replaced on a machine where the real modules are installed, and the
+# stand-ins refuse to dispatch, so no benchmark can accidentally drive hardware.
+import sys
+import types
+
+
+def _install(name, **attributes):
+    module = types.ModuleType(name)
+    module.__dict__.update(attributes)
+    sys.modules[name] = module
+    return module
+
+
+def _dispatch(name):
+    raise OSError('No COM server for {} on this machine (headless benchmark run)'.format(name))
+
+
+try:
+    import pythoncom
+except ImportError:
+    _install('pythoncom', CoInitialize=lambda: None, CoUninitialize=lambda: None)
+
+try:
+    import pywintypes
+except ImportError:
+    _install('pywintypes', com_error=type('com_error', (Exception,), {}))
+
+try:
+    import win32com.client
+except ImportError:
+    _install('win32com', client=_install('win32com.client', Dispatch=_dispatch))
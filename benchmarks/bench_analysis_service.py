@@ -0,0 +1,100 @@
+# Benchmark for device-thread responsiveness while image analysis runs inline vs. through the analysis service
+import _headless  # noqa: F401  (must come before omegalambda)
+
+import sys
+import time
+import queue
+import argparse
+import threading
+import numpy as np
+
+from omegalambda.main.common.util import filereader_utils, analysis_service
+
+
+class DeviceLoop(threading.Thread):
+    """
+    Stand-in for a Hardware thread: drains a command queue the same way Hardware.run does and records how long each
+    command waited between being queued and being executed.
+    """
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.q = queue.Queue()
+        self.latencies = []
+        self.running = True
+
+    def run(self):
+        while self.running:
+            try:
+                queued_at = self.q.get(block=False)
+            except queue.Empty:
+                time.sleep(0.001)
+                continue
+            self.latencies.append(time.perf_counter() - queued_at)
+
+
+def synthetic_frame(size, n_stars, seed=0):
+    rng = np.random.default_rng(seed)
+    frame = rng.normal(1000, 20, (size, size))
+    yy, xx = np.mgrid[:size, :size]
+    for x, y, amp in zip(rng.uniform(550, size - 550, n_stars), rng.uniform(550, size - 550, n_stars),
+                         rng.uniform(3000, 20000, n_stars)):
+        sl = (slice(int(y) - 20, int(y) + 20), slice(int(x) - 20, int(x) + 20))
+        frame[sl] += amp * np.exp(-((xx[sl] - x) ** 2 + (yy[sl] - y) ** 2) / (2 * 2.5 ** 2))
+    return frame.astype(np.uint16)
+
+
+def run(frame, n_analyses, analysis_threads, poll_interval):
+    device = DeviceLoop()
+    device.start()
+    work = queue.Queue()
+    for _ in range(n_analyses):
+        work.put(frame)
+
+    def analyze():
+        while True:
+            try:
+                data = work.get(block=False)
+            except queue.Empty:
+                return
+            filereader_utils.radial_average(data, 60000)
+
+    workers = [threading.Thread(target=analyze) for _ in range(analysis_threads)]
+    t0 = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    while any(worker.is_alive() for worker in workers):
+        device.q.put(time.perf_counter())
+        time.sleep(poll_interval)
+    elapsed = time.perf_counter() - t0
+    device.running = False
+    device.join()
+    latencies = np.array(device.latencies) * 1000
+    return elapsed, np.percentile(latencies, 50), np.percentile(latencies, 99), latencies.max()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--size', type=int, default=2048, help='Frame side length in pixels')
+    parser.add_argument('--stars', type=int, default=40, help='Number of synthetic stars per frame')
+    parser.add_argument('--analyses', type=int, default=8, help='Number of radial_average calls to run')
+    parser.add_argument('--threads', type=int, default=2, help='Number of threads requesting analysis')
+    parser.add_argument('--workers', type=int, default=2, help='Number of analysis service worker processes')
+    parser.add_argument('--poll', type=float, default=0.01, help='Seconds between device commands')
+    args = parser.parse_args()
+
+    frame = synthetic_frame(args.size, args.stars)
+    print('{:<10} {:>10} {:>10} {:>10} {:>10}'.format('mode', 'total s', 'p50 ms', 'p99 ms', 'max ms'))
+    row = '{:<10} {:>10.2f} {:>10.2f} {:>10.2f} {:>10.2f}'
+    print(row.format('inline', *run(frame, args.analyses, args.threads, args.poll)))
+    analysis_service.start_service(args.workers)
+    try:
+        # Warm up the worker processes so their import time is not counted
+        analysis_service.get_service().mediancounts(frame).result()
+        print(row.format('service', *run(frame, args.analyses, args.threads, args.poll)))
+    finally:
+        analysis_service.stop_service()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,74 @@
+# Benchmark for sub-pixel centroiding: batched windowed centroids vs. per-star photutils centroid_com
+import _headless  # noqa: F401  (must come before omegalambda)
+
+import time
+import argparse
+import numpy as np
+import photutils
+
+from omegalambda.main.common.util import filereader_utils
+
+
+def synthetic_frame(size, n_stars, fwhm=5.0, sky=1000, noise=15, seed=0):
+    rng = np.random.default_rng(seed)
+    frame = rng.normal(sky, noise, (size, size))
+    xs = rng.uniform(60, size - 60, n_stars)
+    ys = rng.uniform(60, size - 60, n_stars)
+    sigma = fwhm / 2.3548
+    for x, y, amp in zip(xs, ys, rng.uniform(2000, 20000, n_stars)):
+        y0, x0 = int(y) - 20, int(x) - 20
+        yy, xx = np.mgrid[y0:y0 + 40, x0:x0 + 40]
+        frame[y0:y0 + 40, x0:x0 + 40] += rng.poisson(amp * np.exp(-((xx - x) ** 2 + (yy - y) ** 2) /
+                                                                   (2 * sigma ** 2)))
+    return np.clip(frame, 0, 65535).astype(np.uint16), xs, ys
+
+
+def centroid_loop(image, x_peak, y_peak, median, r):
+    """
+    One photutils centroid_com call per star on a background-subtracted cutout, as find_peaks does internally
+    when it is given a centroid_func.
+    """
+    x_c, y_c = [], []
+    for x, y in zip(x_peak, y_peak):
+        cutout = image[y - r:y + r + 1, x - r:x + r + 1].astype(float) - median
+        cx, cy = photutils.centroids.centroid_com(cutout)
+        x_c.append(x - r + cx)
+        y_c.append(y - r + cy)
+    return np.array(x_c), np.array(y_c)
+
+
+def best_time(func, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - t0)
+    return min(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--stars', type=int, nargs='+', default=[10, 100, 1000], help='Numbers of stars')
+    parser.add_argument('--repeat', type=int, default=5, help='Number of timing repeats (best is reported)')
+    args = parser.parse_args()
+
+    r = filereader_utils.CENTROID_RADIUS
+    print('{:>6} {:>10} {:>11} {:>12} {:>12} {:>12}'.format('stars', 'loop ms', 'batched ms', 'peak err px',
+                                                             'loop err px', 'batch err px'))
+    for n_stars in args.stars:
+        size = int(max(1024, 120 * np.sqrt(n_stars)))
+        image, xs, ys = synthetic_frame(size, n_stars)
+        x_peak, y_peak = np.rint(xs).astype(int), np.rint(ys).astype(int)
+        t_loop, (x_l, y_l) = best_time(lambda: centroid_loop(image, x_peak, y_peak, 1000, r), args.repeat)
+        t_batch, (x_b, y_b, _, _) = best_time(lambda: filereader_utils.centroid_stars(image, x_peak, y_peak,
+                                                                                      1000, 15), args.repeat)
+
+        def error(x, y):
+            # Median rather than rms, so that the occasional blended pair does not dominate
+            return np.median(np.hypot(x - xs, y - ys))
+        print('{:>6} {:>10.2f} {:>11.2f} {:>12.3f} {:>12.3f} {:>12.3f}'.format(
+            n_stars, t_loop * 1000, t_batch * 1000, error(x_peak, y_peak), error(x_l, y_l), error(x_b, y_b)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+# Benchmark for full-frame star detection: full resolution peak finding vs. the coarse-to-fine pyramid
+import _headless  # noqa: F401  (must come before omegalambda)
+
+import time
+import argparse
+import numpy as np
+
+from omegalambda.main.common.util import filereader_utils
+
+
+def synthetic_frame(size, n_stars, fwhm=5.0, seed=0):
+    rng = np.random.default_rng(seed)
+    frame = rng.normal(1000, 15, (size, size))
+    sigma = fwhm / 2.3548
+    for x, y, amp in zip(rng.uniform(520, size - 520, n_stars), rng.uniform(520, size - 520, n_stars),
+                         rng.uniform(1000, 20000, n_stars)):
+        y0, x0 = int(y) - 20, int(x) - 20
+        yy, xx = np.mgrid[y0:y0 + 40, x0:x0 + 40]
+        frame[y0:y0 + 40, x0:x0 + 40] += amp * np.exp(-((xx - x) ** 2 + (yy - y) ** 2) / (2 * sigma ** 2))
+    return np.clip(frame, 0, 65535).astype(np.uint16)
+
+
+def unmatched(stars, others, radius=2.0):
+    """
+    Number of stars with no star of others within radius pixels.
+    """
+    if len(stars) == 0:
+        return 0
+    if len(others) == 0:
+        return len(stars)
+    distance = np.hypot(stars.x[:, None] - others.x[None, :], stars.y[:, None] - others.y[None, :])
+    return int((distance.min(axis=1) > radius).sum())
+
+
+def best_time(func, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - t0)
+    return min(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--size', type=int, nargs='+', default=[2048, 4096], help='Frame side lengths in pixels')
+    parser.add_argument('--stars', type=int, default=60, help='Number of synthetic stars per frame')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of timing repeats (best is reported)')
+    args = parser.parse_args()
+
+    print('{:>6} {:>10} {:>12} {:>8} {:>6} {:>8} {:>6}'.format('size', 'full ms', 'pyramid ms', 'speedup', 'full',
+                                                             'missed', 'extra'))
+    for size in args.size:
+        image = synthetic_frame(size, args.stars)
+        mean, median, stdev = filereader_utils.background_stats(image, method='fast')
+        threshold = np.broadcast_to(np.float64(mean + 5 * stdev), image.shape)
+        t_full, full = best_time(lambda: filereader_utils._detect_stars(image, median, stdev, threshold,
+                                                                             40000, 500), args.repeat)
+        t_pyr, pyr = best_time(lambda: filereader_utils._detect_stars_pyramid(image, median, stdev, threshold,
+                                                                                  40000, 500), args.repeat)
+        print('{:>6} {:>10.1f} {:>12.1f} {:>8.1f} {:>6} {:>8} {:>6}'.format(
+            size, t_full * 1000, t_pyr * 1000, t_full / t_pyr, len(full), unmatched(full, pyr), unmatched(pyr, full)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+# Benchmark for Hardware.run: how long a command posted with onThread waits before it runs, and how many commands a
+# device thread runs per second, for the blocking queue vs. the old poll-and-sleep loop, and how long an abort waits
+# behind slews with and without the safety lane
+import _headless  # noqa: F401  (must come before omegalambda)
+
+import sys
+import time
+import queue
+import argparse
+import threading
+import numpy as np
+
+from omegalambda.main.controller.hardware import Hardware, PRIORITY_NORMAL, PRIORITY_SAFETY
+
+DEVICES = ('Camera', 'Telescope', 'Dome', 'Focuser', 'Guider')
+
+
+class Device(Hardware):
+    """
+    Hardware thread without hardware: connecting always works, and the commands it is given only record when they
+    ran.
+    """
+
+    def __init__(self, name):
+        self.ran = []
+        self.aborted = False
+        super(Device, self).__init__(name=name)
+
+    def _class_connect(self):
+        return True
+
+    def command(self, posted):
+        self.ran.append(time.perf_counter() - posted)
+
+    def position(self):
+        return 1234
+
+    def slew(self, duration):
+        # Waits on the "mount" the way Telescope._is_ready does, until the slew is over or aborted
+        self.aborted = False
+        end = time.perf_counter() + duration
+        self.wait_until(lambda: self.aborted or time.perf_counter() > end, interval=1)
+
+    def abort(self, posted):
+        self.aborted = True
+        self.ran.append(time.perf_counter() - posted)
+
+
+class PollingDevice(Device):
+    """
+    The same device with the Hardware.run loop from before: wait up to 1/60 s for a command, then sleep for a
+    second if there was none.
+    """
+
+    def run(self):
+        while not self.stopping.isSet():
+            try:
+                _, _, (future, function, args, kwargs) = self.q.get(timeout=1.0/60)
+                future.set_result(function(*args, **kwargs))
+            except queue.Empty:
+                time.sleep(1)
+
+
+def latency(device_class, n_commands, max_gap, seed):
+    """
+    Posts commands to every device at random intervals of up to max_gap seconds, from one thread per device, the
+    way an observation run talks to idle devices, and returns the waits in milliseconds.
+    """
+    devices = [device_class(name) for name in DEVICES]
+    for device in devices:
+        device.start()
+
+    def post(device, rng):
+        for _ in range(n_commands):
+            time.sleep(rng.uniform(0, max_gap))
+            device.onThread(device.command, time.perf_counter())
+
+    posters = [threading.Thread(target=post, args=(device, np.random.default_rng(seed + i)))
+               for i, device in enumerate(devices)]
+    for poster in posters:
+        poster.start()
+    for poster in posters:
+        poster.join()
+    for device in devices:
+        device.onThread(device.stop)
+        device.join()
+    return np.array([wait for device in devices for wait in device.ran]) * 1000
+
+
+def throughput(device_class, n_commands, think):
+    """
+    Commands per second one device thread runs when they are posted one at a time, each think seconds after the
+    last one has finished, as a procedure that waits on every step and then works out the next one does.
+    """
+    device = device_class('Camera')
+    device.start()
+    done = threading.Event()
+    t0 = time.perf_counter()
+    for _ in range(n_commands):
+        done.clear()
+        device.onThread(done.set)
+        done.wait()
+        time.sleep(think)
+    elapsed = time.perf_counter() - t0
+    device.onThread(device.stop)
+    device.join()
+    return n_commands / elapsed
+
+
+def abort_latency(priority, n_slews, duration):
+    """
+    Seconds from posting an abort, with the given priority, to it running on a device that is in the middle of the
+    first of n_slews queued slews of duration seconds each.
+    """
+    device = Device('Telescope')
+    device.start()
+    for _ in range(n_slews):
+        device.onThread(device.slew, duration)
+    time.sleep(0.1)
+    device.onThread(device.abort, time.perf_counter(), priority=priority)
+    device.onThread(device.stop, priority=priority)
+    device.join()
+    return device.ran[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time onThread dispatch on Hardware threads')
+    parser.add_argument('--commands', type=int, default=20, help='Commands per device for the latency test')
+    parser.add_argument('--gap', type=float, default=1.5, help='Longest pause in seconds between two commands')
+    parser.add_argument('--sequential', type=int, default=200,
+                        help='Commands for the throughput test (the polling loop runs 10 of them)')
+    parser.add_argument('--think', type=float, default=0.02,
+                        help='Seconds the caller spends between a command finishing and posting the next')
+    parser.add_argument('--slews', type=int, default=3, help='Slews queued ahead of the abort')
+    parser.add_argument('--slew-time', type=float, default=2.0, help='Seconds each slew takes')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    print('{:<10} {:>8} {:>10} {:>10} {:>10} {:>14}'.format(
+        'loop', 'commands', 'p50 ms', 'p95 ms', 'max ms', 'sequential/s'))
+    for name, device_class, sequential in [('polling', PollingDevice, 10), ('blocking', Device, args.sequential)]:
+        waits = latency(device_class, args.commands, args.gap, args.seed)
+        rate = throughput(device_class, sequential, args.think)
+        print('{:<10} {:>8} {:>10.2f} {:>10.2f} {:>10.2f} {:>14.1f}'.format(
+            name, len(waits), np.percentile(waits, 50), np.percentile(waits, 95), waits.max(), rate))
+
+    # Reading a value the device thread looks up: with the future from onThread instead of a fixed two second sleep
+    # and a read of the attribute the command set
+    device = Device('Focuser')
+    device.start()
+    round_trips = []
+    for _ in range(args.sequential):
+        t0 = time.perf_counter()
+        device.onThread(device.position).result(timeout=5)
+        round_trips.append(time.perf_counter() - t0)
+    device.onThread(device.stop)
+    device.join()
+    print('query with future.result(): p50 {:.3f} ms, max {:.3f} ms (the sleep it replaces: 2000 ms)'.format(
+        np.percentile(round_trips, 50) * 1000, np.max(round_trips) * 1000))
+
+    # An abort posted while a slew runs and more are queued: FIFO in the normal lane, or in the safety lane, where it
+    # goes ahead of the queued slews and cuts into the running one
+    for name, priority in [('normal', PRIORITY_NORMAL), ('safety', PRIORITY_SAFETY)]:
+        wait = abort_latency(priority, args.slews, args.slew_time)
+        print('abort behind {} slews of {:.1f} s, {} lane: {:.1f} ms'.format(args.slews, args.slew_time, name,
+                                                                            wait * 1000))
+
+    # A stop called straight from another thread has to wake a device that is waiting on an empty queue
+    device = Device('Camera')
+    device.start()
+    time.sleep(0.1)
+    t0 = time.perf_counter()
+    device.stop()
+    device.join(timeout=5)
+    print('direct stop of an idle device: {:.2f} ms'.format((time.perf_counter() - t0) * 1000))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,162 @@
+# Benchmark for predictive guiding: the reactive threshold rule vs. drift_model.DriftModel, replayed in simulated time
+import _headless  # noqa: F401  (must come before omegalambda)
+
+import sys
+import argparse
+import numpy as np
+
+from omegalambda.main.common.util import drift_model
+
+STEP = 0.25
+
+
+class SimulatedSky:
+    """
+    Pointing error of a mount in arcseconds on the RA and Dec axes, as the distance the telescope has to move to
+    bring the image back: a linear drift (polar misalignment), periodic error on RA, a slow random walk, and a
+    sudden jump now and then (i.e. a gust of wind).  A correction of u arcseconds only moves the mount by gain * u.
+    """
+
+    def __init__(self, drift, gains, pe_amplitude, pe_period, gust_interval, gust_size, seed):
+        self.drift = np.array(drift)
+        self.gains = np.array(gains)
+        self.pe_amplitude = pe_amplitude
+        self.pe_period = pe_period
+        self.gust_interval = gust_interval
+        self.gust_size = gust_size
+        self.rng = np.random.default_rng(seed)
+        self.walk = np.zeros(2)
+        self.corrected = np.zeros(2)
+
+    def error(self, t):
+        periodic = np.array([self.pe_amplitude * np.sin(2 * np.pi * t / self.pe_period), 0.0])
+        return self.drift * t + periodic + self.walk - self.corrected
+
+    def step(self):
+        self.walk += self.rng.normal(0, 0.01, 2) * np.sqrt(STEP)
+        if self.gust_interval and self.rng.uniform() < STEP / self.gust_interval:
+            self.walk += self.rng.normal(0, self.gust_size, 2)
+
+    def correct(self, correction):
+        self.corrected += self.gains * np.asarray(correction)
+
+
+class Reactive:
+    """
+    The guider without guider_prediction: once a frame is more than guiding_threshold off, correct the whole
+    measured error times the static dampening.
+    """
+
+    def __init__(self, threshold, dampening, interval):
+        self.threshold = threshold
+        self.dampening = np.array(dampening)
+
+    def frame(self, t, t_mid, exposure, error):
+        if np.hypot(*error) >= self.threshold:
+            return error * self.dampening
+        return None
+
+    def between(self, t):
+        return None
+
+
+class Predictive:
+    """
+    The guider with guider_prediction: every frame updates the drift model, and corrections are sent whenever the
+    predicted error passes guiding_threshold, at each frame and every interval seconds in between.
+    """
+
+    def __init__(self, threshold, dampening, interval):
+        self.threshold = threshold
+        self.interval = interval
+        self.model = drift_model.DriftModel(1 / dampening[0], 1 / dampening[1])
+        self.last = -np.inf
+
+    def frame(self, t, t_mid, exposure, error):
+        self.model.update(t_mid, *error, exposure)
+        return self.anticipate(t)
+
+    def between(self, t):
+        if self.model.ready and t - self.last >= self.interval:
+            return self.anticipate(t)
+        return None
+
+    def anticipate(self, t):
+        self.last = t
+        ra, dec, ra_error, dec_error = self.model.correction(t, self.interval / 2)
+        if np.hypot(ra_error, dec_error) < self.threshold:
+            return None
+        self.model.apply(t, ra, dec)
+        return np.array([ra, dec])
+
+
+def replay(guider, args):
+    sky = SimulatedSky(args.drift, args.gains, args.pe_amplitude, args.pe_period, args.gust_interval, args.gust_size,
+                       args.seed)
+    noise = np.random.default_rng(args.seed + 1)
+    corrections = []
+    frame_errors = []
+    smear = []
+    t = 0.0
+    exposure = []
+    start = 0.0
+    while t < args.hours * 3600:
+        sky.step()
+        error = sky.error(t)
+        cycle = (t - start) % (args.exposure + args.readout)
+        correction = None
+        if cycle < args.exposure:
+            exposure.append(error)
+        elif exposure and cycle >= args.exposure + args.readout - STEP:
+            # The frame is saved: its star positions are the mean pointing error during the exposure, plus seeing
+            exposure = np.array(exposure)
+            frame_errors.append(exposure.mean(axis=0))
+            smear.append(exposure.std(axis=0))
+            measured = exposure.mean(axis=0) + noise.normal(0, args.seeing, 2)
+            correction = guider.frame(t, t - args.readout - args.exposure / 2, args.exposure, measured)
+            exposure = []
+        if correction is None:
+            correction = guider.between(t)
+        if correction is not None:
+            sky.correct(correction)
+            corrections.append(np.hypot(*correction))
+        t += STEP
+    frame_errors = np.array(frame_errors)
+    return (len(frame_errors), len(corrections), np.mean(corrections) if corrections else 0.0,
+            np.sqrt((frame_errors ** 2).sum(axis=1).mean()), np.sqrt((np.array(smear) ** 2).sum(axis=1).mean()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay guiding in simulated time, reactive vs. predictive')
+    parser.add_argument('--hours', type=float, default=2, help='Length of the simulated run')
+    parser.add_argument('--exposure', type=float, default=60, help='Exposure time in seconds')
+    parser.add_argument('--readout', type=float, default=5, help='Seconds between exposures')
+    parser.add_argument('--drift', type=float, nargs=2, default=[0.004, -0.003],
+                        help='Linear drift on RA and Dec in arcseconds per second')
+    parser.add_argument('--gains', type=float, nargs=2, default=[0.7, 1.2],
+                        help='Fraction of a correction the mount actually makes on RA and Dec')
+    parser.add_argument('--pe-amplitude', type=float, default=2.0, help='RA periodic error amplitude in arcseconds')
+    parser.add_argument('--pe-period', type=float, default=480, help='RA periodic error period in seconds')
+    parser.add_argument('--gust-interval', type=float, default=1200, help='Mean seconds between gusts (0 for none)')
+    parser.add_argument('--gust-size', type=float, default=1.0, help='Size of a gust in arcseconds per axis')
+    parser.add_argument('--seeing', type=float, default=0.15, help='Noise of a measured frame position in arcseconds')
+    parser.add_argument('--threshold', type=float, default=0.1, help='guiding_threshold in arcseconds')
+    parser.add_argument('--dampening', type=float, nargs=2, default=[1.25, 0.75],
+                        help='guider_ra_dampening and guider_dec_dampening')
+    parser.add_argument('--interval', type=float, default=10, help='Seconds between predictive corrections')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    print('{:<12} {:>7} {:>12} {:>16} {:>16} {:>16}'.format(
+        'guider', 'frames', 'corrections', 'mean move "', 'frame RMS "', 'in-frame RMS "'))
+    for name, guider in [('reactive', Reactive), ('predictive', Predictive)]:
+        guider = guider(args.threshold, args.dampening, args.interval)
+        frames, n_corrections, size, frame_rms, smear_rms = replay(guider, args)
+        print('{:<12} {:>7} {:>12} {:>16.3f} {:>16.3f} {:>16.3f}'.format(
+            name, frames, n_corrections, size, frame_rms, smear_rms))
+        if name == 'predictive':
+            print('learned gains: RA {:.2f}, Dec {:.2f} (true {:.2f}, {:.2f})'.format(*guider.model.gains, *args.gains))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
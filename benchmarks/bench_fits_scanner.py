@@ -0,0 +1,85 @@
+# Benchmark for reading frame metadata: fits_scanner.scan vs. fits.getheader on every file
+import _headless  # noqa: F401  (must come before omegalambda)
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import numpy as np
+from astropy.io import fits
+
+from omegalambda.main.common.util import fits_scanner
+
+
+def write_frames(directory, n_frames, size):
+    """
+    Frames with a MaxIm-like header (the keywords the observation run and the camera driver write) and a small
+    data section; the data is never read by either method, so its size only matters for the file system cache.
+    """
+    data = np.zeros((size, size), dtype=np.uint16)
+    paths = []
+    for i in range(n_frames):
+        header = fits.Header()
+        for key, value in [('OBJECT', 'TOI1234.01'), ('IMAGETYP', 'Light Frame'), ('FILTER', 'r'),
+                           ('EXPTIME', 8.0 + i % 3), ('DATE-OBS', '2026-10-18T03:{:02d}:00'.format(i % 60)),
+                           ('JD_UTC', 2461331.5 + i / 1440), ('AIRMASS', 1.2 + i / 1e4), ('CCD-TEMP', -20.0),
+                           ('XBINNING', 1), ('YBINNING', 1), ('SITELAT', '+37:13:40.0'), ('OBSERVER', "O'Brien")]:
+            header[key] = value
+        for j in range(40):
+            header['HISTORY'] = 'Calibration step {}'.format(j)
+        path = os.path.join(directory, 'frame-{:05d}.fits'.format(i))
+        fits.writeto(path, data, header)
+        paths.append(path)
+    return paths
+
+
+def astropy_scan(paths, keywords):
+    rows = []
+    for path in paths:
+        header = fits.getheader(path)
+        rows.append({keyword: header.get(keyword) for keyword in keywords})
+    return rows
+
+
+def best_time(func, repeat):
+    times = []
+    result = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - t0)
+    return min(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time header scanning, fits_scanner vs. astropy')
+    parser.add_argument('--frames', type=int, default=1000, help='Number of synthetic frames')
+    parser.add_argument('--size', type=int, default=64, help='Side length of the synthetic frames in pixels')
+    parser.add_argument('--directory', help='Scan an existing directory (i.e. on the network share) instead')
+    parser.add_argument('--workers', type=int, default=16, help='fits_scanner threads')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    keywords = fits_scanner.DEFAULT_KEYWORDS
+    with tempfile.TemporaryDirectory() as directory:
+        if args.directory:
+            paths = list(fits_scanner.scan(args.directory, ('NAXIS',)).paths)
+        else:
+            paths = write_frames(directory, args.frames, args.size)
+        t_astropy, rows = best_time(lambda: astropy_scan(paths, keywords), args.repeat)
+        t_serial, _ = best_time(lambda: fits_scanner.scan(paths, keywords, workers=1), args.repeat)
+        t_pool, table = best_time(lambda: fits_scanner.scan(paths, keywords, workers=args.workers), args.repeat)
+
+    mismatches = sum(1 for i, row in enumerate(rows) for keyword in keywords
+                     if row[keyword] is not None and table.row(i)[keyword] != row[keyword])
+    print('{} files, {} keywords, {} mismatches'.format(len(paths), len(keywords), mismatches))
+    print('{:<24} {:>10} {:>12} {:>8}'.format('method', 'total ms', 'us per file', 'speedup'))
+    for name, elapsed in [('fits.getheader', t_astropy), ('scan, 1 thread', t_serial),
+                          ('scan, {} threads'.format(args.workers), t_pool)]:
+        print('{:<24} {:>10.1f} {:>12.1f} {:>8.1f}'.format(name, elapsed * 1000, elapsed / len(paths) * 1e6,
+                                                           t_astropy / elapsed))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,128 @@
+# Benchmark for guider correction latency: one jog per axis vs. Telescope.guide_correction, on a simulated mount
+import _headless  # noqa: F401  (must come before omegalambda)
+
+import sys
+import time
+import argparse
+import threading
+import numpy as np
+
+from omegalambda.main.controller.telescope import Telescope
+from omegalambda.main.observing.guider import Guider
+
+
+class SimulatedMount:
+    """
+    Stands in for the ASCOM telescope object.  PulseGuide starts a pulse of the given length on one axis and
+    returns at once (or blocks for the pulse, with synchronous=True, like some drivers do); IsPulseGuiding is True
+    while a pulse is running on either axis, and so is Slewing with slewing=True, like other drivers.
+    """
+
+    def __init__(self, synchronous=False, slewing=False, guide_rate=0.5):
+        self.synchronous = synchronous
+        self.slewing = slewing
+        # Guide rates in degrees per second, as a fraction of sidereal
+        self.GuideRateRightAscension = self.GuideRateDeclination = guide_rate * 15 / 3600
+        self.Connected = True
+        self.pulse_start = []
+        self.pulse_end = {}
+        self.lock = threading.Lock()
+
+    def PulseGuide(self, direction, duration):
+        axis = 'dec' if direction in (0, 1) else 'ra'
+        with self.lock:
+            self.pulse_start.append(time.monotonic())
+            self.pulse_end[axis] = time.monotonic() + duration / 1000
+        if self.synchronous:
+            time.sleep(duration / 1000)
+
+    @property
+    def IsPulseGuiding(self):
+        with self.lock:
+            return any(end > time.monotonic() for end in self.pulse_end.values())
+
+    @property
+    def Slewing(self):
+        return self.slewing and self.IsPulseGuiding
+
+    def pulses(self):
+        # Start of the first pulse and end of the last one since the last call
+        with self.lock:
+            span = (min(self.pulse_start, default=0), max(self.pulse_end.values(), default=0))
+            self.pulse_start.clear()
+            self.pulse_end.clear()
+        return span
+
+
+class SimulatedTelescope(Telescope):
+
+    def __init__(self, mount):
+        self.mount = mount
+        super(SimulatedTelescope, self).__init__()
+
+    def _class_connect(self):
+        self.Telescope = self.mount
+        return True
+
+
+def sequential_correction(telescope, xdirection, xjog_distance, ydirection, yjog_distance):
+    # The correction before guide_correction: one jog per axis, each waited on through slew_done
+    telescope.onThread(telescope.jog, xdirection, xjog_distance)
+    telescope.slew_done.wait()
+    telescope.onThread(telescope.jog, ydirection, yjog_distance)
+    telescope.slew_done.wait()
+
+
+def measure(correct, mount, corrections):
+    """
+    Time from the start of each correction until it returns, until the mount has actually stopped moving, and from
+    the first pulse to the end of the last.  A mount that is still moving after the correction returns is moving
+    during the start of the next exposure.  The first two include waiting for the telescope thread to pick up the
+    request from its queue.
+    """
+    returned = []
+    finished = []
+    pulsing = []
+    for correction in corrections:
+        mount.pulses()
+        t0 = time.monotonic()
+        correct(*correction)
+        t1 = time.monotonic()
+        # Queued jogs may still be waiting for the telescope thread
+        time.sleep(4)
+        first, last = mount.pulses()
+        returned.append(t1 - t0)
+        finished.append(last - t0)
+        pulsing.append(last - first)
+    return np.array(returned), np.array(finished), np.array(pulsing)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time guider corrections, one axis at a time vs. both at once')
+    parser.add_argument('--trials', type=int, default=10, help='Number of corrections per method')
+    parser.add_argument('--distance', type=float, default=3.0, help='Largest correction per axis in arcseconds')
+    parser.add_argument('--synchronous', action='store_true', help='Simulate a driver whose PulseGuide blocks')
+    parser.add_argument('--slewing', action='store_true', help='Simulate a driver that is Slewing while pulse guiding')
+    args = parser.parse_args()
+
+    mount = SimulatedMount(synchronous=args.synchronous, slewing=args.slewing)
+    telescope = SimulatedTelescope(mount)
+    telescope.start()
+    guider = Guider(None, telescope)
+    rng = np.random.default_rng(0)
+    corrections = [(rng.choice(['east', 'west']), rng.uniform(0.5, 1) * args.distance,
+                    rng.choice(['north', 'south']), rng.uniform(0.5, 1) * args.distance) for _ in range(args.trials)]
+
+    print('{:<24} {:>12} {:>12} {:>11} {:>16}'.format('method', 'returned ms', 'finished ms', 'pulsing ms',
+                                                      'moving after ms'))
+    for name, correct in [('jog, one axis at a time', lambda *c: sequential_correction(telescope, *c)),
+                          ('guide_correction', guider.make_correction)]:
+        returned, finished, pulsing = measure(correct, mount, corrections)
+        print('{:<24} {:>12.0f} {:>12.0f} {:>11.0f} {:>16.0f}'.format(
+            name, returned.mean() * 1000, finished.mean() * 1000, pulsing.mean() * 1000,
+            np.maximum(finished - returned, 0).mean() * 1000))
+    telescope.onThread(telescope.stop)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
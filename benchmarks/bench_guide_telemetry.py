@@ -0,0 +1,90 @@
+# Benchmark for guide telemetry: recording into TelemetryBuffer vs. the alternatives, flushing, and reading it back
+import _headless  # noqa: F401  (must come before omegalambda)
+
+import os
+import sys
+import time
+import logging
+import argparse
+import tempfile
+import numpy as np
+
+from omegalambda.main.common.util import guide_telemetry
+
+
+def per_call(func, samples, repeat):
+    """
+    Best time per call in nanoseconds of func(i) over samples calls, out of repeat runs.  The loop overhead is
+    measured the same way and taken off.
+    """
+    def run(f):
+        t0 = time.perf_counter()
+        for i in range(samples):
+            f(i)
+        return time.perf_counter() - t0
+    overhead = min(run(lambda i: None) for _ in range(repeat))
+    return (min(run(func) for _ in range(repeat)) - overhead) / samples * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time recording, flushing, and reading guide telemetry')
+    parser.add_argument('--samples', type=int, default=100000, help='Records per timed run')
+    parser.add_argument('--capacity', type=int, default=guide_telemetry.TELEMETRY_CAPACITY)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    buffer = guide_telemetry.TelemetryBuffer(capacity=args.capacity)
+    array = np.zeros(args.capacity, dtype=guide_telemetry.TELEMETRY_DTYPE)
+    logging.basicConfig(level=logging.INFO)
+
+    def numpy_row(i):
+        array[i % args.capacity] = (1.7e9 + i, i, 0.5, -0.25, 0.56, 0.4, -0.2, 0.01, guide_telemetry.CORRECTED)
+
+    def log_lines(i):
+        # What guiding_procedure logged per iteration before the telemetry, with debug logging off
+        logging.debug('Guide star relative coordinates: x={}, y={}'.format(0.5, -0.25))
+        logging.debug('Guide star absolute coordinates: x={}, y={}'.format(1024.5, 1023.75))
+        logging.debug('Separation: {} px'.format(0.56))
+
+    print('{:<36} {:>10}'.format('per sample', 'ns'))
+    for name, func in [('TelemetryBuffer.record', lambda i: buffer.record(
+                            1.7e9 + i, i, 0.5, -0.25, 0.56, 0.4, -0.2, 0.01, guide_telemetry.CORRECTED)),
+                       ('structured array row assignment', numpy_row),
+                       ('logging.debug lines (level INFO)', log_lines)]:
+        print('{:<36} {:>10.0f}'.format(name, per_call(func, args.samples, args.repeat)))
+
+    with tempfile.TemporaryDirectory() as directory:
+        buffer = guide_telemetry.TelemetryBuffer(guide_telemetry.telemetry_path(directory), args.capacity)
+        rng = np.random.default_rng(0)
+        # A night of 60 s images with 10 s predictive corrections in between, flushed every minute as the guider does
+        n_minutes = 12 * 60
+        flush_times = []
+        for minute in range(n_minutes):
+            for k in range(6):
+                dx, dy = rng.normal(0, 0.5, 2)
+                flags = guide_telemetry.CORRECTED | (guide_telemetry.PREDICTED if k else 0)
+                buffer.record(1.7e9 + minute * 60 + k * 10, 0 if k else minute + 1, dx, dy, np.hypot(dx, dy),
+                              0.3, -0.1, 0.02, flags)
+            t0 = time.perf_counter()
+            buffer.flush()
+            flush_times.append(time.perf_counter() - t0)
+        size = os.path.getsize(guide_telemetry.telemetry_path(directory))
+        t0 = time.perf_counter()
+        records = guide_telemetry.read_telemetry(directory)
+        t_read = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        hour = guide_telemetry.query(records, 1.7e9 + 3600, 1.7e9 + 7200, without=guide_telemetry.PREDICTED)
+        result = guide_telemetry.summary(records)
+        t_query = time.perf_counter() - t0
+
+    print('\n12 h night: {} records, {:.0f} kB on disk ({} B per record)'.format(
+        len(records), size / 1024, guide_telemetry.TELEMETRY_DTYPE.itemsize))
+    print('flush every minute: mean {:.1f} us, max {:.1f} us'.format(np.mean(flush_times) * 1e6,
+                                                                   np.max(flush_times) * 1e6))
+    print('read {:.2f} ms, query + summary {:.2f} ms ({} images in the second hour)'.format(
+        t_read * 1e3, t_query * 1e3, len(hour)))
+    print('summary: {}'.format(', '.join('{}={:.3g}'.format(key, value) for key, value in result.items())))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
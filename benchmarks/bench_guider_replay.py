@@ -0,0 +1,355 @@
+# Replay harness for the guider: the real Guider thread, fed synthetic or recorded frames by a stand-in camera and
+# correcting a stand-in telescope, in accelerated time, with the latency of every step of every guiding iteration
+import _headless  # noqa: F401  (must come before omegalambda)
+
+import os
+import sys
+import glob
+import time
+import argparse
+import tempfile
+import threading
+import numpy as np
+from unittest import mock
+from astropy.io import fits
+from scipy import ndimage
+
+from bench_guiding import synthetic_frame
+from omegalambda.main.common.IO import config_reader
+from omegalambda.main.common.util import frame_feed, guide_telemetry, image_registration
+from omegalambda.main.controller.hardware import Hardware
+from omegalambda.main.observing import guider as guider_module
+
+# Virtual seconds between samples of the pointing while a frame is exposed
+SAMPLE_STEP = 0.25
+# Guide rate of the stand-in telescope in arcseconds per second (0.5x sidereal)
+GUIDE_RATE = 7.5
+# Frames kept on disk by the stand-in camera
+KEEP_FRAMES = 3
+
+
+class AcceleratedClock:
+    """
+    Virtual time.time() that runs speed times faster than the wall clock.  perf_counter stays real, since the
+    guider only uses it to time its own iterations.
+    """
+
+    def __init__(self, speed):
+        self.speed = speed
+        self.start = time.time()
+        self.start_real = time.monotonic()
+
+    def time(self):
+        return self.start + (time.monotonic() - self.start_real) * self.speed
+
+    def sleep(self, seconds):
+        time.sleep(max(seconds, 0) / self.speed)
+
+    @staticmethod
+    def perf_counter():
+        return time.perf_counter()
+
+
+class AcceleratedSubscription(frame_feed.Subscription):
+
+    def get(self, timeout=None):
+        # The guider's timeouts are in virtual seconds
+        return super(AcceleratedSubscription, self).get(None if timeout is None else timeout / self.feed.clock.speed)
+
+
+class AcceleratedFeed(frame_feed.FrameFeed):
+
+    def __init__(self, clock):
+        self.clock = clock
+        super(AcceleratedFeed, self).__init__()
+
+    def subscribe(self, maxsize=1, accept=None):
+        subscription = AcceleratedSubscription(self, maxsize, accept)
+        with self._lock:
+            self._subscribers.append(subscription)
+        return subscription
+
+
+class SimulatedSky:
+    """
+    Pointing error in arcseconds on RA and Dec, as the distance the telescope has to move to bring the image back:
+    a linear drift, periodic error on RA, and the corrections made so far, of which the mount only makes gain * u.
+    """
+
+    def __init__(self, clock, drift, gains, pe_amplitude, pe_period):
+        self.clock = clock
+        self.drift = np.array(drift)
+        self.gains = np.array(gains)
+        self.pe_amplitude = pe_amplitude
+        self.pe_period = pe_period
+        self.corrected = np.zeros(2)
+        self.lock = threading.Lock()
+
+    def error(self):
+        t = self.clock.time() - self.clock.start
+        periodic = np.array([self.pe_amplitude * np.sin(2 * np.pi * t / self.pe_period), 0.0])
+        with self.lock:
+            return self.drift * t + periodic - self.corrected
+
+    def correct(self, ra_distance, dec_distance):
+        with self.lock:
+            self.corrected += self.gains * np.array([ra_distance, dec_distance])
+
+
+def pixel_shift(error, config):
+    # Inverse of Guider.sky_offset: how far the image moves on the detector for a pointing error in arcseconds
+    gamma = config.guider_angle
+    rot = np.array([[np.cos(gamma), np.sin(gamma)], [-np.sin(gamma), np.cos(gamma)]])
+    shift = np.matmul(rot, np.asarray(error) / config.plate_scale)
+    if config.guider_flip_y:
+        shift[1] *= -1
+    return shift
+
+
+def pointing_error(shift, config):
+    # Guider.sky_offset: the pointing error in arcseconds for an image moved by shift pixels
+    shift = np.array(shift, dtype=float)
+    if config.guider_flip_y:
+        shift[1] *= -1
+    gamma = config.guider_angle
+    rot = np.array([[np.cos(gamma), -np.sin(gamma)], [np.sin(gamma), np.cos(gamma)]])
+    return np.matmul(rot, shift) * config.plate_scale
+
+
+class StandInTelescope(Hardware):
+    """
+    Telescope with the interface the guider uses (onThread, slew_done, guide_correction).  A correction takes as long
+    as the longer axis at GUIDE_RATE in virtual time, then moves the simulated sky.
+    """
+
+    def __init__(self, sky, clock):
+        self.sky = sky
+        self.clock = clock
+        self.slew_done = threading.Event()
+        self.started = []
+        self.corrections = []
+        super(StandInTelescope, self).__init__(name='Telescope')
+
+    def _class_connect(self):
+        return True
+
+    def guide_correction(self, ra_distance, dec_distance):
+        self.started.append(time.monotonic())
+        self.corrections.append((ra_distance, dec_distance))
+        self.clock.sleep(max(abs(ra_distance), abs(dec_distance)) / GUIDE_RATE)
+        self.sky.correct(ra_distance, dec_distance)
+        self.slew_done.set()
+        return True
+
+
+class StandInCamera(threading.Thread):
+    """
+    Exposes frames back to back in virtual time, writes each one to the image directory, and publishes it to the
+    frame feed like Camera.expose.  Synthetic frames are a fixed star field moved by the mean pointing error over the
+    exposure; recorded frames are moved by the corrections the telescope has made, and their pointing error is
+    measured by registering them against the first one.
+    """
+
+    def __init__(self, sky, clock, directory, args, recorded=None):
+        self.sky = sky
+        self.clock = clock
+        self.directory = directory
+        self.args = args
+        self.recorded = recorded
+        self.config = config_reader.get_config()
+        self.image_shape = None
+        self.published = {}
+        self.errors = []
+        self.reference = None
+        self.done = threading.Event()
+        super(StandInCamera, self).__init__(name='Camera-Th', daemon=True)
+
+    def run(self):
+        rng = np.random.default_rng(self.args.seed)
+        count = len(self.recorded) if self.recorded else int(self.args.minutes * 60 // (self.args.exposure +
+                                                                                         self.args.readout))
+        paths = []
+        for i in range(count):
+            exposure = self.args.exposure
+            if self.recorded:
+                exposure = fits.getheader(self.recorded[i]).get('EXPTIME', exposure)
+            samples = []
+            end = self.clock.time() + exposure
+            while self.clock.time() < end:
+                samples.append(self.sky.error())
+                self.clock.sleep(SAMPLE_STEP)
+            error = np.mean(samples, axis=0)
+            shift = pixel_shift(error + rng.normal(0, self.args.seeing, 2), self.config)
+            if self.recorded:
+                data = fits.getdata(self.recorded[i])
+                # Keeps the camera's data type, which the star detection expects
+                data = ndimage.shift(data.astype(np.float32), (shift[1], shift[0]), order=1,
+                                     mode='nearest').astype(data.dtype)
+                region = image_registration.read_region(data)
+                if self.reference is None:
+                    self.reference = image_registration.PhaseReference(region)
+                error = pointing_error(self.reference.offset(region)[:2], self.config)
+            else:
+                data = synthetic_frame(self.args.size, self.args.stars, tuple(shift), noise_seed=i)
+            self.errors.append(error)
+            path = os.path.join(self.directory, 'frame-{:04d}.fits'.format(i))
+            fits.writeto(path, data, overwrite=True)
+            paths.append(path)
+            if len(paths) > KEEP_FRAMES:
+                os.remove(paths.pop(0))
+            published = time.monotonic()
+            frame = frame_feed.get_feed().publish(path, exposure_time=exposure)
+            self.published[frame.sequence] = published
+            self.clock.sleep(self.args.readout)
+        self.done.set()
+
+
+class RecordingEvent(threading.Event):
+
+    def __init__(self, on_set):
+        self.on_set = on_set
+        super(RecordingEvent, self).__init__()
+
+    def set(self):
+        self.on_set()
+        super(RecordingEvent, self).set()
+
+
+class IterationLog:
+    """
+    Wall-clock timestamps of every guiding iteration: when the frame was published, when the guider picked it up,
+    when it sent a correction, when the telescope started it, and when it was done.
+    """
+
+    def __init__(self, camera, telescope):
+        self.camera = camera
+        self.telescope = telescope
+        self.iterations = []
+        self.current = None
+        self.between = 0
+
+    def instrument(self, guider):
+        next_frame = guider.next_frame
+        send_correction = guider.send_correction
+
+        def timed_next_frame():
+            frame = next_frame()
+            if frame is not None:
+                self.current = {'published': self.camera.published.get(frame.sequence, np.nan),
+                                'picked': time.monotonic()}
+            return frame
+
+        def timed_send_correction(ra_distance, dec_distance):
+            if self.current is None:
+                # Sent by the drift model between frames
+                self.between += 1
+                return send_correction(ra_distance, dec_distance)
+            self.current['sent'] = time.monotonic()
+            send_correction(ra_distance, dec_distance)
+            self.current['started'] = self.telescope.started[-1]
+            self.current['completed'] = time.monotonic()
+
+        guider.next_frame = timed_next_frame
+        guider.send_correction = timed_send_correction
+        guider.loop_done = RecordingEvent(self.done)
+
+    def done(self):
+        if self.current is not None:
+            self.current['done'] = time.monotonic()
+            self.iterations.append(self.current)
+            self.current = None
+
+    def stages(self):
+        def stage(start, end):
+            return np.array([i.get(end, np.nan) - i.get(start, np.nan) for i in self.iterations]) * 1000
+        return [('frame wait', stage('published', 'picked')),
+                ('analysis', np.array([(i.get('sent', i['done']) - i['picked']) * 1000 for i in self.iterations])),
+                ('correction issue', stage('sent', 'started')),
+                ('correction complete', stage('started', 'completed')),
+                ('iteration', stage('published', 'done'))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay frames through the real guider in accelerated time')
+    parser.add_argument('--frames', help='Folder of recorded FITS frames to replay in name order (default: synthetic)')
+    parser.add_argument('--mode', default='star', choices=['star', 'multistar', 'phase'], help='guider_mode')
+    parser.add_argument('--prediction', action='store_true', help='Turn on guider_prediction')
+    parser.add_argument('--speed', type=float, default=20, help='How many times faster than real time to run')
+    parser.add_argument('--minutes', type=float, default=30, help='Length of a synthetic run in virtual minutes')
+    parser.add_argument('--exposure', type=float, default=60, help='Exposure time in seconds')
+    parser.add_argument('--readout', type=float, default=5, help='Seconds between exposures')
+    parser.add_argument('--size', type=int, default=2048, help='Side length of synthetic frames in pixels')
+    parser.add_argument('--stars', type=int, default=200, help='Stars per synthetic frame')
+    parser.add_argument('--drift', type=float, nargs=2, default=[0.004, -0.003],
+                        help='Linear drift on RA and Dec in arcseconds per second')
+    parser.add_argument('--gains', type=float, nargs=2, default=[0.7, 1.2],
+                        help='Fraction of a correction the mount actually makes on RA and Dec')
+    parser.add_argument('--pe-amplitude', type=float, default=2.0, help='RA periodic error amplitude in arcseconds')
+    parser.add_argument('--pe-period', type=float, default=480, help='RA periodic error period in seconds')
+    parser.add_argument('--seeing', type=float, default=0.15, help='Jitter of a frame position in arcseconds')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    config = config_reader.get_config()
+    config.guider_mode = args.mode
+    config.guider_prediction = args.prediction
+    recorded = sorted(glob.glob(os.path.join(args.frames, '*.fit*'))) if args.frames else None
+    if recorded is not None and not recorded:
+        print('No FITS frames in {}'.format(args.frames))
+        return 1
+    if recorded:
+        # The recorded frames already drift on their own
+        args.drift, args.pe_amplitude, args.seeing = [0.0, 0.0], 0.0, 0.0
+
+    clock = AcceleratedClock(args.speed)
+    sky = SimulatedSky(clock, args.drift, args.gains, args.pe_amplitude, args.pe_period)
+    with tempfile.TemporaryDirectory() as directory, \
+            mock.patch.object(frame_feed, '_feed', AcceleratedFeed(clock)), \
+            mock.patch.object(frame_feed, 'time', clock), mock.patch.object(guider_module, 'time', clock):
+        telescope = StandInTelescope(sky, clock)
+        camera = StandInCamera(sky, clock, directory, args, recorded)
+        guider = guider_module.Guider(camera, telescope)
+        log = IterationLog(camera, telescope)
+        log.instrument(guider)
+        telescope.start()
+        guider.start()
+        guider.onThread(guider.guiding_procedure, directory)
+        # Gives the guider thread time to pick up the procedure and subscribe before the first frame
+        time.sleep(1.5)
+        t0 = time.monotonic()
+        camera.start()
+        camera.done.wait()
+        time.sleep(2)
+        guider.stop_guiding()
+        guider.loop_done.wait(timeout=10)
+        guider.onThread(guider.stop)
+        telescope.onThread(telescope.stop)
+        wall = time.monotonic() - t0
+        telemetry = guide_telemetry.summary(guide_telemetry.read_telemetry(directory))
+
+    print('{} guider{}, {} frames in {:.0f} s ({:.0f} virtual minutes, {:.0f}x)'.format(
+        args.mode, ' with prediction' if args.prediction else '', len(camera.errors), wall,
+        (clock.time() - clock.start) / 60, args.speed))
+    print('{:<20} {:>6} {:>10} {:>10} {:>10}'.format('stage', 'count', 'mean ms', 'p95 ms', 'max ms'))
+    for name, values in log.stages():
+        values = values[np.isfinite(values)]
+        if len(values):
+            print('{:<20} {:>6} {:>10.1f} {:>10.1f} {:>10.1f}'.format(
+                name, len(values), values.mean(), np.percentile(values, 95), values.max()))
+        else:
+            print('{:<20} {:>6}'.format(name, 0))
+    moves = np.hypot(*np.array(telescope.corrections).T) if telescope.corrections else np.zeros(0)
+    print('corrections: {} after frames, {} between frames, mean move {:.2f}"'.format(
+        len(telescope.corrections) - log.between, log.between, moves.mean() if len(moves) else 0.0))
+    # The guider holds the field where it was in the first frame; the first two frames are its reference and its
+    # first measurement, before any correction
+    errors = np.array(camera.errors)
+    settled = errors[2:] - errors[0]
+    print('residual drift: RMS {:.3f}", max {:.3f}" (RA {:.3f}", Dec {:.3f}")'.format(
+        np.sqrt((settled ** 2).sum(axis=1).mean()), np.hypot(*settled.T).max(), *np.sqrt((settled ** 2).mean(axis=0))))
+    print('telemetry: {images} images, {failures} failed, {corrections} corrections, offset RMS {rms_separation:.2f} '
+          'px, iteration mean {mean_duration:.3f} s, max {max_duration:.3f} s'.format(**telemetry))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
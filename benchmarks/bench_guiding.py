@@ -0,0 +1,92 @@
+# Benchmark for measuring guiding drift: single guide star detection vs. phase correlation against a reference
+import _headless  # noqa: F401  (must come before omegalambda)
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import numpy as np
+from astropy.io import fits
+
+from omegalambda.main.common.util import frame_cache, image_registration
+from omegalambda.main.observing.guider import Guider
+
+
+def synthetic_frame(size, n_stars, shift=(0.0, 0.0), fwhm=5.0, seed=0, noise_seed=None):
+    """
+    The same star field for a given seed, moved by shift (dx, dy) pixels, with fresh noise for every noise_seed.
+    """
+    rng = np.random.default_rng(seed)
+    noise = np.random.default_rng(noise_seed)
+    sigma = fwhm / 2.3548
+    frame = noise.normal(1000, 15, (size, size)).astype(np.float32)
+    half = int(np.ceil(5 * sigma))
+    offsets = np.arange(-half, half + 1)
+    for x, y, amp in zip(rng.uniform(0, size, n_stars) + shift[0], rng.uniform(0, size, n_stars) + shift[1],
+                         rng.uniform(500, 30000, n_stars) * rng.uniform(0, 1, n_stars) ** 2):
+        rows = np.clip(int(y) + offsets, 0, size - 1)
+        cols = np.clip(int(x) + offsets, 0, size - 1)
+        frame[np.ix_(rows, cols)] += amp * np.exp(-((cols[None, :] - x) ** 2 + (rows[:, None] - y) ** 2) /
+                                                  (2 * sigma ** 2))
+    return np.clip(frame, 0, 65535).astype(np.uint16)
+
+
+def best_time(func, repeat):
+    times = []
+    result = None
+    for _ in range(repeat):
+        frame_cache.get_cache().clear()
+        t0 = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - t0)
+    return min(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time guiding drift measurement, star detection vs. phase correlation')
+    parser.add_argument('--size', type=int, default=4096, help='Frame side length in pixels')
+    parser.add_argument('--stars', type=int, nargs='+', default=[50, 500, 5000], help='Numbers of stars per frame')
+    parser.add_argument('--region', type=int, default=512, help='Side length of the phase correlation region')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    guider = Guider(None, None)
+    shift = (3.3, -1.8)
+    print('{:>6} {:>12} {:>12} {:>12} {:>12} {:>10} {:>10} {:>8} {:>10} {:>8}'.format(
+        'stars', 'acquire ms', 'subframe ms', 'phase ms', 'binned ms', 'star err', 'phase err', 'quality',
+        'binned err', 'quality'))
+    with tempfile.TemporaryDirectory() as directory:
+        for n_stars in args.stars:
+            paths = []
+            for i, offset in enumerate([(0.0, 0.0), shift]):
+                path = os.path.join(directory, 'frame-{}.fits'.format(i))
+                fits.writeto(path, synthetic_frame(args.size, n_stars, offset, noise_seed=i), overwrite=True)
+                paths.append(path)
+
+            # Current path: full-frame detection to pick the guide star, then a subframe detection every image
+            t_acquire, star = best_time(lambda: guider.find_guide_star(paths[0]), args.repeat)
+            star_error = np.nan
+            t_subframe = np.nan
+            if star is not None:
+                t_subframe, moved = best_time(lambda: guider.find_guide_star(paths[1], subframe=star), args.repeat)
+                if moved is not None:
+                    # Subframe positions are relative to the corner of the subframe
+                    x_0, y_0 = guider.subframe_position(*star)
+                    star_error = np.hypot(moved[0] - x_0 - shift[0], moved[1] - y_0 - shift[1])
+
+            reference = image_registration.PhaseReference(image_registration.read_region(paths[0], args.region))
+            t_phase, (dx, dy, quality) = best_time(
+                lambda: reference.offset(image_registration.read_region(paths[1], args.region)), args.repeat)
+            binned = image_registration.PhaseReference(image_registration.read_region(paths[0], None, 4))
+            t_binned, (bx, by, binned_quality) = best_time(
+                lambda: binned.offset(image_registration.read_region(paths[1], None, 4)), args.repeat)
+            phase_error = np.hypot(dx - shift[0], dy - shift[1])
+            binned_error = np.hypot(bx * 4 - shift[0], by * 4 - shift[1])
+            print('{:>6} {:>12.1f} {:>12.1f} {:>12.1f} {:>12.1f} {:>10.3f} {:>10.3f} {:>8.2f} {:>10.3f} {:>8.2f}'.format(
+                n_stars, t_acquire * 1000, t_subframe * 1000, t_phase * 1000, t_binned * 1000, star_error,
+                phase_error, quality, binned_error, binned_quality))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,85 @@
+# Benchmark for peak memory and time per frame of full-frame analysis: float64 copies vs. pooled float32 buffers
+import _headless  # noqa: F401  (must come before omegalambda)
+
+import time
+import resource
+import argparse
+import multiprocessing
+import numpy as np
+import photutils
+
+from omegalambda.main.common.util import filereader_utils
+
+
+def synthetic_frame(size, n_stars, seed=0):
+    rng = np.random.default_rng(seed)
+    frame = np.empty((size, size), dtype=np.uint16)
+    # Built in row blocks, so that generating the frame does not raise the peak RSS above that of the analysis
+    for start in range(0, size, 256):
+        frame[start:start + 256] = rng.normal(1000, 15, (min(256, size - start), size))
+    sigma = 5 / 2.3548
+    for x, y, amp in zip(rng.uniform(520, size - 520, n_stars), rng.uniform(520, size - 520, n_stars),
+                         rng.uniform(1000, 20000, n_stars)):
+        y0, x0 = int(y) - 20, int(x) - 20
+        yy, xx = np.mgrid[y0:y0 + 40, x0:x0 + 40]
+        star = frame[y0:y0 + 40, x0:x0 + 40] + amp * np.exp(-((xx - x) ** 2 + (yy - y) ** 2) / (2 * sigma ** 2))
+        frame[y0:y0 + 40, x0:x0 + 40] = np.clip(star, 0, 65535)
+    return frame
+
+
+def analyze_float64(image, median, threshold):
+    """
+    The previous pipeline: a fresh float64 squared residual for peak finding and a second float64 residual copy
+    for the fwhm stamps.
+    """
+    data = np.subtract(image, median, dtype=np.float64)
+    np.square(data, out=data)
+    photutils.find_peaks(data, threshold=threshold, box_size=50, border_width=500)
+    residual = image - median
+    return residual[0, 0]
+
+
+def analyze_float32(image, median, threshold):
+    stars = filereader_utils._detect_stars(image, median, 15, threshold, 40000, 500)
+    if len(stars):
+        stamps, valid = filereader_utils.extract_stamps(image, np.rint(stars.x), np.rint(stars.y), 30)
+        np.subtract(stamps, median, dtype=np.float32)
+    return stars
+
+
+def _worker(mode, size, frames, results):
+    image = synthetic_frame(size, 60)
+    mean, median, stdev = filereader_utils.background_stats(image, method='fast')
+    threshold = np.broadcast_to(np.float64(mean + 5 * stdev), image.shape)
+    func = analyze_float64 if mode == 'float64' else analyze_float32
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    t0 = time.perf_counter()
+    for _ in range(frames):
+        func(image, median, threshold)
+    elapsed = (time.perf_counter() - t0) / frames
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in KiB on Linux
+    results.put((mode, elapsed, (peak - baseline) / 1024, peak / 1024))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--size', type=int, nargs='+', default=[2048, 4096], help='Frame side lengths in pixels')
+    parser.add_argument('--frames', type=int, default=5, help='Number of frames analyzed per run')
+    args = parser.parse_args()
+
+    # Every run gets a fresh process so that peak RSS is not inherited from the previous run
+    context = multiprocessing.get_context('spawn')
+    print('{:>6} {:>8} {:>10} {:>16} {:>14}'.format('size', 'mode', 'ms/frame', 'analysis MiB', 'peak RSS MiB'))
+    for size in args.size:
+        for mode in ('float64', 'float32'):
+            results = context.Queue()
+            process = context.Process(target=_worker, args=(mode, size, args.frames, results))
+            process.start()
+            mode, elapsed, analysis, peak = results.get()
+            process.join()
+            print('{:>6} {:>8} {:>10.1f} {:>16.1f} {:>14.1f}'.format(size, mode, elapsed * 1000, analysis, peak))
+
+
+if __name__ == '__main__':
+    main()
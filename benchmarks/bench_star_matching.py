@@ -0,0 +1,74 @@
+# Benchmark for multi-star guiding: matching star lists against a reference with StarReference.offset
+import _headless  # noqa: F401  (must come before omegalambda)
+
+import sys
+import time
+import argparse
+import numpy as np
+
+from omegalambda.main.common.datatype.star_list import StarList
+from omegalambda.main.common.util import image_registration
+
+
+def star_lists(n_stars, size, shift, rotation, missing, outliers, jitter, seed=0):
+    """
+    A reference star list, and the same stars rotated by rotation (radians) around the center of the frame, moved
+    by shift, measured with jitter pixels of noise, with a fraction of them missing and a fraction replaced by stars
+    that are somewhere else entirely (i.e. cosmic rays or stars that only showed up in the new frame).
+    """
+    rng = np.random.default_rng(seed)
+    x, y = rng.uniform(0, size, (2, n_stars))
+    peak = rng.uniform(500, 30000, n_stars)
+    reference = StarList.from_arrays(x, y, peak)
+    cos, sin = np.cos(rotation), np.sin(rotation)
+    center = size / 2
+    moved_x = cos * (x - center) - sin * (y - center) + center + shift[0] + rng.normal(0, jitter, n_stars)
+    moved_y = sin * (x - center) + cos * (y - center) + center + shift[1] + rng.normal(0, jitter, n_stars)
+    wrong = rng.uniform(0, 1, n_stars) < outliers
+    moved_x[wrong], moved_y[wrong] = rng.uniform(0, size, (2, wrong.sum()))
+    keep = rng.uniform(0, 1, n_stars) >= missing
+    return reference, StarList.from_arrays(moved_x[keep], moved_y[keep], peak[keep])
+
+
+def best_time(func, repeat):
+    times = []
+    result = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - t0)
+    return min(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time multi-star matching against a reference star list')
+    parser.add_argument('--size', type=int, default=4096, help='Frame side length in pixels')
+    parser.add_argument('--stars', type=int, nargs='+', default=[20, 200, 2000, 10000],
+                        help='Numbers of stars per frame')
+    parser.add_argument('--max-shift', type=float, default=64, help='Largest shift searched for in pixels')
+    parser.add_argument('--missing', type=float, default=0.1, help='Fraction of stars missing from the new frame')
+    parser.add_argument('--outliers', type=float, default=0.05, help='Fraction of stars moved to random positions')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    shift = (13.7, -21.2)
+    rotation = np.radians(0.05)
+    print('{:>6} {:>12} {:>12} {:>9} {:>10} {:>12}'.format(
+        'stars', 'reference ms', 'offset ms', 'matched', 'shift err', 'rot err deg'))
+    for n_stars in args.stars:
+        reference_stars, stars = star_lists(n_stars, args.size, shift, rotation, args.missing, args.outliers, 0.05)
+        t_reference, reference = best_time(
+            lambda: image_registration.StarReference(reference_stars, args.max_shift), args.repeat)
+        t_offset, (dx, dy, fit_rotation, n_matched) = best_time(lambda: reference.offset(stars), args.repeat)
+        # The fit gives the shift at the center of the reference stars, not at the center of the frame
+        center = reference.center - args.size / 2
+        cos, sin = np.cos(rotation), np.sin(rotation)
+        expected = (cos * center[0] - sin * center[1] - center[0] + shift[0],
+                    sin * center[0] + cos * center[1] - center[1] + shift[1])
+        print('{:>6} {:>12.2f} {:>12.2f} {:>9} {:>10.3f} {:>12.5f}'.format(
+            n_stars, t_reference * 1000, t_offset * 1000, n_matched,
+            np.hypot(dx - expected[0], dy - expected[1]), np.degrees(abs(fit_rotation - rotation))))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
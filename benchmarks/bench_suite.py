@@ -0,0 +1,224 @@
+# Benchmark suite for the image analysis hot paths: filereader_utils and guider star selection.
+#
+# Generates synthetic frames over a grid of sizes, star densities, seeing values, and saturation levels, then
+# times mediancounts, findstars (full frame and subframe), radial_average, and Guider.find_guide_star on each,
+# recording wall time, peak memory, and accuracy against the known ground truth.  Results are written as JSON;
+# pass a previous result file with --compare to print the speedup of every entry.
+#
+#   python benchmarks/bench_suite.py --output before.json
+#   python benchmarks/bench_suite.py --output after.json --compare before.json
+import _headless  # noqa: F401  (must come before omegalambda)
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import itertools
+import tempfile
+import tracemalloc
+import subprocess
+import numpy as np
+from astropy.io import fits
+
+import omegalambda
+from omegalambda.main.common.IO import config_reader
+from omegalambda.main.common.util import filereader_utils, frame_cache
+from omegalambda.main.observing.guider import Guider
+
+SKY = 1000
+READ_NOISE = 10
+# Maximum distance in pixels between a detection and a true star for the two to match
+MATCH_RADIUS = 2.0
+
+
+def synthetic_frame(size, density, seeing, saturation_level, plate_scale, saturation, seed=0):
+    """
+    A MaxIm-like unsigned 16-bit frame: flat sky with Poisson and read noise, Gaussian stars, a sprinkling of hot
+    pixels, and clipping at the ADC limit.
+
+    density is in stars per million pixels, seeing is the FWHM in arcseconds, and saturation_level is the
+    brightest star's peak as a multiple of the configured saturation count.  Returns the frame and a structured
+    array with the true x, y, peak (above sky), and whether the star is saturated.
+    """
+    rng = np.random.default_rng(seed)
+    n_stars = max(int(density * size ** 2 / 1e6), 1)
+    fwhm = seeing / plate_scale
+    sigma = fwhm / 2.3548
+    frame = np.empty((size, size), dtype=np.float32)
+    for start in range(0, size, 256):
+        rows = min(256, size - start)
+        frame[start:start + 256] = rng.poisson(SKY, (rows, size)) + rng.normal(0, READ_NOISE, (rows, size))
+
+    truth = np.zeros(n_stars, dtype=[('x', float), ('y', float), ('peak', float), ('saturated', bool)])
+    truth['x'] = rng.uniform(25, size - 25, n_stars)
+    truth['y'] = rng.uniform(25, size - 25, n_stars)
+    # Power-law brightness distribution: many faint stars, few bright ones
+    truth['peak'] = saturation * saturation_level * rng.uniform(0.02, 1, n_stars) ** 2
+    truth['saturated'] = truth['peak'] + SKY >= saturation
+    half = int(np.ceil(5 * sigma))
+    offsets = np.arange(-half, half + 1)
+    for x, y, peak in zip(truth['x'], truth['y'], truth['peak']):
+        rows = np.clip(int(y) + offsets, 0, size - 1)
+        cols = np.clip(int(x) + offsets, 0, size - 1)
+        profile = peak * np.exp(-((cols[None, :] - x) ** 2 + (rows[:, None] - y) ** 2) / (2 * sigma ** 2))
+        frame[np.ix_(rows, cols)] += rng.poisson(profile)
+
+    n_hot = size ** 2 // 50000
+    frame[rng.integers(0, size, n_hot), rng.integers(0, size, n_hot)] = rng.uniform(5000, 65535, n_hot)
+    return np.clip(frame, 0, 65535).astype(np.uint16), truth, fwhm
+
+
+def match(x, y, truth):
+    """
+    Index of the nearest true star for every detection, or -1 if there is none within MATCH_RADIUS.
+    """
+    if len(x) == 0:
+        return np.zeros(0, dtype=int)
+    distance = np.hypot(np.asarray(x)[:, None] - truth['x'][None, :], np.asarray(y)[:, None] - truth['y'][None, :])
+    nearest = distance.argmin(axis=1)
+    nearest[distance[np.arange(len(x)), nearest] > MATCH_RADIUS] = -1
+    return nearest
+
+
+def measure(func, repeat):
+    """
+    Runs func cold (with an empty frame cache) repeat times for timing, then once more under tracemalloc for the
+    peak memory.  Returns the timings, the peak memory in MiB, and the result of the last call.
+    """
+    times = []
+    result = None
+    for _ in range(repeat):
+        frame_cache.get_cache().clear()
+        t0 = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - t0)
+    frame_cache.get_cache().clear()
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    frame_cache.get_cache().clear()
+    return {'min_s': min(times), 'median_s': float(np.median(times)), 'peak_mib': peak / 1024 ** 2}, result
+
+
+def run_scenario(path, truth, fwhm, size, guider, config, repeat):
+    saturation = config.saturation
+    results = {}
+    inner = (truth['x'] >= 500) & (truth['x'] < size - 500) & (truth['y'] >= 500) & (truth['y'] < size - 500)
+    # Stars that findstars is expected to report: away from the 500 px border, unsaturated, and well above the noise
+    detectable = inner & ~truth['saturated'] & (truth['peak'] > 10 * np.sqrt(SKY + READ_NOISE ** 2))
+
+    timing, median = measure(lambda: filereader_utils.mediancounts(path), repeat)
+    results['mediancounts'] = dict(timing, error_counts=abs(float(median) - SKY))
+
+    timing, stars = measure(lambda: filereader_utils.findstars(path, saturation), repeat)
+    x, y = stars.x.astype(float), stars.y.astype(float)
+    matched = match(x, y, truth)
+    good = matched >= 0
+    results['findstars'] = dict(timing, n_detected=len(stars), n_detectable=int(detectable.sum()),
+                                completeness=(float(np.isin(np.flatnonzero(detectable), matched).mean())
+                                              if detectable.any() else None),
+                                purity=float(good.mean()) if len(stars) else None,
+                                median_position_error_px=(float(np.median(np.hypot(
+                                    x[good] - truth['x'][matched[good]], y[good] - truth['y'][matched[good]])))
+                                    if good.any() else None))
+
+    if detectable.any():
+        target = np.flatnonzero(detectable)[np.argmax(truth['peak'][detectable])]
+        subframe = (int(truth['x'][target]), int(truth['y'][target]))
+        r = config.guider_max_move / config.plate_scale * 1.5
+        timing, stars = measure(lambda: filereader_utils.findstars(path, saturation, subframe=subframe), repeat)
+        if len(stars):
+            # Subframe positions are relative to the corner of the subframe
+            x, y = stars.x + int(subframe[0] - r), stars.y + int(subframe[1] - r)
+            error = np.hypot(x - truth['x'][target], y - truth['y'][target]).min()
+        else:
+            error = None
+        results['findstars_subframe'] = dict(timing, n_detected=len(stars),
+                                             position_error_px=None if error is None else float(error))
+
+    timing, (fwhm_measured, peak, saturated) = measure(lambda: filereader_utils.radial_average(path, saturation),
+                                                       repeat)
+    results['radial_average'] = dict(timing, fwhm_px=fwhm_measured, true_fwhm_px=fwhm,
+                                     relative_error=(abs(fwhm_measured - fwhm) / fwhm
+                                                     if fwhm_measured is not None else None))
+
+    timing, star = measure(lambda: guider.find_guide_star(path), repeat)
+    valid = None
+    if star is not None:
+        index = match([star[0]], [star[1]], truth)[0]
+        valid = bool(index >= 0 and not truth['saturated'][index])
+    results['find_guide_star'] = dict(timing, found=star is not None, valid_star=valid)
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as file:
+        baseline = {(r['scenario']['name'], r['function']): r for r in json.load(file)['results']}
+    print('\n{:<36} {:<20} {:>10} {:>10} {:>8}'.format('scenario', 'function', 'base ms', 'now ms', 'speedup'))
+    for r in results:
+        old = baseline.get((r['scenario']['name'], r['function']))
+        if old is None:
+            continue
+        print('{:<36} {:<20} {:>10.1f} {:>10.1f} {:>8.2f}'.format(
+            r['scenario']['name'], r['function'], old['min_s'] * 1000, r['min_s'] * 1000,
+            old['min_s'] / r['min_s']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark suite for filereader_utils and guider star selection')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[2048, 4096], help='Frame side lengths in pixels')
+    parser.add_argument('--densities', type=float, nargs='+', default=[10, 50], help='Stars per million pixels')
+    parser.add_argument('--seeing', type=float, nargs='+', default=[1.5, 3.0], help='Seeing FWHM in arcseconds')
+    parser.add_argument('--saturation-levels', type=float, nargs='+', default=[0.8, 2.5],
+                        help='Peak of the brightest star as a multiple of the configured saturation count')
+    parser.add_argument('--repeat', type=int, default=3, help='Cold runs per measurement')
+    parser.add_argument('--quick', action='store_true', help='Only the smallest value of every parameter')
+    parser.add_argument('--output', default='bench_suite.json', help='Path of the JSON result file')
+    parser.add_argument('--compare', help='Previous JSON result file to compare against')
+    args = parser.parse_args()
+    if args.quick:
+        args.sizes, args.densities, args.seeing, args.saturation_levels = (
+            [min(args.sizes)], [min(args.densities)], [min(args.seeing)], [min(args.saturation_levels)])
+
+    config = config_reader.get_config()
+    guider = Guider(None, None)
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for size, density, seeing, level in itertools.product(args.sizes, args.densities, args.seeing,
+                                                              args.saturation_levels):
+            name = '{}px-{:g}stars-{:g}as-sat{:g}'.format(size, density, seeing, level)
+            image, truth, fwhm = synthetic_frame(size, density, seeing, level, config.plate_scale, config.saturation)
+            path = os.path.join(directory, name + '.fits')
+            fits.writeto(path, image)
+            scenario = {'name': name, 'size': size, 'density': density, 'seeing_arcsec': seeing,
+                        'saturation_level': level, 'n_stars': len(truth), 'n_saturated': int(truth['saturated'].sum())}
+            for function, entry in run_scenario(path, truth, fwhm, size, guider, config, args.repeat).items():
+                results.append(dict(entry, scenario=scenario, function=function))
+                print('{:<36} {:<20} {:>9.1f} ms {:>8.1f} MiB'.format(name, function, entry['min_s'] * 1000,
+                                                                      entry['peak_mib']))
+            os.remove(path)
+
+    meta = {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'), 'git_revision': git_revision(),
+            'omegalambda': omegalambda.__version__, 'python': platform.python_version(), 'numpy': np.__version__,
+            'platform': platform.platform(), 'background_estimator': config.background_estimator,
+            'star_detection': config.star_detection, 'arguments': vars(args)}
+    with open(args.output, 'w') as file:
+        json.dump({'meta': meta, 'results': results}, file, indent=2)
+    print('Results written to {}'.format(args.output))
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
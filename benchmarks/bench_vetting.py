@@ -0,0 +1,75 @@
+# Benchmark for the star candidate vetting stage of filereader_utils.findstars
+import _headless  # noqa: F401  (must come before omegalambda)
+
+import time
+import argparse
+import numpy as np
+
+from omegalambda.main.common.util import filereader_utils
+
+
+def vet_candidates_loop(image, x_peak, y_peak, median, saturation):
+    """
+    The per-star vetting loop that findstars used before vet_candidates, kept here as the reference.
+    """
+    stars = []
+    peaks = []
+    for x_cent, y_cent in zip(x_peak, y_peak):
+        bad_pixel = False
+        peak = image[y_cent, x_cent]
+        if peak >= (saturation * 2) ** 2:
+            bad_pixel = True
+        pixels = [(y_cent, x_cent + 1), (y_cent, x_cent - 1), (y_cent + 1, x_cent), (y_cent - 1, x_cent)]
+        for value in pixels:
+            if image[value[0], value[1]] < 1.2 * median:
+                bad_pixel = True
+        if bad_pixel:
+            continue
+        stars.append((x_cent, y_cent))
+        peaks.append(peak)
+    return stars, peaks
+
+
+def vet_candidates_vectorized(image, x_peak, y_peak, median, saturation):
+    good = filereader_utils.vet_candidates(image, x_peak, y_peak, median, saturation)
+    return list(zip(x_peak[good], y_peak[good])), list(image[y_peak[good], x_peak[good]])
+
+
+def best_time(func, *args, repeat=5):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func(*args)
+        times.append(time.perf_counter() - t0)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time findstars candidate vetting, loop vs. vectorized')
+    parser.add_argument('--size', type=int, default=4096, help='Side length of the synthetic frame in pixels')
+    parser.add_argument('--repeat', type=int, default=5, help='Number of timing repeats (best is reported)')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    median = 1000
+    saturation = 25000
+    image = rng.normal(median, 30, (args.size, args.size)).astype(np.uint16)
+    # Sprinkle hot pixels (dark neighbours) so both branches of the check are exercised
+    hot = rng.integers(1, args.size - 2, (2, 2000))
+    image[hot[0], hot[1]] = 0
+
+    print('{:>8s} {:>12s} {:>12s} {:>8s}'.format('N', 'loop [ms]', 'vector [ms]', 'speedup'))
+    for n in (100, 300, 1000, 3000, 10000):
+        x_peak = rng.integers(1, args.size - 1, n)
+        y_peak = rng.integers(1, args.size - 1, n)
+        x_peak[:n // 10] = hot[1, :n // 10] + 1
+        y_peak[:n // 10] = hot[0, :n // 10]
+        assert vet_candidates_loop(image, x_peak, y_peak, median, saturation) == \
+            vet_candidates_vectorized(image, x_peak, y_peak, median, saturation)
+        t_loop = best_time(vet_candidates_loop, image, x_peak, y_peak, median, saturation, repeat=args.repeat)
+        t_vec = best_time(vet_candidates_vectorized, image, x_peak, y_peak, median, saturation, repeat=args.repeat)
+        print('{:8d} {:12.3f} {:12.3f} {:7.1f}x'.format(n, t_loop * 1e3, t_vec * 1e3, t_loop / t_vec))
+
+
+if __name__ == '__main__':
+    main()
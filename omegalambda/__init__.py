@@ -1,6 +1,7 @@
 from .main.common.datatype.filter_wheel import *
 from .main.common.datatype.observation_ticket import *
 from .main.common.datatype.object_reader import *
+from .main.common.datatype.star_list import *
 from .main.common.IO.config_reader import *
 from .main.common.IO.json_reader import *
 from .main.common.util import time_utils as omtime
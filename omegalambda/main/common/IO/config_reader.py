@@ -24,7 +24,12 @@ class Config:
                  guiding_threshold: Optional[float] = None, guider_ra_dampening: Optional[float] = None,
                  guider_dec_dampening: Optional[float] = None, guider_max_move: Optional[float] = None,
                  guider_angle: Optional[float] = None, guider_flip_y: Optional[bool] = None, data_directory: Optional[str] = None,
-                 calibration_time: Optional[str] = None, calibration_num: Optional[int] = None):
+                 calibration_time: Optional[str] = None, calibration_num: Optional[int] = None,
+                 frame_cache_size: Optional[Union[int, float]] = None, background_estimator: Optional[str] = None,
+                 analysis_workers: Optional[int] = None, star_detection: Optional[str] = None,
+                 guider_mode: Optional[str] = None, guider_phase_region: Optional[int] = None,
+                 guider_phase_binning: Optional[int] = None, guider_prediction: Optional[bool] = None,
+                 guider_calibration: Optional[bool] = None):
         """
 
         Parameters
@@ -118,6 +123,49 @@ class Config:
             The number of darks and flats that should be taken per target.  Note that there will be one set of flats
             with this number of exposures, but two sets of darks, each with this number of exposures: one to match
             the flat exposure time and the other to match the science exposure time.  Our default is 10.
+        frame_cache_size : INT or FLOAT, optional
+            Memory budget in MB for caching decoded image data and analysis results, so that the guider, focuser,
+            and calibration modules do not re-read and re-analyze the same file.  Our default is 512 MB.
+        background_estimator : STR, optional
+            Which method to use for image background statistics (median counts of flats, star detection thresholds).
+            Can be str "exact" or "fast."  "exact" sigma-clips every pixel, while "fast" uses a strided subsample
+            and a histogram, trading sub-ADU accuracy for millisecond run times.  Our default is "fast".
+        analysis_workers : INT, optional
+            Number of worker processes used for star finding, fwhm measurement, and background statistics, so that
+            image analysis never stalls the hardware threads.  0 runs the analysis inline on the calling thread.
+            Our default is 2.
+        star_detection : STR, optional
+            How full frames are searched for stars.  Can be str "full" or "pyramid."  "full" runs peak finding on
+            every pixel, while "pyramid" finds candidates on a 4x4 block-summed image and refines them at full
+            resolution, which is five to ten times faster for focus frames and guide star acquisition.  The two
+            give the same stars on uncrowded fields, but where stars are closer together than the 50 px peak
+            separation "pyramid" can miss or add a few percent of them.  Our default is "full".
+        guider_mode : STR, optional
+            How the guider measures the drift between images.  Can be str "star", "multistar," or "phase."  "star"
+            tracks a single guide star found by star detection, "multistar" matches every isolated star in the image
+            to those of the first image and fits the shift of the whole field, so one star saturating or fading does
+            not interrupt guiding, while "phase" registers a region in the center of every image against the first
+            one with FFT phase correlation, which needs no individual stars and so keeps working on crowded or
+            defocused fields.  On sparse fields the central region may hold too few stars to register; the guider
+            then falls back to the whole frame, binned 4x4, and then to "star".  Our default is "star".
+        guider_phase_region : INT, optional
+            Side length in pixels of the central region registered by the "phase" guider mode, or 0 for the whole
+            frame.  Our default is 512.
+        guider_phase_binning : INT, optional
+            Binning factor applied to that region before it is registered.  Our default is 1.
+        guider_prediction : BOOL, optional
+            If True, the guider fits a model of the drift (a Kalman filter on the error, its rate, and how far the
+            mount actually moves for a correction) to every measured offset, and corrects for the drift it expects
+            every 10 seconds between images as well as after each one.  The RA and Dec dampening are then only the
+            starting guess for how the mount responds, which is learned from the corrections it makes.  Our default
+            is False.
+        guider_calibration : BOOL, optional
+            If True, the guider measures its own constants before it first guides (and again for targets more than
+            20 degrees in declination from the last calibration): it pulse guides a known distance on each axis and
+            stops tracking for a few seconds, and fits the star displacements for the guider angle, the y-axis flip,
+            the plate scale, and the guide rates the mount actually moves at.  These are saved in
+            guider_calibration.json in the data directory and used instead of guider_angle, guider_flip_y,
+            plate_scale, and the guide rates the mount reports.  Our default is False.
 
         Returns
         -------
@@ -159,6 +207,15 @@ class Config:
         self.data_directory = data_directory                     
         self.calibration_time = calibration_time
         self.calibration_num: int = calibration_num
+        self.frame_cache_size = frame_cache_size
+        self.background_estimator = background_estimator
+        self.analysis_workers = analysis_workers
+        self.star_detection = star_detection
+        self.guider_mode = guider_mode
+        self.guider_phase_region = guider_phase_region
+        self.guider_phase_binning = guider_phase_binning
+        self.guider_prediction = guider_prediction
+        self.guider_calibration = guider_calibration
         
     @staticmethod
     def deserialized(text: str):
@@ -224,7 +281,11 @@ def _dict_to_config_object(dic: Dict) -> Config:
                      guider_ra_dampening=dic['guider_ra_dampening'], guider_dec_dampening=dic['guider_dec_dampening'],
                      guider_max_move=dic['guider_max_move'], guider_angle=dic['guider_angle'], guider_flip_y=dic['guider_flip_y'],
                      data_directory=dic['data_directory'], calibration_time=dic['calibration_time'],
-                     calibration_num=dic['calibration_num'])
+                     calibration_num=dic['calibration_num'], frame_cache_size=dic['frame_cache_size'],
+                     background_estimator=dic['background_estimator'], analysis_workers=dic['analysis_workers'],
+                     star_detection=dic['star_detection'], guider_mode=dic['guider_mode'],
+                     guider_phase_region=dic['guider_phase_region'], guider_phase_binning=dic['guider_phase_binning'],
+                     guider_prediction=dic['guider_prediction'], guider_calibration=dic['guider_calibration'])
     logging.info('Global config object has been created')
     return _config
 
@@ -0,0 +1,257 @@
+import numpy as np
+from typing import Iterable, Optional, Tuple, Union
+
+from scipy.spatial import cKDTree
+
+# One record per star.  Positions are in pixels, with x before y so that star[0], star[1] still reads (x, y)
+STAR_DTYPE = np.dtype([('x', np.float32), ('y', np.float32), ('x_err', np.float32), ('y_err', np.float32),
+                       ('peak', np.float32), ('flux', np.float32), ('fwhm', np.float32),
+                       ('ellipticity', np.float32), ('angle', np.float32), ('flags', np.uint8)])
+
+# Bits of the flags field
+SATURATED = 1
+BAD_PIXEL = 2
+CROWDED = 4
+
+
+class StarList:
+
+    def __init__(self, data: Optional[np.ndarray] = None):
+        """
+        Description
+        -----------
+        A list of detected stars, backed by a single numpy structured array with the fields x, y, x_err, y_err,
+        peak, flux, fwhm, ellipticity, angle (position angle of the major axis in degrees), and flags (see
+        STAR_DTYPE).  Filtering, sorting, and neighbour queries work on whole columns at once instead of one star
+        at a time.
+
+        Parameters
+        ----------
+        data : NUMPY ARRAY, optional
+            Structured array with dtype STAR_DTYPE.  The default is None, for an empty list.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.data: np.ndarray = np.zeros(0, dtype=STAR_DTYPE) if data is None else np.asarray(data, dtype=STAR_DTYPE)
+        self._tree = None
+
+    @classmethod
+    def from_arrays(cls, x: Iterable[float], y: Iterable[float], peak: Optional[Iterable[float]] = None,
+                    **fields) -> 'StarList':
+        """
+        Parameters
+        ----------
+        x : LIST or NUMPY ARRAY
+            x positions of the stars.
+        y : LIST or NUMPY ARRAY
+            y positions of the stars.
+        peak : LIST or NUMPY ARRAY, optional
+            Peak counts of the stars.  The default is None, which leaves them at 0.
+        **fields : NUMPY ARRAY
+            Any other field of STAR_DTYPE.  fwhm, ellipticity, and angle default to NaN, everything else to 0.
+
+        Returns
+        -------
+        StarList
+            New list with one star per position.
+
+        """
+        x = np.asarray(x, dtype=float).reshape(-1)
+        data = np.zeros(len(x), dtype=STAR_DTYPE)
+        data['fwhm'] = np.nan
+        data['ellipticity'] = np.nan
+        data['angle'] = np.nan
+        data['x'] = x
+        data['y'] = np.asarray(y, dtype=float).reshape(-1)
+        if peak is not None:
+            data['peak'] = peak
+        for name, values in fields.items():
+            data[name] = values
+        return cls(data)
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __getitem__(self, index):
+        """
+        An integer returns a single record (star[0] is x and star[1] is y, like the old (x, y) tuples); a field
+        name returns that column; slices, index arrays, and boolean masks return a new StarList.
+        """
+        if isinstance(index, str):
+            return self.data[index]
+        if isinstance(index, (int, np.integer)):
+            return self.data[index]
+        return StarList(self.data[index])
+
+    def __repr__(self) -> str:
+        return 'StarList({} stars)'.format(len(self))
+
+    @property
+    def x(self) -> np.ndarray:
+        return self.data['x']
+
+    @property
+    def y(self) -> np.ndarray:
+        return self.data['y']
+
+    @property
+    def peak(self) -> np.ndarray:
+        return self.data['peak']
+
+    @property
+    def flux(self) -> np.ndarray:
+        return self.data['flux']
+
+    @property
+    def fwhm(self) -> np.ndarray:
+        return self.data['fwhm']
+
+    @property
+    def ellipticity(self) -> np.ndarray:
+        return self.data['ellipticity']
+
+    @property
+    def angle(self) -> np.ndarray:
+        return self.data['angle']
+
+    @property
+    def flags(self) -> np.ndarray:
+        return self.data['flags']
+
+    @property
+    def positions(self) -> np.ndarray:
+        """
+        Returns
+        -------
+        NUMPY ARRAY
+            Array of shape (number of stars, 2) with the (x, y) position of every star.
+
+        """
+        return np.column_stack((self.data['x'], self.data['y'])).astype(float)
+
+    @property
+    def nbytes(self) -> int:
+        return self.data.nbytes
+
+    def copy(self) -> 'StarList':
+        return StarList(self.data.copy())
+
+    def filter(self, mask: np.ndarray) -> 'StarList':
+        """
+        Parameters
+        ----------
+        mask : NUMPY ARRAY
+            Boolean array with one entry per star.
+
+        Returns
+        -------
+        StarList
+            The stars for which mask is True.
+
+        """
+        return StarList(self.data[np.asarray(mask, dtype=bool)])
+
+    def without_flags(self, flags: int) -> 'StarList':
+        """
+        Parameters
+        ----------
+        flags : INT
+            Bitwise OR of the flags to reject, i.e. SATURATED | CROWDED.
+
+        Returns
+        -------
+        StarList
+            The stars that have none of the given flags set.
+
+        """
+        return self.filter((self.data['flags'] & flags) == 0)
+
+    def sort(self, field: str = 'peak', descending: bool = True) -> 'StarList':
+        """
+        Parameters
+        ----------
+        field : STR, optional
+            Field to sort by.  The default is 'peak'.
+        descending : BOOL, optional
+            Whether or not to put the largest values first.  The default is True.
+
+        Returns
+        -------
+        StarList
+            A sorted copy of the list.
+
+        """
+        order = np.argsort(self.data[field], kind='stable')
+        return StarList(self.data[order[::-1] if descending else order])
+
+    def _kdtree(self) -> cKDTree:
+        if self._tree is None:
+            self._tree = cKDTree(self.positions)
+        return self._tree
+
+    def nearest(self, x: Union[int, float], y: Union[int, float]) -> Tuple[Optional[int], float]:
+        """
+        Parameters
+        ----------
+        x : INT or FLOAT
+            x coordinate of the query point.
+        y : INT or FLOAT
+            y coordinate of the query point.
+
+        Returns
+        -------
+        TUPLE
+            Index of the star closest to (x, y) and its distance, or (None, inf) if the list is empty.
+
+        """
+        if len(self) == 0:
+            return None, np.inf
+        distance, index = self._kdtree().query((x, y))
+        return int(index), float(distance)
+
+    def neighbour_distances(self) -> np.ndarray:
+        """
+        Returns
+        -------
+        NUMPY ARRAY
+            Distance from every star to its nearest other star, inf for a star with no neighbours.
+
+        """
+        if len(self) < 2:
+            return np.full(len(self), np.inf)
+        distance, _ = self._kdtree().query(self.positions, k=2)
+        return distance[:, 1]
+
+    def flag_crowded(self, min_separation: Union[int, float]):
+        """
+        Description
+        -----------
+        Sets the CROWDED flag on every star that has another star closer than min_separation.
+
+        Parameters
+        ----------
+        min_separation : INT or FLOAT
+            Minimum distance in pixels to the nearest neighbour.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.data['flags'][self.neighbour_distances() < min_separation] |= CROWDED
+
+    def to_list(self) -> list:
+        """
+        Returns
+        -------
+        LIST
+            The positions as a list of (x, y) tuples.
+
+        """
+        return [(float(x), float(y)) for x, y in zip(self.data['x'], self.data['y'])]
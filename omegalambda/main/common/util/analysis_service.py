@@ -0,0 +1,263 @@
+# Process pool for image analysis, decoupled from the hardware threads
+import logging
+import threading
+import concurrent.futures
+import numpy as np
+from typing import Optional, Tuple, Union
+
+from ..IO import config_reader
+from . import filereader_utils
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def _init_worker(config):
+    """
+    Description
+    -----------
+    Runs once in every worker process.  Installs the parent's config object, since a spawned worker would
+    otherwise only see the default parameters_config.json that is read on import, and clears the service
+    reference that a forked worker inherits, so that the worker runs the analysis inline instead of resubmitting it.
+
+    Parameters
+    ----------
+    config : CLASS INSTANCE OBJECT of Config
+        The global config object of the parent process.
+
+    Returns
+    -------
+    None.
+
+    """
+    global _service
+    _service = None
+    config_reader._config = config
+
+
+class AnalysisService:
+
+    def __init__(self, max_workers: Optional[int] = None):
+        """
+        Description
+        -----------
+        Runs star finding, FWHM measurement, and background statistics in separate processes so that heavy
+        numpy/scipy/photutils work never holds the GIL of the process running the hardware threads.
+        Every request returns a concurrent.futures.Future.
+
+        Parameters
+        ----------
+        max_workers : INT, optional
+            Number of worker processes.  The default is None, which uses the analysis_workers config parameter.
+            Each worker keeps its own frame analysis cache.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.max_workers = max_workers if max_workers is not None else config_reader.get_config().analysis_workers
+        self._executor: Optional[concurrent.futures.ProcessPoolExecutor] = None
+
+    @property
+    def running(self) -> bool:
+        return self._executor is not None
+
+    def start(self):
+        """
+        Description
+        -----------
+        Starts the worker processes.
+
+        Returns
+        -------
+        None.
+
+        """
+        if self._executor is None:
+            self._executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.max_workers,
+                                                                    initializer=_init_worker,
+                                                                    initargs=(config_reader.get_config(),))
+            logging.info('Analysis service started with {} worker processes'.format(self.max_workers))
+
+    def stop(self, wait: bool = True):
+        """
+        Description
+        -----------
+        Shuts down the worker processes.
+
+        Parameters
+        ----------
+        wait : BOOL, optional
+            Whether or not to wait for running requests to finish.  The default is True.
+
+        Returns
+        -------
+        None.
+
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+            logging.info('Analysis service stopped')
+
+    def _submit(self, function, *args, **kwargs) -> concurrent.futures.Future:
+        if self._executor is None:
+            raise RuntimeError('The analysis service has not been started')
+        return self._executor.submit(function, *args, **kwargs)
+
+    def findstars(self, frame: Union[str, np.ndarray], saturation: Union[int, float],
+                  subframe: Optional[Tuple[int]] = None, detection: Optional[str] = None) -> concurrent.futures.Future:
+        """
+        Parameters
+        ----------
+        frame : STR or NUMPY ARRAY
+            Path to a fits image file, or the image data itself.
+        saturation : INT or FLOAT
+            Number of counts for a star to be considered saturated for a specific CCD Camera.
+        subframe : TUPLE, optional
+            x and y coordinate of the star to create a subframe around.  The default is None.
+        detection : STR, optional
+            Full-frame detection mode, "full" or "pyramid".  The default is None, which uses the star_detection
+            config parameter.
+
+        Returns
+        -------
+        FUTURE
+            Resolves to the StarList from filereader_utils.findstars.
+
+        """
+        return self._submit(filereader_utils.findstars, frame, saturation, subframe=subframe, detection=detection)
+
+    def radial_average(self, frame: Union[str, np.ndarray],
+                       saturation: Union[int, float]) -> concurrent.futures.Future:
+        """
+        Parameters
+        ----------
+        frame : STR or NUMPY ARRAY
+            Path to a fits image file, or the image data itself.
+        saturation : INT or FLOAT
+            Number of counts for a star to be considered saturated for a specific CCD Camera.
+
+        Returns
+        -------
+        FUTURE
+            Resolves to the (fwhm, peak, saturated) tuple from filereader_utils.radial_average.
+
+        """
+        return self._submit(filereader_utils.radial_average, frame, saturation)
+
+    def mediancounts(self, frame: Union[str, np.ndarray], method: Optional[str] = None) -> concurrent.futures.Future:
+        """
+        Parameters
+        ----------
+        frame : STR or NUMPY ARRAY
+            Path to a fits image file, or the image data itself.
+        method : STR, optional
+            Background estimator to use, "exact" or "fast".  The default is None, which uses the
+            background_estimator config parameter.
+
+        Returns
+        -------
+        FUTURE
+            Resolves to the median counts from filereader_utils.mediancounts.
+
+        """
+        return self._submit(filereader_utils.mediancounts, frame, method=method)
+
+    def frame_shape(self, frame: Union[str, np.ndarray], saturation: Union[int, float]) -> concurrent.futures.Future:
+        """
+        Parameters
+        ----------
+        frame : STR or NUMPY ARRAY
+            Path to a fits image file, or the image data itself.
+        saturation : INT or FLOAT
+            Number of counts for a star to be considered saturated for a specific CCD Camera.
+
+        Returns
+        -------
+        FUTURE
+            Resolves to the (ellipticity, angle, number of stars) tuple from filereader_utils.frame_shape.
+
+        """
+        return self._submit(filereader_utils.frame_shape, frame, saturation)
+
+    def background_stats(self, frame: Union[str, np.ndarray],
+                         method: Optional[str] = None) -> concurrent.futures.Future:
+        """
+        Parameters
+        ----------
+        frame : STR or NUMPY ARRAY
+            Path to a fits image file, or the image data itself.
+        method : STR, optional
+            Background estimator to use, "exact" or "fast".  The default is None, which uses the
+            background_estimator config parameter.
+
+        Returns
+        -------
+        FUTURE
+            Resolves to the (mean, median, standard deviation) tuple from filereader_utils.frame_stats.
+
+        """
+        return self._submit(_frame_stats, frame, method=method)
+
+
+def _frame_stats(frame, method=None):
+    return filereader_utils.frame_stats(frame, filereader_utils.read_frame(frame), method=method)
+
+
+def get_service() -> Optional[AnalysisService]:
+    """
+    Returns
+    -------
+    _service : CLASS INSTANCE OBJECT of AnalysisService or None
+        The running analysis service of this process, or None if analysis should run inline (i.e. inside the
+        worker processes themselves, or if the service was never started).
+
+    """
+    return _service
+
+
+def start_service(max_workers: Optional[int] = None) -> Optional[AnalysisService]:
+    """
+    Description
+    -----------
+    Starts the process-wide analysis service, unless the number of workers is 0.
+
+    Parameters
+    ----------
+    max_workers : INT, optional
+        Number of worker processes.  The default is None, which uses the analysis_workers config parameter.
+
+    Returns
+    -------
+    _service : CLASS INSTANCE OBJECT of AnalysisService or None
+        The running service, or None if it is disabled.
+
+    """
+    global _service
+    with _service_lock:
+        if _service is None:
+            service = AnalysisService(max_workers)
+            if service.max_workers:
+                service.start()
+                _service = service
+    return _service
+
+
+def stop_service():
+    """
+    Description
+    -----------
+    Stops the process-wide analysis service, after which analysis runs inline again.
+
+    Returns
+    -------
+    None.
+
+    """
+    global _service
+    with _service_lock:
+        if _service is not None:
+            _service.stop()
+            _service = None
@@ -0,0 +1,341 @@
+# Per-camera hot/bad pixel masks built from dark frames
+import os
+import logging
+import threading
+import numpy as np
+from typing import Dict, Iterable, Optional, Tuple
+
+from astropy.io import fits
+
+from ..IO import config_reader
+from . import fits_scanner
+
+# Width of the temperature bins in degrees C
+TEMPERATURE_BIN = 5
+# Rows of the dark frames that are median-combined at a time, to bound memory use
+COMBINE_BLOCK_ROWS = 256
+
+_map = None
+_map_lock = threading.Lock()
+
+
+def temperature_bin(temperature: Optional[float]) -> int:
+    """
+    Parameters
+    ----------
+    temperature : FLOAT or None
+        CCD temperature in degrees C, or None if unknown.
+
+    Returns
+    -------
+    INT
+        Temperature rounded to the nearest multiple of TEMPERATURE_BIN.  Unknown temperatures fall in bin 0.
+
+    """
+    if temperature is None:
+        return 0
+    return int(round(temperature / TEMPERATURE_BIN)) * TEMPERATURE_BIN
+
+
+def exposure_bin(exposure: float) -> int:
+    """
+    Parameters
+    ----------
+    exposure : FLOAT
+        Exposure time in seconds.
+
+    Returns
+    -------
+    INT
+        Smallest power of two (in seconds, at least 1) that is greater than or equal to the exposure time.
+
+    """
+    return int(2 ** np.ceil(np.log2(max(exposure, 1))))
+
+
+def frame_conditions(header: fits.Header) -> Tuple[Optional[float], Optional[float]]:
+    """
+    Parameters
+    ----------
+    header : ASTROPY FITS HEADER
+        Header of an image saved by MaxIm DL.
+
+    Returns
+    -------
+    TUPLE
+        (CCD temperature, exposure time) of the image, either of which is None if it is not in the header.
+
+    """
+    temperature = header.get('CCD-TEMP')
+    exposure = header.get('EXPTIME', header.get('EXPOSURE'))
+    return temperature, exposure
+
+
+def master_dark(paths: Iterable[str]) -> np.ndarray:
+    """
+    Description
+    -----------
+    Median-combines dark frames, a block of rows at a time, so that only COMBINE_BLOCK_ROWS rows of every frame
+    are in memory at once.
+
+    Parameters
+    ----------
+    paths : LIST
+        Paths to dark frames of the same size.
+
+    Returns
+    -------
+    master : NUMPY ARRAY
+        Median of the dark frames, as float32.
+
+    """
+    hduls = [fits.open(path) for path in paths]
+    try:
+        ny, nx = hduls[0][0].shape
+        master = np.empty((ny, nx), dtype=np.float32)
+        for start in range(0, ny, COMBINE_BLOCK_ROWS):
+            stop = min(start + COMBINE_BLOCK_ROWS, ny)
+            block = np.stack([hdul[0].section[start:stop, :] for hdul in hduls])
+            master[start:stop] = np.median(block, axis=0)
+    finally:
+        for hdul in hduls:
+            hdul.close()
+    return master
+
+
+def hot_pixels(master: np.ndarray, nsigma: float = 5) -> np.ndarray:
+    """
+    Parameters
+    ----------
+    master : NUMPY ARRAY
+        Master dark frame.
+    nsigma : FLOAT, optional
+        Number of robust standard deviations (1.4826 x the median absolute deviation) above the median at which a
+        pixel is flagged.  The default is 5.
+
+    Returns
+    -------
+    NUMPY ARRAY
+        Boolean mask that is True for every hot pixel.
+
+    """
+    sample = master[::4, ::4]
+    median = np.median(sample)
+    stdev = 1.4826 * np.median(np.abs(sample - median))
+    return master > median + nsigma * max(stdev, 1)
+
+
+class BadPixelMap:
+
+    def __init__(self, path: str):
+        """
+        Description
+        -----------
+        The hot/bad pixel masks of a camera, one per (temperature bin, exposure bin), since the number of hot pixels
+        grows with both.  Masks are stored bit-packed in a single .npz file, so a full 4k x 4k mask takes 2 MB
+        on disk and in memory, and is only unpacked for the bins that are actually used.
+
+        Parameters
+        ----------
+        path : STR
+            Path to the .npz file the masks are loaded from and saved to.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.path = path
+        self.mtime = None
+        self._packed: Dict[Tuple[int, int], Tuple[np.ndarray, Tuple[int, int]]] = {}
+        self._unpacked: Dict[Tuple[int, int], np.ndarray] = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            self.load()
+
+    def load(self):
+        """
+        Description
+        -----------
+        (Re)loads all masks from disk.
+
+        Returns
+        -------
+        None.
+
+        """
+        with self._lock, np.load(self.path) as archive:
+            self._packed = {}
+            self._unpacked = {}
+            for name in archive.files:
+                if not name.startswith('mask_'):
+                    continue
+                temperature, exposure = (int(value) for value in name[len('mask_'):].split('_'))
+                self._packed[(temperature, exposure)] = (archive[name],
+                                                         tuple(archive['shape_' + name[len('mask_'):]]))
+            self.mtime = os.path.getmtime(self.path)
+        logging.debug('Loaded {} bad pixel masks from {}'.format(len(self._packed), self.path))
+
+    def save(self):
+        """
+        Description
+        -----------
+        Writes all masks to disk.  The file is replaced atomically, so readers in other processes never see a
+        partially written map.
+
+        Returns
+        -------
+        None.
+
+        """
+        arrays = {}
+        with self._lock:
+            for (temperature, exposure), (packed, shape) in self._packed.items():
+                suffix = '{}_{}'.format(temperature, exposure)
+                arrays['mask_' + suffix] = packed
+                arrays['shape_' + suffix] = np.array(shape)
+        temporary = self.path + '.tmp.npz'
+        np.savez_compressed(temporary, **arrays)
+        os.replace(temporary, self.path)
+        self.mtime = os.path.getmtime(self.path)
+        logging.info('Bad pixel map saved to {}'.format(self.path))
+
+    def add(self, mask: np.ndarray, temperature: Optional[float], exposure: float):
+        """
+        Parameters
+        ----------
+        mask : NUMPY ARRAY
+            Boolean mask that is True for every bad pixel.
+        temperature : FLOAT or None
+            CCD temperature of the darks the mask was built from.
+        exposure : FLOAT
+            Exposure time of the darks the mask was built from.
+
+        Returns
+        -------
+        None.
+
+        """
+        key = (temperature_bin(temperature), exposure_bin(exposure))
+        with self._lock:
+            self._packed[key] = (np.packbits(mask, axis=None), mask.shape)
+            self._unpacked.pop(key, None)
+        logging.info('Bad pixel mask for {} C, {} s: {} bad pixels'.format(key[0], key[1], int(mask.sum())))
+
+    def lookup(self, temperature: Optional[float], exposure: Optional[float],
+               shape: Tuple[int, int]) -> Optional[np.ndarray]:
+        """
+        Description
+        -----------
+        Finds the best mask for an image.  Masks from the closest temperature bin are preferred, and within it the
+        shortest exposure bin that is at least as long as the image, since a longer dark flags a superset of the hot
+        pixels.  If there is no such bin, the longest available one is used.
+
+        Parameters
+        ----------
+        temperature : FLOAT or None
+            CCD temperature of the image.
+        exposure : FLOAT or None
+            Exposure time of the image.
+        shape : TUPLE
+            Shape of the image.  Masks of any other shape (i.e. different binning) are ignored.
+
+        Returns
+        -------
+        NUMPY ARRAY or None
+            Read-only boolean mask with the given shape, or None if there is no usable mask.
+
+        """
+        with self._lock:
+            keys = [key for key, (_, mask_shape) in self._packed.items() if mask_shape == tuple(shape)]
+            if not keys:
+                return None
+            t_bin = temperature_bin(temperature)
+            e_bin = exposure_bin(exposure or 0)
+            key = min(keys, key=lambda k: (abs(k[0] - t_bin), k[1] < e_bin, abs(k[1] - e_bin)))
+            mask = self._unpacked.get(key)
+            if mask is None:
+                packed, mask_shape = self._packed[key]
+                mask = np.unpackbits(packed, count=int(np.prod(mask_shape))).astype(bool).reshape(mask_shape)
+                mask.flags.writeable = False
+                self._unpacked[key] = mask
+            return mask
+
+
+def build_from_darks(paths: Iterable[str], nsigma: float = 5) -> Optional[BadPixelMap]:
+    """
+    Description
+    -----------
+    Builds masks from dark frames and adds them to the camera's bad pixel map.  Darks are grouped by exposure time
+    and temperature bin from their headers, and every group with at least 3 frames gets its own mask.  Frames
+    whose header cannot be read (i.e. half-written ones) are skipped.
+
+    Parameters
+    ----------
+    paths : LIST
+        Paths to dark frames.
+    nsigma : FLOAT, optional
+        Detection threshold for hot pixels, see hot_pixels.  The default is 5.
+
+    Returns
+    -------
+    CLASS INSTANCE OBJECT of BadPixelMap or None
+        The updated map, or None if no group had enough darks.
+
+    """
+    groups: Dict[Tuple[int, float], list] = {}
+    table = fits_scanner.scan(paths, ('CCD-TEMP', 'EXPTIME', 'EXPOSURE'))
+    exposures = np.where(np.isnan(table['EXPTIME']), table['EXPOSURE'], table['EXPTIME'])
+    for path, valid, temperature, exposure in zip(table.paths, table.valid, table['CCD-TEMP'], exposures):
+        if not valid or np.isnan(exposure):
+            continue
+        temperature = None if np.isnan(temperature) else float(temperature)
+        groups.setdefault((temperature_bin(temperature), float(exposure)), []).append((path, temperature))
+    bad_pixel_map = None
+    for (_, exposure), frames in groups.items():
+        if len(frames) < 3:
+            continue
+        bad_pixel_map = bad_pixel_map or get_bad_pixel_map()
+        temperatures = [t for _, t in frames if t is not None]
+        master = master_dark([path for path, _ in frames])
+        bad_pixel_map.add(hot_pixels(master, nsigma), np.mean(temperatures) if temperatures else None, exposure)
+    if bad_pixel_map is not None:
+        bad_pixel_map.save()
+    return bad_pixel_map
+
+
+def get_bad_pixel_map() -> BadPixelMap:
+    """
+    Returns
+    -------
+    _map : CLASS INSTANCE OBJECT of BadPixelMap
+        Process-wide bad pixel map, stored as bad_pixel_map.npz in the data directory.  It is reloaded whenever the
+        file on disk changes, i.e. after another process built new masks, or is removed.
+
+    """
+    global _map
+    with _map_lock:
+        path = os.path.join(config_reader.get_config().data_directory, 'bad_pixel_map.npz')
+        mtime = os.path.getmtime(path) if os.path.exists(path) else None
+        if _map is None or _map.path != path or _map.mtime != mtime:
+            _map = BadPixelMap(path)
+    return _map
+
+
+def frame_mask(header: fits.Header, shape: Tuple[int, int]) -> Optional[np.ndarray]:
+    """
+    Parameters
+    ----------
+    header : ASTROPY FITS HEADER
+        Header of the image.
+    shape : TUPLE
+        Shape of the image.
+
+    Returns
+    -------
+    NUMPY ARRAY or None
+        Bad pixel mask for the image, or None if there is no usable mask.
+
+    """
+    temperature, exposure = frame_conditions(header)
+    return get_bad_pixel_map().lookup(temperature, exposure, shape)
@@ -0,0 +1,298 @@
+# Online model of the guiding drift, used to correct the telescope before the drift shows up in an image
+import numpy as np
+from typing import List, Optional, Tuple
+
+# Noise of a measured guide offset (mostly seeing) in arcseconds, how far the pointing wanders on its own (wind,
+# cable drag) in arcseconds per square root second, and how quickly the drift rate may change, in arcseconds per
+# second per square root second (periodic error makes the rate change over a few minutes)
+MEASUREMENT_NOISE = 0.3
+POSITION_NOISE = 0.02
+RATE_NOISE = 0.001
+# Drift rate in arcseconds per second that the first measurements are allowed to find: several times what polar
+# misalignment or periodic error make, so an offset between two images taken close together is treated as a jump
+RATE_UNCERTAINTY = 0.05
+# Uncertainty of the starting gain, how quickly the gain may wander per square root second, and the range it is kept
+# in
+GAIN_UNCERTAINTY = 0.3
+GAIN_NOISE = 0.001
+GAIN_LIMITS = (0.2, 3.0)
+# Corrections smaller than this (in arcseconds) are mostly reactions to measurement noise or steady drift, which
+# would bias the gain, so they are not learned from
+GAIN_MIN_CORRECTION = 1.0
+# Measured errors further than this many standard deviations from the prediction are jumps (i.e. a gust of wind or
+# the mount catching), which the error is reset to instead of being blamed on the drift rate or the gain
+JUMP_SIGMA = 3
+# Expected errors smaller than this many standard deviations of their own uncertainty are not corrected, so the
+# guider does not chase seeing between frames
+CORRECTION_SIGMA = 0.5
+
+
+class AxisModel:
+
+    def __init__(self, gain: float = 1.0, measurement_noise: float = MEASUREMENT_NOISE,
+                 position_noise: float = POSITION_NOISE, rate_noise: float = RATE_NOISE):
+        """
+        Description
+        -----------
+        Kalman filter for the pointing error on one mount axis.  Corrections sent to the telescope are the control
+        input: a correction of u arcseconds takes gain * u off the error.  The gain is part of the state along with
+        the error and its drift rate (an extended Kalman filter), so it is learned from how the measured error
+        responds to corrections.  While the corrections only keep up with a steady drift, the response cannot be
+        told apart from the drift, and the filter keeps the gain it has instead of guessing.
+
+        Parameters
+        ----------
+        gain : FLOAT, optional
+            Starting guess for the fraction of a correction the mount actually makes.  The default is 1.
+        measurement_noise : FLOAT, optional
+            Standard deviation of a measured error in arcseconds.  The default is MEASUREMENT_NOISE.
+        position_noise : FLOAT, optional
+            How far the error wanders on its own, in arcseconds per square root second.  The default is
+            POSITION_NOISE.
+        rate_noise : FLOAT, optional
+            How quickly the drift rate may wander, in arcseconds per second per square root second.  The default is
+            RATE_NOISE.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.gain = gain
+        self.gain_variance = GAIN_UNCERTAINTY ** 2
+        self.measurement_variance = measurement_noise ** 2
+        self.position_variance = position_noise ** 2
+        self.rate_variance = rate_noise ** 2
+        self.reset()
+
+    def reset(self):
+        """
+        Description
+        -----------
+        Forgets every measurement and correction (i.e. after the guider switches to a new reference), but keeps
+        the gain that has been learned.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.time = None
+        self.state = np.zeros(2)
+        self.covariance = np.zeros((3, 3))
+        self.measurements = 0
+        self.pending: List[Tuple[float, float]] = []
+
+    @property
+    def ready(self) -> bool:
+        """
+        Returns
+        -------
+        BOOL
+            True once there have been enough measurements to know the drift rate.
+
+        """
+        return self.measurements >= 2
+
+    def apply(self, time: float, correction: float):
+        """
+        Parameters
+        ----------
+        time : FLOAT
+            When the correction was sent, in seconds.
+        correction : FLOAT
+            Correction sent to the telescope in arcseconds.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.pending.append((time, correction))
+
+    def predict(self, time: float) -> float:
+        """
+        Parameters
+        ----------
+        time : FLOAT
+            Time in seconds.
+
+        Returns
+        -------
+        FLOAT
+            Expected error at that time in arcseconds, after every correction that has been sent.
+
+        """
+        if self.time is None:
+            return 0.0
+        applied = sum(correction for _, correction in self.pending)
+        return float(self.state[0] + self.state[1] * (time - self.time) - self.gain * applied)
+
+    def uncertainty(self, time: float) -> float:
+        """
+        Parameters
+        ----------
+        time : FLOAT
+            Time in seconds.
+
+        Returns
+        -------
+        FLOAT
+            Standard deviation of the expected error at that time in arcseconds.
+
+        """
+        if self.time is None:
+            return np.inf
+        dt = max(time - self.time, 0.0)
+        variance = (self.covariance[0, 0] + 2 * dt * self.covariance[0, 1] + dt ** 2 * self.covariance[1, 1] +
+                    self.position_variance * dt + self.rate_variance * dt ** 3 / 3)
+        return float(np.sqrt(max(variance, 0.0)))
+
+    def update(self, time: float, error: float, exposure: float = 0.0):
+        """
+        Description
+        -----------
+        Adds a measured error.  An error measured from an image is the mean error over the exposure, so a
+        correction sent during the exposure only shows up in it by the fraction of the exposure that was left.
+
+        Parameters
+        ----------
+        time : FLOAT
+            When the error was measured (the middle of the exposure), in seconds.
+        error : FLOAT
+            Measured error in arcseconds.
+        exposure : FLOAT, optional
+            Exposure time in seconds.  The default is 0.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.measurements += 1
+        applied = sum(correction for t, correction in self.pending if t <= time)
+        # Difference between the mean error over the exposure and the error at its middle, per unit of gain
+        end = time + exposure / 2
+        offset = 0.0
+        for t, correction in self.pending:
+            fraction = np.clip((end - t) / exposure, 0, 1) if exposure > 0 else float(t <= time)
+            offset += correction * ((1 - fraction) if t <= time else -fraction)
+        self.pending = [(t, correction) for t, correction in self.pending if t > time]
+        if self.time is None:
+            self.time = time
+            self.state = np.array([error, 0.0])
+            # Nothing is known about the rate yet.  The gain keeps what was learned before a reset
+            self.covariance = np.diag([self.measurement_variance, RATE_UNCERTAINTY ** 2, self.gain_variance])
+            return
+        dt = max(time - self.time, 0.0)
+        # State (error, rate, gain); the error depends on the gain through the corrections made since the last
+        # measurement
+        state = np.array([self.state[0] + self.state[1] * dt - self.gain * applied, self.state[1], self.gain])
+        learn = abs(applied) + abs(offset) >= GAIN_MIN_CORRECTION
+        transition = np.array([[1.0, dt, -applied if learn else 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, 1.0]])
+        noise = np.zeros((3, 3))
+        noise[:2, :2] = self.rate_variance * np.array([[dt ** 3 / 3, dt ** 2 / 2], [dt ** 2 / 2, dt]])
+        noise[0, 0] += self.position_variance * dt
+        noise[2, 2] = GAIN_NOISE ** 2 * dt
+        covariance = transition @ self.covariance @ transition.T + noise
+        measurement = np.array([1.0, 0.0, offset if learn else 0.0])
+        innovation = error - state[0] - state[2] * offset
+        variance = measurement @ covariance @ measurement + self.measurement_variance
+        if innovation ** 2 > JUMP_SIGMA ** 2 * variance:
+            state[0] += innovation
+            covariance[0, :] = covariance[:, 0] = 0
+            covariance[0, 0] = self.measurement_variance
+            self.covariance = covariance
+        else:
+            kalman_gain = covariance @ measurement / variance
+            state += kalman_gain * innovation
+            self.covariance = covariance - np.outer(kalman_gain, measurement @ covariance)
+        self.state = state[:2]
+        self.gain = float(np.clip(state[2], *GAIN_LIMITS))
+        self.gain_variance = self.covariance[2, 2]
+        self.time = time
+
+
+class DriftModel:
+
+    def __init__(self, ra_gain: float = 1.0, dec_gain: float = 1.0, **kwargs):
+        """
+        Description
+        -----------
+        Drift model for both mount axes.  Errors and corrections are the signed distances in arcseconds the
+        telescope has to move to bring the image back (east and north positive), as in
+        Telescope.guide_correction.
+
+        Parameters
+        ----------
+        ra_gain : FLOAT, optional
+            Starting guess for the RA gain.  The default is 1.
+        dec_gain : FLOAT, optional
+            Starting guess for the Dec gain.  The default is 1.
+        **kwargs : FLOAT
+            Noise settings passed to both AxisModels.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.axes = (AxisModel(ra_gain, **kwargs), AxisModel(dec_gain, **kwargs))
+
+    @property
+    def ready(self) -> bool:
+        return all(axis.ready for axis in self.axes)
+
+    @property
+    def time(self) -> Optional[float]:
+        """
+        Returns
+        -------
+        FLOAT or None
+            Time of the last measurement in seconds, or None if there has not been one since the last reset.
+
+        """
+        return self.axes[0].time
+
+    @property
+    def gains(self) -> Tuple[float, float]:
+        return self.axes[0].gain, self.axes[1].gain
+
+    def reset(self):
+        for axis in self.axes:
+            axis.reset()
+
+    def update(self, time: float, ra_error: float, dec_error: float, exposure: float = 0.0):
+        for axis, error in zip(self.axes, (ra_error, dec_error)):
+            axis.update(time, error, exposure)
+
+    def apply(self, time: float, ra_correction: float, dec_correction: float):
+        for axis, correction in zip(self.axes, (ra_correction, dec_correction)):
+            axis.apply(time, correction)
+
+    def predict(self, time: float) -> Tuple[float, float]:
+        return self.axes[0].predict(time), self.axes[1].predict(time)
+
+    def correction(self, time: float, lead: float = 0.0) -> Tuple[float, float, float, float]:
+        """
+        Parameters
+        ----------
+        time : FLOAT
+            Current time in seconds.
+        lead : FLOAT, optional
+            How far ahead in seconds to correct for.  Correcting for the middle of the time until the next
+            correction keeps the error centered on zero in between.  The default is 0.
+
+        Returns
+        -------
+        TUPLE
+            (RA correction, Dec correction, expected RA error, expected Dec error) in arcseconds: the corrections to
+            send, already divided by the gains, and the errors they should take out.  An axis whose expected error
+            is within CORRECTION_SIGMA of its uncertainty gets no correction.
+
+        """
+        errors = []
+        for axis in self.axes:
+            error = axis.predict(time + lead)
+            errors.append(error if abs(error) >= CORRECTION_SIGMA * axis.uncertainty(time + lead) else 0.0)
+        return errors[0] / self.axes[0].gain, errors[1] / self.axes[1].gain, errors[0], errors[1]
@@ -0,0 +1,225 @@
+# Header-only metadata scanner for directories of FITS frames
+import os
+import logging
+import concurrent.futures
+import numpy as np
+from typing import Dict, Iterable, List, Optional, Union
+
+# FITS files are made of 2880-byte blocks of 36 80-byte header cards
+BLOCK_SIZE = 2880
+CARD_SIZE = 80
+# Give up on files whose header runs past this many blocks (i.e. they are not FITS files at all)
+MAX_HEADER_BLOCKS = 100
+DEFAULT_KEYWORDS = ('OBJECT', 'OBSERVER', 'IMAGETYP', 'FILTER', 'EXPTIME', 'EXPOSURE', 'DATE-OBS', 'JD_UTC',
+                    'BJD_TDB', 'AIRMASS', 'CCD-TEMP', 'XBINNING', 'YBINNING', 'NAXIS1', 'NAXIS2')
+
+
+def parse_value(text: str) -> Union[str, bool, int, float, None]:
+    """
+    Description
+    -----------
+    Minimal parser for the value field of a FITS header card (columns 11-80): quoted strings, logicals, integers,
+    and floats, with any trailing comment removed.
+
+    Parameters
+    ----------
+    text : STR
+        Value field of the card.
+
+    Returns
+    -------
+    STR, BOOL, INT, FLOAT, or None
+        The parsed value.  Blank values are None, and anything unrecognized is returned as the stripped text.
+
+    """
+    text = text.strip()
+    if text.startswith("'"):
+        # Two single quotes inside a string stand for one
+        end = 1
+        while True:
+            end = text.find("'", end)
+            if end == -1 or text[end + 1:end + 2] != "'":
+                break
+            end += 2
+        return text[1:end if end != -1 else None].replace("''", "'").rstrip()
+    value = text.split('/', 1)[0].strip()
+    if not value:
+        return None
+    if value == 'T':
+        return True
+    if value == 'F':
+        return False
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        return float(value.replace('D', 'E'))
+    except ValueError:
+        return value
+
+
+def read_header(path: str, keywords: Iterable[str] = DEFAULT_KEYWORDS) -> Dict[str, Union[str, bool, int, float]]:
+    """
+    Description
+    -----------
+    Reads the primary header of a FITS file one 2880-byte block at a time, stopping at the END card, and parses
+    only the requested keywords.  The data is never read.
+
+    Parameters
+    ----------
+    path : STR
+        Path to the FITS file.
+    keywords : LIST, optional
+        Header keywords to parse.  The default is DEFAULT_KEYWORDS.
+
+    Returns
+    -------
+    header : DICT
+        The requested keywords that are in the header, with their values.
+
+    """
+    wanted = {keyword.upper().ljust(8) for keyword in keywords}
+    header = {}
+    with open(path, 'rb') as file:
+        for block_number in range(MAX_HEADER_BLOCKS):
+            block = file.read(BLOCK_SIZE)
+            if len(block) < BLOCK_SIZE:
+                raise ValueError('{} ends before the end of its header'.format(path))
+            if block_number == 0 and not block.startswith(b'SIMPLE  ='):
+                raise ValueError('{} is not a FITS file'.format(path))
+            text = block.decode('ascii', errors='replace')
+            for start in range(0, BLOCK_SIZE, CARD_SIZE):
+                name = text[start:start + 8]
+                if name == 'END     ':
+                    return header
+                if name in wanted and text[start + 8:start + 10] == '= ':
+                    header[name.rstrip()] = parse_value(text[start + 10:start + CARD_SIZE])
+    raise ValueError('{} has no END card in its first {} header blocks'.format(path, MAX_HEADER_BLOCKS))
+
+
+class HeaderTable:
+
+    def __init__(self, paths: List[str], columns: Dict[str, np.ndarray], valid: np.ndarray):
+        """
+        Description
+        -----------
+        Columnar table of header values, one row per file.  Numeric keywords are float arrays with NaN where a file
+        does not have the keyword; all other keywords are object arrays with None.
+
+        Parameters
+        ----------
+        paths : LIST
+            Path to each file.
+        columns : DICT
+            Column for each keyword.
+        valid : NUMPY ARRAY
+            Boolean array, False for files whose header could not be read (i.e. half-written files).
+
+        Returns
+        -------
+        None.
+
+        """
+        self.paths = np.array(paths, dtype=object)
+        self.columns = columns
+        self.valid = valid
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    def __getitem__(self, keyword: str) -> np.ndarray:
+        return self.columns[keyword.upper()]
+
+    def __contains__(self, keyword: str) -> bool:
+        return keyword.upper() in self.columns
+
+    def filter(self, mask: np.ndarray) -> 'HeaderTable':
+        """
+        Parameters
+        ----------
+        mask : NUMPY ARRAY
+            Boolean array with one entry per file.
+
+        Returns
+        -------
+        HeaderTable
+            The rows for which mask is True.
+
+        """
+        mask = np.asarray(mask, dtype=bool)
+        return HeaderTable(list(self.paths[mask]), {key: column[mask] for key, column in self.columns.items()},
+                           self.valid[mask])
+
+    def row(self, index: int) -> Dict[str, Union[str, bool, int, float, None]]:
+        """
+        Parameters
+        ----------
+        index : INT
+            Row number.
+
+        Returns
+        -------
+        DICT
+            The path and every keyword of a single file.
+
+        """
+        return dict({key: column[index] for key, column in self.columns.items()}, path=self.paths[index])
+
+
+def _column(values: list) -> np.ndarray:
+    present = [value for value in values if value is not None]
+    if present and all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in present):
+        return np.array([np.nan if value is None else value for value in values], dtype=float)
+    column = np.empty(len(values), dtype=object)
+    column[:] = values
+    return column
+
+
+def _read_or_none(path: str, keywords: Iterable[str]) -> Optional[dict]:
+    try:
+        return read_header(path, keywords)
+    except (OSError, ValueError) as exc:
+        logging.debug('Could not read the header of {}: {}'.format(path, exc))
+        return None
+
+
+def scan(paths: Union[str, Iterable[str]], keywords: Iterable[str] = DEFAULT_KEYWORDS,
+         workers: int = 16) -> HeaderTable:
+    """
+    Description
+    -----------
+    Reads the headers of many FITS files at once across a thread pool.  Most of the time per file is spent waiting
+    on the file system (especially on a network share), so threads overlap that waiting without the cost of
+    opening every file with astropy.
+
+    Parameters
+    ----------
+    paths : STR or LIST
+        A directory, whose .fits/.fit/.fts files are all scanned, or a list of file paths.
+    keywords : LIST, optional
+        Header keywords to read.  The default is DEFAULT_KEYWORDS.
+    workers : INT, optional
+        Number of threads.  The default is 16.
+
+    Returns
+    -------
+    HeaderTable
+        One row per file, in the given order (sorted by name for a directory).
+
+    """
+    if isinstance(paths, (str, os.PathLike)):
+        directory = paths
+        paths = [os.path.join(directory, name) for name in sorted(os.listdir(directory))
+                 if name.lower().endswith(('.fits', '.fit', '.fts'))]
+    else:
+        paths = list(paths)
+    keywords = tuple(keyword.upper() for keyword in keywords)
+    if len(paths) <= 1 or workers <= 1:
+        headers = [_read_or_none(path, keywords) for path in paths]
+    else:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(workers, len(paths))) as executor:
+            headers = list(executor.map(lambda path: _read_or_none(path, keywords), paths))
+    columns = {keyword: _column([header.get(keyword) if header else None for header in headers])
+               for keyword in keywords}
+    return HeaderTable(paths, columns, np.array([header is not None for header in headers], dtype=bool))
@@ -0,0 +1,196 @@
+# Shared cache for per-frame analysis products
+import os
+import sys
+import logging
+import threading
+import collections
+import numpy as np
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+from ..IO import config_reader
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+class FrameAnalysisCache:
+
+    def __init__(self, max_bytes: int):
+        """
+        Description
+        -----------
+        A thread-safe, least-recently-used cache of analysis products (pixel data, background statistics,
+        threshold maps, star lists, ...) for image files.  Frames are keyed by (path, mtime, size), so a file that
+        is overwritten is never served stale results.
+
+        Parameters
+        ----------
+        max_bytes : INT
+            Memory budget for the cache in bytes.  The least recently used frames are evicted once the cached
+            products exceed this size.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: collections.OrderedDict = collections.OrderedDict()
+        self._sizes: Dict[Tuple, int] = {}
+        self._keys_by_path: Dict[str, Tuple] = {}
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def frame_key(path: str) -> Tuple[str, int, int]:
+        """
+        Parameters
+        ----------
+        path : STR
+            Path to an image file.
+
+        Returns
+        -------
+        TUPLE
+            (absolute path, modification time in ns, size in bytes) of the file.
+
+        """
+        stat = os.stat(path)
+        return os.path.abspath(path), stat.st_mtime_ns, stat.st_size
+
+    def get(self, path: str, item: Hashable, compute: Callable[[], Any]) -> Any:
+        """
+        Description
+        -----------
+        Returns a cached analysis product for a frame, computing and storing it on a miss.
+
+        Parameters
+        ----------
+        path : STR
+            Path to the image file the product belongs to.  Anything that is not a path is not cached.
+        item : HASHABLE
+            Name of the product, i.e. 'data' or ('stars', saturation, subframe).
+        compute : CALLABLE
+            Function with no arguments that computes the product on a cache miss.
+
+        Returns
+        -------
+        ANY
+            The cached or freshly computed product.  Cached numpy arrays are read-only.
+
+        """
+        if not isinstance(path, (str, os.PathLike)):
+            # In-memory frames (i.e. buffers handed to the analysis service) have no file to key on
+            return compute()
+        key = self.frame_key(path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and item in entry:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[item]
+            self.misses += 1
+        # Computed outside of the lock so that a slow analysis on one thread does not block the others
+        value = compute()
+        self._store(key, item, value)
+        return value
+
+    def _store(self, key: Tuple, item: Hashable, value: Any):
+        size = _sizeof(value)
+        if size > self.max_bytes:
+            return
+        if isinstance(value, np.ndarray):
+            value.flags.writeable = False
+        elif isinstance(getattr(value, 'data', None), np.ndarray):
+            # i.e. a StarList, whose array is shared with every later get()
+            value.data.flags.writeable = False
+        with self._lock:
+            old_key = self._keys_by_path.get(key[0])
+            if old_key is not None and old_key != key:
+                self._evict(old_key)
+            entry = self._entries.setdefault(key, {})
+            self._keys_by_path[key[0]] = key
+            if item in entry:
+                return
+            entry[item] = value
+            self._sizes[key] = self._sizes.get(key, 0) + size
+            self.nbytes += size
+            self._entries.move_to_end(key)
+            while self.nbytes > self.max_bytes and self._entries:
+                self._evict(next(iter(self._entries)))
+
+    def _evict(self, key: Tuple):
+        self._entries.pop(key, None)
+        self.nbytes -= self._sizes.pop(key, 0)
+        if self._keys_by_path.get(key[0]) == key:
+            del self._keys_by_path[key[0]]
+        logging.debug('Evicted {} from the frame analysis cache'.format(key[0]))
+
+    def clear(self):
+        """
+        Description
+        -----------
+        Empties the cache and resets the hit/miss counters.
+
+        Returns
+        -------
+        None.
+
+        """
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self._keys_by_path.clear()
+            self.nbytes = 0
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns
+        -------
+        DICT
+            Number of hits, misses, cached frames, and cached bytes.
+
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'frames': len(self._entries), 'bytes': self.nbytes}
+
+
+def _sizeof(value: Any) -> int:
+    """
+    Parameters
+    ----------
+    value : ANY
+        An analysis product.
+
+    Returns
+    -------
+    INT
+        Approximate memory footprint of the product in bytes.
+
+    """
+    if isinstance(value, np.ndarray) or hasattr(value, 'nbytes'):
+        return value.nbytes
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(_sizeof(v) for v in value)
+    return sys.getsizeof(value)
+
+
+def get_cache() -> FrameAnalysisCache:
+    """
+    Returns
+    -------
+    _cache : CLASS INSTANCE OBJECT of FrameAnalysisCache
+        Process-wide frame analysis cache, created on first use with the memory budget (in MB) from the
+        frame_cache_size config parameter.
+
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            config_dict = config_reader.get_config()
+            _cache = FrameAnalysisCache(max_bytes=int(config_dict.frame_cache_size * 1024 ** 2))
+    return _cache
@@ -0,0 +1,212 @@
+# Publish/subscribe feed of the frames saved by the camera
+import os
+import time
+import logging
+import threading
+import collections
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+_feed = None
+_feed_lock = threading.Lock()
+
+
+class Frame(NamedTuple):
+    """
+    A saved frame: its path, a sequence number that increases by one for every frame published, the time it was
+    published (time.time()), and metadata from the camera (exposure time, filter, image type, header keywords, ...).
+    """
+    path: str
+    sequence: int
+    time: float
+    metadata: Dict[str, Any]
+
+
+class Subscription:
+
+    def __init__(self, feed: 'FrameFeed', maxsize: int, accept: Optional[Callable[[Frame], bool]]):
+        """
+        Description
+        -----------
+        A bounded channel of frames for a single consumer.  When the consumer falls behind, the oldest frames are
+        dropped, so get always returns the most recent ones and never a backlog.
+
+        Parameters
+        ----------
+        feed : CLASS INSTANCE OBJECT of FrameFeed
+            The feed the subscription belongs to.
+        maxsize : INT
+            Number of frames the channel holds.
+        accept : CALLABLE or None
+            Function that takes a Frame and returns whether this subscriber wants it, or None for every frame.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.feed = feed
+        self.accept = accept
+        self.dropped = 0
+        self._frames: collections.deque = collections.deque(maxlen=maxsize)
+        self._condition = threading.Condition()
+        self.closed = False
+
+    def _put(self, frame: Frame):
+        if self.accept is not None and not self.accept(frame):
+            return
+        with self._condition:
+            if len(self._frames) == self._frames.maxlen:
+                self.dropped += 1
+                logging.debug('Dropped stale frame {} ({} dropped so far)'.format(self._frames[0].path, self.dropped))
+            self._frames.append(frame)
+            self._condition.notify_all()
+
+    def get(self, timeout: Optional[float] = None) -> Optional[Frame]:
+        """
+        Description
+        -----------
+        Waits for the next frame and returns the newest one that has not been returned yet, dropping any older ones.
+
+        Parameters
+        ----------
+        timeout : FLOAT, optional
+            Seconds to wait for a frame.  The default is None, which waits until there is one or the subscription
+            is closed.
+
+        Returns
+        -------
+        Frame or None
+            The newest frame, or None if the wait timed out or the subscription was closed.
+
+        """
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._frames or self.closed, timeout=timeout) or self.closed:
+                return None
+            frame = self._frames.pop()
+            self.dropped += len(self._frames)
+            self._frames.clear()
+            return frame
+
+    def close(self):
+        """
+        Description
+        -----------
+        Unsubscribes from the feed and wakes up a consumer that is waiting in get.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.feed.unsubscribe(self)
+        with self._condition:
+            self.closed = True
+            self._condition.notify_all()
+
+    def __enter__(self) -> 'Subscription':
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class FrameFeed:
+
+    def __init__(self):
+        """
+        Description
+        -----------
+        Frames saved by the camera, pushed to every subscriber as they are written, so consumers like the guider
+        do not have to list and stat the image directory to find the newest one.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.sequence = 0
+        self._subscribers: List[Subscription] = []
+        self._lock = threading.Lock()
+
+    def publish(self, path: str, **metadata) -> Frame:
+        """
+        Parameters
+        ----------
+        path : STR
+            Path to the frame that was just saved.
+        **metadata : ANY
+            Anything the subscribers may need to know about the frame.
+
+        Returns
+        -------
+        frame : Frame
+            The frame that was published.
+
+        """
+        with self._lock:
+            self.sequence += 1
+            frame = Frame(os.path.abspath(path), self.sequence, time.time(), metadata)
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            subscriber._put(frame)
+        return frame
+
+    def subscribe(self, maxsize: int = 1, accept: Optional[Callable[[Frame], bool]] = None) -> Subscription:
+        """
+        Parameters
+        ----------
+        maxsize : INT, optional
+            Number of frames the subscription holds before dropping the oldest.  The default is 1, for only the
+            latest frame.
+        accept : CALLABLE, optional
+            Function that takes a Frame and returns whether to deliver it.  The default is None, for every frame.
+
+        Returns
+        -------
+        Subscription
+            New subscription, which only sees frames published from now on.
+
+        """
+        subscription = Subscription(self, maxsize, accept)
+        with self._lock:
+            self._subscribers.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            if subscription in self._subscribers:
+                self._subscribers.remove(subscription)
+
+
+def in_directory(directory: str) -> Callable[[Frame], bool]:
+    """
+    Parameters
+    ----------
+    directory : STR
+        Path to a directory.
+
+    Returns
+    -------
+    CALLABLE
+        Filter for FrameFeed.subscribe that accepts frames saved directly in the directory, and not in any of its
+        sub-directories (i.e. focuser images, flats, or darks).
+
+    """
+    directory = os.path.abspath(directory)
+    return lambda frame: os.path.dirname(frame.path) == directory
+
+
+def get_feed() -> FrameFeed:
+    """
+    Returns
+    -------
+    _feed : CLASS INSTANCE OBJECT of FrameFeed
+        Process-wide frame feed.  It outlives any single Camera object, so that a camera that is restarted after a
+        crash keeps publishing to the same subscribers.
+
+    """
+    global _feed
+    with _feed_lock:
+        if _feed is None:
+            _feed = FrameFeed()
+    return _feed
@@ -0,0 +1,235 @@
+# Guide telemetry: one fixed-size record per guider iteration, kept in a ring buffer and appended to a file per ticket
+import os
+import struct
+import logging
+import numpy as np
+from typing import Dict, Optional
+
+# One record per guider iteration: when its image was saved (UNIX time, or when the correction was sent for
+# corrections between images), the sequence number of the image (0 between images), the measured offset from the
+# guide star or reference in pixels (NaN if nothing was measured) and its length, the correction sent in arcseconds
+# (positive to the east and north), how long the iteration took in seconds, and flags.  Packed, so the file on disk
+# is the same bytes as the buffer
+TELEMETRY_DTYPE = np.dtype([('time', '<f8'), ('sequence', '<u4'), ('dx', '<f4'), ('dy', '<f4'),
+                            ('separation', '<f4'), ('ra', '<f4'), ('dec', '<f4'), ('duration', '<f4'),
+                            ('flags', '<u2')])
+# The same layout for struct, which writes a record into the buffer faster than assigning a tuple to a row of the
+# structured array (see benchmarks/bench_guide_telemetry.py)
+_RECORD = struct.Struct('<dIffffffH')
+assert _RECORD.size == TELEMETRY_DTYPE.itemsize
+
+# Bits of the flags field
+FAILED = 1
+REFERENCE = 2
+JUMP = 4
+CORRECTED = 8
+PREDICTED = 16
+
+# Records kept in memory before the oldest ones are overwritten: hours of guiding, in about 150 kB
+TELEMETRY_CAPACITY = 4096
+# Name of the telemetry file in each target's folder
+TELEMETRY_FILE = 'guide_telemetry.bin'
+
+
+class TelemetryBuffer:
+
+    def __init__(self, path: Optional[str] = None, capacity: int = TELEMETRY_CAPACITY):
+        """
+        Description
+        -----------
+        Ring buffer of guide telemetry, backed by a single bytearray that is also viewed as a numpy structured
+        array with dtype TELEMETRY_DTYPE.  Recording a sample packs it straight into the next slot, without
+        allocating anything, so the buffer can stay on for every iteration.  flush appends the records that have
+        not been written yet to a raw binary file, which read_telemetry loads back.  Only one thread should
+        record and flush.
+
+        Parameters
+        ----------
+        path : STR, optional
+            File to flush the records to.  The default is None, which keeps them in memory only.
+        capacity : INT, optional
+            Number of records kept in memory.  The default is TELEMETRY_CAPACITY.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.path = path
+        self.capacity = capacity
+        self.buffer = bytearray(capacity * _RECORD.size)
+        self.data = np.frombuffer(self.buffer, dtype=TELEMETRY_DTYPE)
+        # Records ever made and records ever flushed, so count % capacity is the next slot
+        self.count = 0
+        self.flushed = 0
+        self._pack_into = _RECORD.pack_into
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def record(self, time: float, sequence: int, dx: float, dy: float, separation: float, ra: float, dec: float,
+               duration: float, flags: int):
+        """
+        Description
+        -----------
+        Adds a record, overwriting the oldest one once the buffer is full.  The arguments are the fields of
+        TELEMETRY_DTYPE.
+
+        Returns
+        -------
+        None.
+
+        """
+        self._pack_into(self.buffer, (self.count % self.capacity) * _RECORD.size, time, sequence, dx, dy, separation,
+                        ra, dec, duration, flags)
+        self.count += 1
+
+    def records(self, start: int = 0) -> np.ndarray:
+        """
+        Parameters
+        ----------
+        start : INT, optional
+            Number of records made before the first one to return.  The default is 0, for every record still in
+            memory.
+
+        Returns
+        -------
+        NUMPY ARRAY
+            Copy of the records in memory from start on, oldest first.
+
+        """
+        start = max(start, self.count - self.capacity)
+        if start >= self.count:
+            return np.zeros(0, dtype=TELEMETRY_DTYPE)
+        first = start % self.capacity
+        end = self.count % self.capacity
+        if first < end:
+            return self.data[first:end].copy()
+        return np.concatenate((self.data[first:], self.data[:end]))
+
+    def flush(self) -> int:
+        """
+        Description
+        -----------
+        Appends the records made since the last flush to the file.  If the buffer wrapped around in the meantime,
+        the records that were overwritten are lost, and a warning says how many.
+
+        Returns
+        -------
+        INT
+            Number of records written.
+
+        """
+        if self.path is None or self.flushed == self.count:
+            return 0
+        lost = self.count - self.capacity - self.flushed
+        if lost > 0:
+            logging.warning('{} guide telemetry records were overwritten before they were saved'.format(lost))
+        records = self.records(self.flushed)
+        try:
+            with open(self.path, 'ab') as file:
+                file.write(records.tobytes())
+        except OSError as error:
+            logging.warning('Could not save guide telemetry to {}: {}'.format(self.path, error))
+            return 0
+        self.flushed = self.count
+        return len(records)
+
+
+def telemetry_path(image_path: str) -> str:
+    """
+    Parameters
+    ----------
+    image_path : STR
+        Path to the folder where images of the target are saved.
+
+    Returns
+    -------
+    STR
+        Path to the target's guide telemetry file.
+
+    """
+    return os.path.join(image_path, TELEMETRY_FILE)
+
+
+def read_telemetry(path: str) -> np.ndarray:
+    """
+    Parameters
+    ----------
+    path : STR
+        Guide telemetry file, or the folder of the target it belongs to.
+
+    Returns
+    -------
+    NUMPY ARRAY
+        Structured array with dtype TELEMETRY_DTYPE of every record in the file, oldest first.  A record cut short
+        by a crash while flushing is dropped.
+
+    """
+    if os.path.isdir(path):
+        path = telemetry_path(path)
+    with open(path, 'rb') as file:
+        raw = file.read()
+    return np.frombuffer(raw, dtype=TELEMETRY_DTYPE, count=len(raw) // TELEMETRY_DTYPE.itemsize)
+
+
+def query(records: np.ndarray, start: Optional[float] = None, end: Optional[float] = None, flags: int = 0,
+          without: int = 0) -> np.ndarray:
+    """
+    Parameters
+    ----------
+    records : NUMPY ARRAY
+        Structured array with dtype TELEMETRY_DTYPE.
+    start : FLOAT, optional
+        Earliest time to keep, as a UNIX time.  The default is None, for no limit.
+    end : FLOAT, optional
+        Latest time to keep, as a UNIX time.  The default is None, for no limit.
+    flags : INT, optional
+        Keep only records with all of these flag bits set.  The default is 0.
+    without : INT, optional
+        Keep only records with none of these flag bits set.  The default is 0.
+
+    Returns
+    -------
+    NUMPY ARRAY
+        The records that match.
+
+    """
+    keep = np.ones(len(records), dtype=bool)
+    if start is not None:
+        keep &= records['time'] >= start
+    if end is not None:
+        keep &= records['time'] <= end
+    if flags:
+        keep &= (records['flags'] & flags) == flags
+    if without:
+        keep &= (records['flags'] & without) == 0
+    return records[keep]
+
+
+def summary(records: np.ndarray) -> Dict[str, float]:
+    """
+    Parameters
+    ----------
+    records : NUMPY ARRAY
+        Structured array with dtype TELEMETRY_DTYPE.
+
+    Returns
+    -------
+    DICT
+        Number of images, images nothing could be measured in, and corrections sent; RMS of the measured offsets
+        in pixels; mean and longest iteration in seconds; and total correction on each axis in arcseconds.
+
+    """
+    images = query(records, without=PREDICTED)
+    measured = query(images, without=FAILED | REFERENCE)
+    corrections = query(records, flags=CORRECTED)
+    separation = measured['separation'].astype(float)
+    return {'images': len(images),
+            'failures': int(np.count_nonzero(images['flags'] & FAILED)),
+            'corrections': len(corrections),
+            'rms_separation': float(np.sqrt(np.mean(separation ** 2))) if len(separation) else float('nan'),
+            'mean_duration': float(images['duration'].mean()) if len(images) else float('nan'),
+            'max_duration': float(images['duration'].max()) if len(images) else float('nan'),
+            'ra_total': float(corrections['ra'].sum(dtype=float)),
+            'dec_total': float(corrections['dec'].sum(dtype=float))}
@@ -0,0 +1,178 @@
+# Guider calibration: camera orientation, pixel scale, and effective guide rates measured on the sky
+import os
+import json
+import logging
+import threading
+import numpy as np
+from typing import NamedTuple, Optional, Sequence, Tuple
+
+from ..IO import config_reader
+
+# Rate at which the sky drifts past a telescope that is not tracking, in arcseconds of RA per second
+SIDEREAL_RATE = 15.041
+# Largest difference in degrees between the RA and Dec axes measured in the images and a right angle before the
+# calibration is rejected (i.e. Dec backlash ate one of the moves, or a cloud made the star matching fail)
+ORTHOGONALITY_TOLERANCE = 10
+# The RA guide rate on the sky shrinks with cos(dec), so a calibration only holds within this many degrees of the
+# declination it was made at
+DECLINATION_TOLERANCE = 20
+
+_calibration = None
+_calibration_mtime = None
+_calibration_lock = threading.Lock()
+
+
+class GuiderCalibration(NamedTuple):
+    """
+    Guider constants measured by Guider.calibrate: the angle between the +x camera axis and the +RA axis in radians
+    and whether the y axis is flipped (as guider_angle and guider_flip_y), the plate scale in arcseconds per pixel,
+    the effective guide rates in degrees per second on the sky (as the ASCOM GuideRateRightAscension and
+    GuideRateDeclination, but as the mount actually moves), and the declination in degrees they were measured at.
+    """
+    angle: float
+    flip_y: bool
+    plate_scale: float
+    ra_guide_rate: float
+    dec_guide_rate: float
+    declination: float
+
+
+def fit(ra_moves: Sequence[Tuple[float, float, float]], dec_moves: Sequence[Tuple[float, float, float]],
+        drift: Tuple[float, float], drift_distance: float, declination: float) -> GuiderCalibration:
+    """
+    Description
+    -----------
+    Fits the guider constants to the star displacements measured during a calibration run.  Sidereal drift with
+    tracking off moves the sky by a known distance, which gives the plate scale and the direction of RA; the guide
+    pulses give the direction of Dec (and so the flip) and how far each axis actually moves per second of pulse.
+
+    Parameters
+    ----------
+    ra_moves : LIST of TUPLE
+        (dx, dy, seconds) for every RA pulse: the image displacement in pixels, and the pulse length in seconds,
+        positive for east and negative for west.
+    dec_moves : LIST of TUPLE
+        (dx, dy, seconds) for every Dec pulse, positive for north and negative for south.
+    drift : TUPLE
+        (dx, dy) image displacement in pixels while tracking was off.
+    drift_distance : FLOAT
+        Distance the sky drifted in arcseconds while tracking was off.
+    declination : FLOAT
+        Declination of the telescope in degrees.
+
+    Returns
+    -------
+    GuiderCalibration
+        The fitted constants.
+
+    Raises
+    ------
+    ValueError
+        If the displacements do not fit a rotated (and possibly flipped) camera.
+
+    """
+    drift = np.asarray(drift, dtype=float)
+    if np.hypot(*drift) == 0:
+        raise ValueError('Stars did not move while tracking was off')
+    plate_scale = drift_distance / np.hypot(*drift)
+    # Image displacement per second of pulse toward east and north.  Moving the telescope east or north moves the
+    # stars the opposite way, and tracking off is the same as moving east
+    ra_velocity = np.mean([np.array([dx, dy]) / seconds for dx, dy, seconds in ra_moves], axis=0)
+    dec_velocity = np.mean([np.array([dx, dy]) / seconds for dx, dy, seconds in dec_moves], axis=0)
+    if np.hypot(*ra_velocity) == 0 or np.hypot(*dec_velocity) == 0:
+        raise ValueError('Stars did not move with the guide pulses')
+    ra_direction = drift / np.hypot(*drift) + ra_velocity / np.hypot(*ra_velocity)
+    cross = ra_velocity[0] * dec_velocity[1] - ra_velocity[1] * dec_velocity[0]
+    between = np.degrees(np.arccos(np.clip(np.dot(ra_velocity, dec_velocity) /
+                                           (np.hypot(*ra_velocity) * np.hypot(*dec_velocity)), -1, 1)))
+    if abs(between - 90) > ORTHOGONALITY_TOLERANCE:
+        raise ValueError('RA and Dec moves are {:.0f} degrees apart instead of 90'.format(between))
+    if np.dot(drift, ra_velocity) <= 0:
+        raise ValueError('RA pulses moved the stars against the sidereal drift')
+    flip_y = bool(cross < 0)
+    if flip_y:
+        ra_direction[1] *= -1
+    # Inverse of Guider.sky_offset for a move toward east: the flipped displacement is along (-cos, sin) of the angle
+    angle = float(np.arctan2(ra_direction[1], -ra_direction[0]) % (2 * np.pi))
+    return GuiderCalibration(angle=angle, flip_y=flip_y, plate_scale=float(plate_scale),
+                             ra_guide_rate=float(np.hypot(*ra_velocity) * plate_scale / 3600),
+                             dec_guide_rate=float(np.hypot(*dec_velocity) * plate_scale / 3600),
+                             declination=float(declination))
+
+
+def calibration_path() -> str:
+    """
+    Returns
+    -------
+    STR
+        Path to the stored calibration, guider_calibration.json in the data directory.
+
+    """
+    return os.path.join(config_reader.get_config().data_directory, 'guider_calibration.json')
+
+
+def save(calibration: GuiderCalibration):
+    """
+    Parameters
+    ----------
+    calibration : GuiderCalibration
+        Calibration to store, replacing the one on disk.
+
+    Returns
+    -------
+    None.
+
+    """
+    path = calibration_path()
+    temporary = path + '.tmp'
+    with open(temporary, 'w') as file:
+        json.dump(calibration._asdict(), file, indent=4)
+    os.replace(temporary, path)
+    logging.info('Guider calibration saved to {}'.format(path))
+
+
+def get_calibration() -> Optional[GuiderCalibration]:
+    """
+    Returns
+    -------
+    GuiderCalibration or None
+        The stored calibration, reloaded whenever the file changes, or None if guider_calibration is off or there
+        is no calibration yet.
+
+    """
+    global _calibration, _calibration_mtime
+    if not config_reader.get_config().guider_calibration:
+        return None
+    path = calibration_path()
+    with _calibration_lock:
+        mtime = os.path.getmtime(path) if os.path.exists(path) else None
+        if mtime != _calibration_mtime:
+            _calibration = None
+            if mtime is not None:
+                try:
+                    with open(path, 'r') as file:
+                        _calibration = GuiderCalibration(**json.load(file))
+                except (OSError, ValueError, TypeError) as error:
+                    logging.warning('Could not read the guider calibration from {}: {}'.format(path, error))
+            _calibration_mtime = mtime
+        return _calibration
+
+
+def needs_calibration(declination: float) -> bool:
+    """
+    Parameters
+    ----------
+    declination : FLOAT
+        Declination of the next target in degrees.
+
+    Returns
+    -------
+    BOOL
+        True if guider_calibration is on and there is no calibration, or the stored one was made more than
+        DECLINATION_TOLERANCE degrees away.
+
+    """
+    if not config_reader.get_config().guider_calibration:
+        return False
+    calibration = get_calibration()
+    return calibration is None or abs(calibration.declination - declination) > DECLINATION_TOLERANCE
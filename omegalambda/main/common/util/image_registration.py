@@ -0,0 +1,321 @@
+# Frame-to-frame offsets from FFT phase correlation or from matched stars
+import numpy as np
+from typing import Optional, Tuple, Union
+from scipy import fft
+from scipy.spatial import cKDTree
+
+from . import filereader_utils, fits_scanner
+from ..datatype import star_list
+
+
+def bin_image(image: np.ndarray, factor: int) -> np.ndarray:
+    """
+    Parameters
+    ----------
+    image : NUMPY ARRAY
+        Image data.
+    factor : INT
+        Binning factor.  Rows and columns that do not fill a whole bin are dropped.
+
+    Returns
+    -------
+    NUMPY ARRAY
+        Block-summed image as float32.
+
+    """
+    if factor <= 1:
+        return np.asarray(image, dtype=np.float32)
+    ny, nx = image.shape[0] // factor, image.shape[1] // factor
+    return image[:ny * factor, :nx * factor].reshape(ny, factor, nx, factor).sum(axis=(1, 3), dtype=np.float32)
+
+
+def read_region(path: Union[str, np.ndarray], size: Optional[int] = 512, binning: int = 1) -> np.ndarray:
+    """
+    Description
+    -----------
+    Reads the part of a frame that is registered against the reference: a fixed-size square in the center of the
+    frame (only that part is read from disk), or the whole frame.
+
+    Parameters
+    ----------
+    path : STR or NUMPY ARRAY
+        Path to the fits image, or the image data itself.
+    size : INT, optional
+        Side length in pixels of the central region, or None for the whole frame.  The default is 512.
+    binning : INT, optional
+        Binning factor applied to the region.  The default is 1.
+
+    Returns
+    -------
+    NUMPY ARRAY
+        The region as float32.
+
+    """
+    if size is None:
+        return bin_image(filereader_utils.read_frame(path), binning)
+    if isinstance(path, np.ndarray):
+        ny, nx = path.shape
+    else:
+        header = fits_scanner.read_header(path, ('NAXIS1', 'NAXIS2'))
+        ny, nx = header['NAXIS2'], header['NAXIS1']
+    half = min(size, ny, nx) // 2
+    region, _ = filereader_utils.read_roi(path, nx // 2, ny // 2, half)
+    return bin_image(region, binning)
+
+
+class PhaseReference:
+
+    def __init__(self, reference: np.ndarray):
+        """
+        Description
+        -----------
+        A reference image for phase correlation.  Its windowed Fourier transform is computed once, so measuring the
+        offset of every later frame costs one forward and one inverse FFT of the region: O(N log N) in the number
+        of pixels, and independent of the number of stars.
+
+        Parameters
+        ----------
+        reference : NUMPY ARRAY
+            Reference image (i.e. the region of the first guiding frame).
+
+        Returns
+        -------
+        None.
+
+        """
+        self.shape = reference.shape
+        self.window = np.outer(np.hanning(self.shape[0]), np.hanning(self.shape[1])).astype(np.float32)
+        # Weight of every column of a real FFT in the sum over the full spectrum
+        self._weights = np.full(self.shape[1] // 2 + 1, 2, dtype=np.float32)
+        self._weights[0] = 1
+        if self.shape[1] % 2 == 0:
+            self._weights[-1] = 1
+        self._conjugate = np.conj(self._transform(reference))
+        self._auto = self._autocorrelation_peak(self._conjugate)
+
+    def _transform(self, image: np.ndarray) -> np.ndarray:
+        data = np.asarray(image, dtype=np.float32)
+        data = (data - np.median(data)) * self.window
+        return fft.rfft2(data)
+
+    def _autocorrelation_peak(self, transform: np.ndarray) -> float:
+        # Peak of the correlation of an image with itself: the mean of |F|^2 / sqrt(|F|^2) over the full spectrum
+        return float((np.abs(transform) * self._weights).sum() / (self.shape[0] * self.shape[1]))
+
+    def offset(self, image: np.ndarray) -> Tuple[float, float, float]:
+        """
+        Description
+        -----------
+        Measures how far the image has moved with respect to the reference.  The cross-power spectrum is divided by
+        the square root of its amplitude (rather than the full amplitude of textbook phase correlation), which keeps
+        the correlation peak a few pixels wide, so that a parabola through the peak and its neighbours gives the
+        offset to a few hundredths of a pixel.
+
+        Parameters
+        ----------
+        image : NUMPY ARRAY
+            Image with the same shape as the reference.
+
+        Returns
+        -------
+        dx : FLOAT
+            Offset along x in pixels.  Positive if the image content has moved towards +x.
+        dy : FLOAT
+            Offset along y in pixels.
+        quality : FLOAT
+            Height of the correlation peak normalized like a correlation coefficient: close to 1 for a good match,
+            and close to 0 if the image does not match the reference (i.e. clouds or a different field).
+
+        """
+        if image.shape != self.shape:
+            raise ValueError('Image shape {} does not match the reference shape {}'.format(image.shape, self.shape))
+        transform = self._transform(image)
+        cross = transform * self._conjugate
+        cross /= np.sqrt(np.abs(cross)) + np.finfo(np.float32).tiny
+        correlation = fft.irfft2(cross, s=self.shape)
+        ny, nx = self.shape
+        py, px = np.unravel_index(np.argmax(correlation), self.shape)
+        peak = correlation[py, px]
+        dy = py + _parabola_vertex(correlation[py - 1, px], peak, correlation[(py + 1) % ny, px])
+        dx = px + _parabola_vertex(correlation[py, px - 1], peak, correlation[py, (px + 1) % nx])
+        # Offsets past half of the region wrap around to negative offsets
+        dy = (dy + ny / 2) % ny - ny / 2
+        dx = (dx + nx / 2) % nx - nx / 2
+        auto = np.sqrt(self._auto * self._autocorrelation_peak(transform))
+        quality = float(peak / auto) if auto > 0 else 0.0
+        return float(dx), float(dy), quality
+
+
+def _parabola_vertex(before: float, peak: float, after: float) -> float:
+    curvature = before - 2 * peak + after
+    if curvature >= 0:
+        return 0.0
+    return 0.5 * (before - after) / curvature
+
+
+class StarReference:
+
+    def __init__(self, reference: star_list.StarList, max_shift: float, tolerance: float = 3.0):
+        """
+        Description
+        -----------
+        A reference set of star positions for multi-star guiding.  Every later star list is matched against it with
+        KD-trees, and the shift and rotation of the field are fit to all matched stars at once, with outliers
+        (i.e. a star that saturated, or a cosmic ray) clipped.  Only isolated stars are used, so that no star can be
+        matched to its neighbour.
+
+        Parameters
+        ----------
+        reference : StarList
+            Stars found in the reference image.
+        max_shift : FLOAT
+            Largest shift in pixels between the reference and a later image that will be searched for.
+        tolerance : FLOAT, optional
+            Largest distance in pixels between a reference star, once moved by the shift, and its match.  The
+            default is 3.
+
+        Returns
+        -------
+        None.
+
+        """
+        reference = reference.without_flags(star_list.SATURATED | star_list.BAD_PIXEL)
+        reference = reference.filter(reference.neighbour_distances() > 2 * tolerance)
+        self.stars = reference.sort('peak')
+        self.max_shift = max_shift
+        self.tolerance = tolerance
+        self.positions = self.stars.positions
+        self.center = self.positions.mean(axis=0) if len(self.stars) else np.zeros(2)
+        self._tree = cKDTree(self.positions) if len(self.stars) else None
+
+    def coarse_shift(self, positions: np.ndarray, brightest: int = 50) -> Optional[Tuple[float, float]]:
+        """
+        Description
+        -----------
+        Finds the shift to within the tolerance by letting every pair of bright reference and image stars that are
+        within max_shift of each other vote for their separation.  The true shift gets a vote from every star
+        both lists have in common, while chance pairs are spread out over the whole search area.
+
+        Parameters
+        ----------
+        positions : NUMPY ARRAY
+            (x, y) positions of the image stars, brightest first.
+        brightest : INT, optional
+            Number of stars from each list that vote.  The default is 50.
+
+        Returns
+        -------
+        TUPLE or None
+            (dx, dy) shift in pixels, or None if no pair of stars is within max_shift.
+
+        """
+        reference_tree = cKDTree(self.positions[:brightest])
+        neighbours = reference_tree.query_ball_point(positions[:brightest], r=self.max_shift)
+        votes = [positions[i] - self.positions[j] for i, found in enumerate(neighbours) for j in found]
+        if not votes:
+            return None
+        votes = np.array(votes)
+        edges = np.arange(-self.max_shift, self.max_shift + self.tolerance, self.tolerance)
+        histogram, x_edges, y_edges = np.histogram2d(votes[:, 0], votes[:, 1], bins=(edges, edges))
+        i, j = np.unravel_index(np.argmax(histogram), histogram.shape)
+        center = np.array([(x_edges[i] + x_edges[i + 1]) / 2, (y_edges[j] + y_edges[j + 1]) / 2])
+        close = np.hypot(*(votes - center).T) <= self.tolerance
+        return tuple(np.median(votes[close], axis=0))
+
+    def offset(self, stars: star_list.StarList) -> Tuple[float, float, float, int]:
+        """
+        Description
+        -----------
+        Measures how far the field has moved and rotated with respect to the reference.
+
+        Parameters
+        ----------
+        stars : StarList
+            Stars found in the new image.
+
+        Returns
+        -------
+        dx : FLOAT
+            Shift along x in pixels of the center of the reference stars.  Positive if the stars have moved towards
+            +x.
+        dy : FLOAT
+            Shift along y in pixels.
+        rotation : FLOAT
+            Rotation of the field around that center in radians, counterclockwise.
+        n_matched : INT
+            Number of stars the fit used.  0 if the image could not be matched to the reference at all.
+
+        """
+        stars = stars.without_flags(star_list.SATURATED | star_list.BAD_PIXEL).sort('peak')
+        if self._tree is None or len(stars) == 0:
+            return 0.0, 0.0, 0.0, 0
+        positions = stars.positions
+        shift = self.coarse_shift(positions)
+        if shift is None:
+            return 0.0, 0.0, 0.0, 0
+        # Nearest image star for every shifted reference star, keeping only one reference star per image star
+        distance, index = cKDTree(positions).query(self.positions + shift, distance_upper_bound=self.tolerance)
+        matched = np.isfinite(distance)
+        reference_index = np.flatnonzero(matched)
+        order = np.argsort(distance[matched], kind='stable')
+        _, first = np.unique(index[matched][order], return_index=True)
+        reference_index = reference_index[order][first]
+        return fit_rigid(self.positions[reference_index], positions[index[reference_index]], self.center)
+
+
+def fit_rigid(reference: np.ndarray, positions: np.ndarray, center: Optional[np.ndarray] = None, nsigma: float = 3,
+              iterations: int = 3) -> Tuple[float, float, float, int]:
+    """
+    Description
+    -----------
+    Least-squares shift and rotation between matched star positions, with sigma clipping of the residuals.
+
+    Parameters
+    ----------
+    reference : NUMPY ARRAY
+        (x, y) positions of the matched reference stars.
+    positions : NUMPY ARRAY
+        (x, y) positions of the same stars in the new image.
+    center : NUMPY ARRAY, optional
+        (x, y) point that the returned shift is measured at.  The default is None, for the mean of the reference
+        positions.
+    nsigma : FLOAT, optional
+        Residuals more than nsigma robust standard deviations (1.4826 x the median absolute deviation) from zero are
+        clipped.  The default is 3.
+    iterations : INT, optional
+        Number of clipping passes.  The default is 3.
+
+    Returns
+    -------
+    TUPLE
+        (dx, dy, rotation, number of stars used), see StarReference.offset.  Fewer than 2 stars give the median
+        shift and no rotation.
+
+    """
+    if len(reference) == 0:
+        return 0.0, 0.0, 0.0, 0
+    if center is None:
+        center = reference.mean(axis=0)
+    if len(reference) < 2:
+        dx, dy = np.median(positions - reference, axis=0)
+        return float(dx), float(dy), 0.0, len(reference)
+    use = np.ones(len(reference), dtype=bool)
+    for _ in range(iterations + 1):
+        mean = reference[use].mean(axis=0)
+        a = reference[use] - mean
+        b = positions[use] - positions[use].mean(axis=0)
+        rotation = np.arctan2((a[:, 0] * b[:, 1] - a[:, 1] * b[:, 0]).sum(), (a * b).sum())
+        cos, sin = np.cos(rotation), np.sin(rotation)
+        rotate = np.array([[cos, -sin], [sin, cos]])
+        # Rotating around the mean of the used stars, then moving by this, maps the reference onto the image
+        translation = positions[use].mean(axis=0) - mean
+        residual = np.hypot(*(positions - (reference - mean) @ rotate.T - mean - translation).T)
+        # Floor of 0.05 px so that a perfect match does not clip every star
+        limit = max(nsigma * 1.4826 * np.median(residual[use]), 0.05)
+        keep = residual <= limit
+        if keep.sum() < 2 or np.array_equal(keep, use):
+            break
+        use = keep
+    # Where the center ends up, minus where it started
+    shift = (center - mean) @ rotate.T + mean + translation - center
+    return float(shift[0]), float(shift[1]), float(rotation), int(use.sum())
@@ -0,0 +1,116 @@
+# Reusable scratch buffers for full-frame image analysis
+import logging
+import threading
+import contextlib
+import numpy as np
+from typing import Dict, List, Tuple
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class ScratchPool:
+
+    def __init__(self, max_buffers: int = 2, dtype=np.float32):
+        """
+        Description
+        -----------
+        A thread-safe pool of preallocated full-frame arrays.  Frame analysis borrows a buffer, does its arithmetic
+        in place, and hands the buffer back, so a night of frames reuses the same memory instead of allocating
+        (and freeing) a fresh float image for every step of every frame.
+
+        Parameters
+        ----------
+        max_buffers : INT, optional
+            Number of buffers kept per frame shape, i.e. the number of frames that can be analyzed concurrently
+            without allocating.  Requests beyond this get a temporary array.  The default is 2.
+        dtype : NUMPY DTYPE, optional
+            Data type of the buffers.  The default is np.float32.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.max_buffers = max_buffers
+        self.dtype = np.dtype(dtype)
+        self.allocations = 0
+        self._free: Dict[Tuple[int, ...], List[np.ndarray]] = {}
+        self._count: Dict[Tuple[int, ...], int] = {}
+        self._lock = threading.Lock()
+
+    def _acquire(self, shape: Tuple[int, ...]) -> np.ndarray:
+        with self._lock:
+            free = self._free.setdefault(shape, [])
+            if free:
+                return free.pop()
+            if self._count.get(shape, 0) < self.max_buffers:
+                self._count[shape] = self._count.get(shape, 0) + 1
+                self.allocations += 1
+                logging.debug('Allocating a {} {} scratch buffer'.format(shape, self.dtype))
+                return np.empty(shape, dtype=self.dtype)
+        # Pool exhausted: hand out an array that is simply dropped on release
+        return np.empty(shape, dtype=self.dtype)
+
+    def _release(self, shape: Tuple[int, ...], buffer: np.ndarray):
+        with self._lock:
+            free = self._free.setdefault(shape, [])
+            if len(free) < self._count.get(shape, 0):
+                free.append(buffer)
+
+    @contextlib.contextmanager
+    def buffer(self, shape: Tuple[int, ...]):
+        """
+        Description
+        -----------
+        Lends out a buffer of the given shape for the duration of a with block.  The contents are undefined on
+        entry, and no reference to the buffer may be kept after the block ends.
+
+        Parameters
+        ----------
+        shape : TUPLE
+            Shape of the buffer, normally the shape of the frame being analyzed.
+
+        Yields
+        ------
+        buffer : NUMPY ARRAY
+            Uninitialized array of the requested shape and the pool's dtype.
+
+        """
+        shape = tuple(shape)
+        buffer = self._acquire(shape)
+        try:
+            yield buffer
+        finally:
+            self._release(shape, buffer)
+
+    def clear(self):
+        """
+        Description
+        -----------
+        Frees all idle buffers, i.e. after the camera binning or subframe size changes.
+
+        Returns
+        -------
+        None.
+
+        """
+        with self._lock:
+            for shape, free in self._free.items():
+                self._count[shape] -= len(free)
+            self._free.clear()
+
+
+def get_pool() -> ScratchPool:
+    """
+    Returns
+    -------
+    _pool : CLASS INSTANCE OBJECT of ScratchPool
+        Process-wide float32 scratch buffer pool, created on first use.
+
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ScratchPool()
+    return _pool
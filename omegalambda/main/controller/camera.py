@@ -3,9 +3,10 @@ import threading
 import logging
 import pywintypes
 import win32com.client
-from typing import Optional, Union
+from typing import Optional, Tuple, Union
 
 from .hardware import Hardware
+from ..common.util import analysis_service, frame_feed
 
 
 class Camera(Hardware):
@@ -21,8 +22,11 @@ class Camera(Hardware):
         """
         self.cooler_settle = threading.Event()
         self.image_done = threading.Event()
-        self.camera_lock = threading.Lock()
+        # Reentrant, so a safety command run during a cooperative wait can take it again
+        self.camera_lock = threading.RLock()
+        self.exposure_aborted = False
         self.fwhm: Optional[Union[float, int]] = None
+        self.image_shape: Optional[Tuple[float, float, int]] = None
         super(Camera, self).__init__(name='Camera')
 
     def check_connection(self):
@@ -186,15 +190,21 @@ class Camera(Hardware):
         """
         Description
         -----------
-        Checks to see if the previous image is ready for downloading.
+        Checks to see if the previous image is ready for downloading.  Safety commands, like abort, are run while
+        waiting.
 
         Returns
         -------
-        None.
+        bool
+            True if the image is ready, False if the exposure was aborted or the camera crashed.
         """
-        while self.Camera.ImageReady is False and self.crashed.isSet() is False:
-            time.sleep(1)
-        if self.Camera.ImageReady:
+        while self.wait_until(lambda: self.Camera.ImageReady is not False or self.crashed.isSet() or
+                              self.exposure_aborted, interval=1):
+            # A safety command ran: the exposure goes on unless it was an abort, which the condition picks up
+            continue
+        if self.exposure_aborted:
+            return False
+        elif self.Camera.ImageReady:
             return True
         elif self.crashed.isSet():
             self.disconnect()
@@ -205,13 +215,15 @@ class Camera(Hardware):
         Description
         -----------
         Sets the self.fwhm property to the FLOAT value that is the fwhm of the brightest star in
-        the newest CCD exposure.  [Cannot return due to multithreading].
+        the newest CCD exposure.
 
         Returns
         -------
-        None.
+        fwhm : FLOAT
+            The fwhm, also available from the future returned by onThread.
         """
         self.fwhm = self.Camera.fwhm
+        return self.fwhm
 
     def expose(self, exposure_time, filter, save_path=None, type="light", **header_kwargs):
         """
@@ -227,6 +239,8 @@ class Camera(Hardware):
         type : STR, INT optional
             Image type to be taken. Posssible ARGS:
             "light", "dark", 1, 0. The default is "light".
+        **header_kwargs : ANY
+            FITS header keywords and values to add to the image.
 
         Returns
         -------
@@ -240,6 +254,7 @@ class Camera(Hardware):
                 logging.error("Invalid exposure type.")
                 return
             logging.debug('Exposing image')
+            self.exposure_aborted = False
             self.Camera.SetFullFrame()
             self.Camera.Expose(exposure_time, type, filter)
             check = self._image_ready()
@@ -250,9 +265,89 @@ class Camera(Hardware):
                 return
             elif check:
                 self.Camera.SaveImage(save_path)
+                # Measured in the analysis service once the frame is saved, so the camera never waits on it
+                shape = self.measure_image_shape(save_path) if type == 1 else None
+                frame_feed.get_feed().publish(save_path, exposure_time=exposure_time, filter=filter,
+                                              light=type == 1, header=dict(header_kwargs), shape=shape)
                 self.image_done.set()
                 self.image_done.clear()
                 
+    def measure_image_shape(self, path):
+        """
+        Description
+        -----------
+        Starts measuring the star shapes (see filereader_utils.frame_shape) of a saved light frame in the analysis
+        service, so that neither the measurement nor a transfer of the camera's image buffer holds up the camera
+        thread.  self.image_shape is updated once the measurement is done.  Only a diagnostic: a failed measurement
+        is logged and otherwise ignored.
+
+        Parameters
+        ----------
+        path : STR
+            File path of the saved fits image.
+
+        Returns
+        -------
+        FUTURE or None
+            Resolves to (median ellipticity, median position angle of the major axis in degrees from the +x axis,
+            number of stars measured), or None if the analysis service is not running.
+        """
+        service = analysis_service.get_service()
+        if service is None:
+            return None
+        try:
+            future = service.frame_shape(path, self.config_dict.saturation)
+        except Exception as exc:
+            logging.warning('Could not measure star shapes: {}'.format(exc))
+            return None
+        future.add_done_callback(self._store_image_shape)
+        return future
+
+    def _store_image_shape(self, future):
+        """
+        Description
+        -----------
+        Done callback of the measurement started by measure_image_shape, which stores it in self.image_shape.
+
+        Parameters
+        ----------
+        future : concurrent.futures.Future
+            The finished measurement.
+
+        Returns
+        -------
+        None.
+        """
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            logging.warning('Could not measure star shapes: {}'.format(future.exception()))
+            self.image_shape = None
+            return
+        self.image_shape = ellipticity, angle, n_stars = future.result()
+        if n_stars:
+            logging.debug('Star shapes: ellipticity {:.3f}, position angle {:.1f} deg over {} stars'.format(
+                ellipticity, angle, n_stars))
+
+    def abort(self):
+        """
+        Description
+        -----------
+        Aborts the exposure in progress, which is then not saved.  Meant to be put on the queue with
+        priority=PRIORITY_SAFETY, so it runs during the exposure instead of after it.
+
+        Returns
+        -------
+        None.
+        """
+        try:
+            self.Camera.AbortExposure()
+        except (AttributeError, pywintypes.com_error) as exc:
+            logging.error('Could not abort the exposure.  Exception: {}'.format(exc))
+        else:
+            logging.warning('Exposure aborted')
+        self.exposure_aborted = True
+
     def disconnect(self):
         """
         Description
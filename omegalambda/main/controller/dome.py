@@ -21,7 +21,8 @@ class Dome(Hardware):
         """
         self.move_done = threading.Event()
         self.shutter_done = threading.Event()
-        self.dome_move_lock = threading.Lock()
+        # Reentrant, so a safety command run during a cooperative wait can take it again
+        self.dome_move_lock = threading.RLock()
         self.shutter = None
         super(Dome, self).__init__(name='Dome')
 
@@ -68,17 +69,19 @@ class Dome(Hardware):
         Description
         -----------
         Checks to see if the dome is ready to receive a new command, else
-        it waits.
+        it waits.  Safety commands, like park or closing the shutter, are run while waiting.
 
         Returns
         -------
-        None.
+        BOOL
+            True once the dome is ready, False if a safety command was run in the meantime, in which case the
+            caller must abandon its move instead of undoing the safety command.
 
         """
-        while self.Dome.Slewing:
-            time.sleep(2)
-        if not self.Dome.Slewing:
-            return
+        if self.wait_until(lambda: not self.Dome.Slewing, interval=2):
+            logging.warning('A safety command was run on the dome...abandoning the current move.')
+            return False
+        return True
         
     def shutter_position(self):
         """
@@ -88,11 +91,13 @@ class Dome(Hardware):
 
         Returns
         -------
-        None.
+        shutter : INT
+            Shutter status: 0 = open, 1 = closed, 2 = opening, 3 = closing, 4 = error.
 
         """
         # Shutter status: 0 = open, 1 = closed, 2 = opening, 3 = closing, 4 = error.
         self.shutter = self.Dome.ShutterStatus
+        return self.shutter
     
     def home(self):
         """
@@ -105,7 +110,8 @@ class Dome(Hardware):
         None.
 
         """
-        self._is_ready()
+        if not self._is_ready():
+            return
         try:
             with self.dome_move_lock:
                 self.Dome.FindHome()
@@ -113,8 +119,8 @@ class Dome(Hardware):
             logging.error('Dome cannot find home')
         else: 
             logging.info("Dome is homing")
-            while not self.Dome.AtHome:
-                time.sleep(2)
+            if self.wait_until(lambda: self.Dome.AtHome, interval=2):
+                logging.warning('A safety command was run on the dome...stopped waiting for it to find home.')
             return
     
     def park(self):
@@ -136,16 +142,18 @@ class Dome(Hardware):
             return True
         try:
             with self.dome_move_lock:
-                self._is_ready()
+                if not self._is_ready():
+                    self.move_done.set()
+                    return False
                 self.Dome.Park()
         except pywintypes.com_error:
             logging.error("Error parking dome")
             return False
         else: 
             logging.info("Dome is parking")
-            self._is_ready()
+            ready = self._is_ready()
             self.move_done.set()
-            return True
+            return ready
         
     def move_shutter(self, open_or_close):
         """
@@ -157,49 +165,57 @@ class Dome(Hardware):
 
         Returns
         -------
-        None.
+        bool
+            True if the shutter moved, False if the move was abandoned because a safety command (i.e. closing the
+            shutter) was run while waiting, or the command was invalid.
         """
         self.shutter_done.clear()
-        self._is_ready()
+        if not self._is_ready():
+            self.shutter_done.set()
+            return False
         if open_or_close == 'open':
             with self.dome_move_lock:
                 self.Dome.OpenShutter()
                 logging.info("Shutter is opening")
                 time.sleep(2)
-            t = 0
-            while self.Dome.ShutterStatus in (1, 2, 4):
-                time.sleep(5)
-                t += 5
-                if t >= 5*60:
-                    logging.warning('Shutter is still opening...ASCOM may be incorrectly reporting status.')
-                    break
+            deadline = time.monotonic() + 5*60
+            if self.wait_until(lambda: self.Dome.ShutterStatus not in (1, 2, 4) or time.monotonic() >= deadline,
+                               interval=5):
+                logging.warning('A safety command was run on the dome...no longer opening the shutter.')
+                self.shutter_done.set()
+                return False
+            if self.Dome.ShutterStatus in (1, 2, 4):
+                logging.warning('Shutter is still opening...ASCOM may be incorrectly reporting status.')
             time.sleep(2)
             if self.Dome.ShutterStatus in (0, 2, 4):
                 self.shutter_done.set()
             else:
                 logging.error('Dome did not open correctly.  Trying again...')
-                self.move_shutter('open')
+                return self.move_shutter('open')
         elif open_or_close == 'close':
             with self.dome_move_lock:
                 self.Dome.CloseShutter()
                 logging.info("Shutter is closing")
                 time.sleep(2)
-            t = 0
-            while self.Dome.ShutterStatus in (0, 3, 4):
-                time.sleep(5)
-                t += 5
-                if t >= 5*60:
-                    logging.warning('Shutter is still closing...ASCOM may be incorrectly reporting status.')
-                    break
+            deadline = time.monotonic() + 5*60
+            if self.wait_until(lambda: self.Dome.ShutterStatus not in (0, 3, 4) or time.monotonic() >= deadline,
+                               interval=5):
+                logging.warning('A safety command was run on the dome...no longer closing the shutter.')
+                self.shutter_done.set()
+                return False
+            if self.Dome.ShutterStatus in (0, 3, 4):
+                logging.warning('Shutter is still closing...ASCOM may be incorrectly reporting status.')
             time.sleep(2)
             if self.Dome.ShutterStatus in (1, 3, 4):
                 self.shutter_done.set()
             else:
                 logging.error('Dome did not close correctly.  Trying again...')
-                self.move_shutter('close')
+                return self.move_shutter('close')
         else:
             logging.critical("Invalid shutter move command")
-        return
+            self.shutter_done.set()
+            return False
+        return True
     
     def slave_dome_to_scope(self, toggle):
         """
@@ -214,7 +230,9 @@ class Dome(Hardware):
         None.
         """
         self.move_done.clear()
-        self._is_ready()
+        if not self._is_ready():
+            self.move_done.set()
+            return
         if toggle is True:
             try:
                 with self.dome_move_lock:
@@ -223,10 +241,10 @@ class Dome(Hardware):
                 logging.error("Cannot sync dome to scope")
             else: 
                 logging.info("Dome is syncing to scope")
-                self._is_ready()
                 # Extra wait in case the dome pauses in the middle of syncing
-                time.sleep(5)
-                self._is_ready()
+                if self._is_ready():
+                    time.sleep(5)
+                    self._is_ready()
                 self.move_done.set()
         elif toggle is False:
             try:
@@ -250,7 +268,9 @@ class Dome(Hardware):
         None.
         """
         self.move_done.clear()
-        self._is_ready()
+        if not self._is_ready():
+            self.move_done.set()
+            return
         try:
             with self.dome_move_lock:
                 self.Dome.SlewtoAzimuth(azimuth)
@@ -287,9 +307,9 @@ class Dome(Hardware):
             Dome has disconnected.
 
         """
-        self._is_ready()
-        while self.Dome.ShutterStatus != 1:
-            time.sleep(5)
+        # Safety commands (i.e. closing the shutter) run in the meantime only help the dome get ready to disconnect
+        while self.wait_until(lambda: not self.Dome.Slewing and self.Dome.ShutterStatus == 1, interval=5):
+            continue
         if self.Dome.AtPark and self.Dome.ShutterStatus == 1:
             try: 
                 self.Dome.Connected = False
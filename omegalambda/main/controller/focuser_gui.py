@@ -1,6 +1,7 @@
 import mttkinter.mtTkinter as tk
 import threading
 
+from .hardware import PRIORITY_SAFETY
 from ..common.IO import config_reader
 
 
@@ -73,7 +74,7 @@ class Gui(threading.Thread):
         -------
         None
         """
-        self.focuser.onThread(self.focuser.abort)
+        self.focuser.onThread(self.focuser.abort, priority=PRIORITY_SAFETY)
 
     def update_labels(self):
         """
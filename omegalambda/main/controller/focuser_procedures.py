@@ -5,13 +5,17 @@ import time
 import threading
 import numpy as np
 import datetime
+from concurrent import futures
 from scipy.optimize import curve_fit
 import matplotlib.pyplot as plt
 
-from .hardware import Hardware
+from .hardware import Hardware, PRIORITY_BACKGROUND
 from ..common.IO import config_reader
 from ..common.util import filereader_utils
 
+# Seconds to wait for the focuser or camera to answer a query before giving up
+QUERY_TIMEOUT = 30
+
 np.warnings.filterwarnings('ignore')
 
 
@@ -75,12 +79,37 @@ class FocusProcedures(Hardware):
         """
         Returns
         -------
-        FLOAT or INT : The temperature value as read by the focuser class.
+        FLOAT or INT : The temperature value as read by the focuser class, or None if the focuser did not answer.
         """
-        self.focuser.onThread(self.focuser.get_temperature)
-        self.focuser.adjusting.wait()
-        time.sleep(1)
-        return self.focuser.temperature
+        return self.query(self.focuser.onThread(self.focuser.get_temperature, priority=PRIORITY_BACKGROUND),
+                          'the focuser temperature')
+
+    @staticmethod
+    def query(future, description):
+        """
+        Parameters
+        ----------
+        future : concurrent.futures.Future
+            The future onThread returned for a query to the focuser or camera.
+        description : STR
+            What is being queried, for the log.
+
+        Returns
+        -------
+        ANY
+            The answer, or None if the device did not answer within QUERY_TIMEOUT, its thread has stopped (which
+            cancels every query put on it), or the query raised an error.
+
+        """
+        try:
+            return future.result(timeout=QUERY_TIMEOUT)
+        except futures.TimeoutError:
+            logging.warning('Could not read {}: no answer within {} seconds.'.format(description, QUERY_TIMEOUT))
+        except futures.CancelledError:
+            logging.warning('Could not read {}: the device thread has stopped.'.format(description))
+        except Exception as exc:
+            logging.warning('Could not read {}: {}'.format(description, exc))
+        return None
 
     def startup_focus_procedure(self, exp_time, _filter, image_path):
         """
@@ -108,10 +137,11 @@ class FocusProcedures(Hardware):
         if not os.path.exists(os.path.join(image_path, r'focuser_images')):
             os.mkdir(os.path.join(image_path, r'focuser_images'))
         # Creates new sub-directory for focuser images
-        self.focuser.onThread(self.focuser.current_position)
-        self.focuser.adjusting.wait()
-        time.sleep(2)
-        initial_position = self.focuser.position
+        initial_position = self.query(self.focuser.onThread(self.focuser.current_position), 'the focuser position')
+        if initial_position is None:
+            logging.error('Focus procedures cannot continue without the focuser position.')
+            self.focused.set()
+            return
         fwhm_values = []
         focus_positions = []
         peaks = []
@@ -134,12 +164,15 @@ class FocusProcedures(Hardware):
             self.camera.onThread(self.camera.expose, exp_time, _filter, save_path=path, type="light")
             self.camera.image_done.wait()
             time.sleep(2)
-            self.focuser.onThread(self.focuser.current_position)
-            self.camera.onThread(self.camera.get_fwhm)
-            time.sleep(2)
-            current_position = self.focuser.position
+            position = self.focuser.onThread(self.focuser.current_position)
+            camera_fwhm = self.camera.onThread(self.camera.get_fwhm)
             fwhm_test, peak, saturated = filereader_utils.radial_average(path, self.config_dict.saturation)
-            fwhm = self.camera.fwhm if self.camera.fwhm and not saturated else fwhm_test
+            current_position = self.query(position, 'the focuser position')
+            camera_fwhm = self.query(camera_fwhm, 'the camera FWHM')
+            if current_position is None:
+                logging.error('The focuser stopped answering...focus procedures cannot continue.')
+                break
+            fwhm = camera_fwhm if camera_fwhm and not saturated else fwhm_test
             if abs(current_position - initial_position) >= self.config_dict.focus_max_distance:
                 logging.error('Focuser has stepped too far away from initial position and could not find a focus.')
                 break
@@ -185,10 +218,9 @@ class FocusProcedures(Hardware):
             self.focuser.adjusting.wait(timeout=30)
 
         self.focused.set()
-        self.focuser.onThread(self.focuser.current_position)
-        time.sleep(2)
         self.temp_previous = self.conditions.temperature
-        self.position_previous = self.focuser.position
+        self.position_previous = self.query(self.focuser.onThread(self.focuser.current_position),
+                                            'the focuser position')
         return
 
     @staticmethod
@@ -269,9 +301,8 @@ class FocusProcedures(Hardware):
             if temp_current is None:
                 continue
             if self.position_previous is None:
-                self.focuser.onThread(self.focuser.current_position)
-                time.sleep(2)
-                self.position_previous = self.focuser.position
+                self.position_previous = self.query(self.focuser.onThread(self.focuser.current_position),
+                                                    'the focuser position')
                 continue
             if self.temp_previous is None or (temp_current - self.temp_previous > 10):
                 self.temp_previous = temp_current
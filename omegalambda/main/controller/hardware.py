@@ -1,17 +1,23 @@
 # Hardware class to be inherited by camera, telescope, dome, etc.
+import time
 import threading
 import queue
-import time
 import logging
+import itertools
+from concurrent import futures
 
 import pythoncom
 
 from ..common.IO import config_reader
 
+# Lanes of the command queue: a command runs before every command in a lower lane (higher number), and in the order
+# it was put on the queue within its own lane
+PRIORITY_SAFETY = 0         # Aborts, stops, parks and closing the shutter
+PRIORITY_NORMAL = 1
+PRIORITY_BACKGROUND = 2     # Periodic housekeeping reads that can wait behind everything else
 
-class Hardware(threading.Thread):
 
-    timeout = 1.0/60
+class Hardware(threading.Thread):
 
     def __init__(self, name):
         """
@@ -28,7 +34,16 @@ class Hardware(threading.Thread):
         None.
 
         """
-        self.q = queue.Queue()
+        self.q = queue.PriorityQueue()
+        # Breaks ties within a lane, so commands of the same priority keep their order
+        self.q_counter = itertools.count()
+        # Set while a safety command is waiting on the queue, so a running cooperative wait can give way to it
+        self.safety_pending = threading.Event()
+        # Priority of the command running on the thread, or None if it is idle
+        self.running_priority = None
+        # Set once the thread has stopped taking function calls, after which onThread cancels them at once
+        self.queue_closed = False
+        self.queue_lock = threading.Lock()
         self.label = name
         self.stopping = threading.Event()
         self.crashed = threading.Event()
@@ -43,13 +58,21 @@ class Hardware(threading.Thread):
         self.config_dict = config_reader.get_config()  # Gets the config object as a class variable
         self.live_connection = threading.Event()
 
-    def onThread(self, function, *args, **kwargs):
+    def onThread(self, function, *args, priority=PRIORITY_NORMAL, **kwargs):
         """
         Description
         -----------
         Used to put a function on a specific thread other than the main thread.  This will put said function
-        on that thread's queue and will be called as soon as the thread is ready to receive such a request.  Threads
-        check for new function calls once every second when they are not already running a function.
+        on that thread's queue and will be called as soon as the thread is ready to receive such a request.  An idle
+        thread is blocked on its queue, so it wakes up and runs the function at once.  The returned future gets the
+        function's return value, or the exception it raised, so instead of sleeping and then reading an attribute
+        the function set, callers can wait on future.result(timeout=...) (or await asyncio.wrap_future(future)).
+
+        Commands run lane by lane: a safety command runs before any normal or background command still on the queue,
+        and is also run from inside a cooperative wait (see wait_until) of the command that is running, so an abort
+        or park does not have to wait for an exposure or dome move to finish.  A call that blocks in the driver
+        (i.e. Telescope.slew, which uses the synchronous SlewToCoordinates) is not a wait: the safety command runs
+        once the call has returned.
 
         Parameters
         ----------
@@ -58,16 +81,29 @@ class Hardware(threading.Thread):
             appropriate thread.
         *args : ANY
             The arguments to be passed to the class method.
+        priority : INT, optional
+            PRIORITY_SAFETY, PRIORITY_NORMAL or PRIORITY_BACKGROUND.  The default is PRIORITY_NORMAL.
         **kwargs : ANY
             The keyword arguments to be passed to the class method.
 
         Returns
         -------
-        None.
+        future : concurrent.futures.Future
+            Resolved once the function has run.  It is cancelled if the thread stops or crashes before getting to
+            the function, and the caller may cancel it while it is still waiting on the queue.
 
         """
-        self.q.put((function, args, kwargs))
+        future = futures.Future()
+        with self.queue_lock:
+            if self.queue_closed:
+                future.cancel()
+                logging.debug('{} was not run, because the {} thread has stopped'.format(function, self.label))
+                return future
+            self.q.put((priority, next(self.q_counter), (future, function, args, kwargs)))
+            if priority == PRIORITY_SAFETY:
+                self.safety_pending.set()
         logging.debug('A class method has been put on the {} queue'.format(self.label))
+        return future
 
     def _class_connect(self):
         """
@@ -87,10 +123,14 @@ class Hardware(threading.Thread):
         -----------
         Started by calling Hardware.start() [as a subclass of threading.Thread].
         Creates a hardware-specific thread for the camera, telescope, or dome that dispatches the
-        correct COM object and starts a loop that continuously checks the queue to see if any
-        function calls have been passed via onThread.
+        correct COM object and starts a loop that waits on the queue for function calls passed via onThread,
+        running each one as soon as it arrives.  An exception raised by a function is passed to its future, and
+        still ends the thread.  The thread monitor only logs that the thread has crashed, it does not restart it:
+        from then on every function call put on the queue is cancelled at once, so callers waiting on
+        future.result() get a CancelledError and have to handle it.
 
-        Only stops once self.running has been set to False by calling self.stop.
+        Only stops once self.stopping has been set by calling self.stop.  Function calls still on the queue when
+        the thread ends are cancelled.
 
         Returns
         -------
@@ -98,26 +138,150 @@ class Hardware(threading.Thread):
 
         """
         pythoncom.CoInitialize()
-        if not self._class_connect():
+        try:
+            if not self._class_connect():
+                return
+            while not self.stopping.isSet():
+                priority, _, command = self.q.get()
+                if command is None:
+                    # Put on the queue by stop, to wake the thread up
+                    continue
+                self._run_command(priority, command)
+        finally:
+            self._close_queue()
             pythoncom.CoUninitialize()
+
+    def _run_command(self, priority, command):
+        """
+        Description
+        -----------
+        Runs a command taken from the queue and resolves its future.
+
+        Parameters
+        ----------
+        priority : INT
+            The lane the command was taken from.
+        command : TUPLE
+            (future, function, args, kwargs), as put on the queue by onThread.
+
+        Returns
+        -------
+        None.
+
+        """
+        future, function, args, kwargs = command
+        if not future.set_running_or_notify_cancel():
+            # Cancelled by the caller while it was on the queue
             return
-        while not self.stopping.isSet():
-            #logging.debug("{0:s} thread is alive".format(self.label))
+        outer_priority = self.running_priority
+        self.running_priority = priority
+        try:
+            result = function(*args, **kwargs)
+        except BaseException as exception:
+            future.set_exception(exception)
+            raise
+        finally:
+            self.running_priority = outer_priority
+        future.set_result(result)
+        logging.debug('{} has been run on the {} thread'.format(function, self.label))
+
+    def _run_safety_commands(self):
+        """
+        Description
+        -----------
+        Runs the safety commands waiting on the queue, from inside the command that is running.  Commands from the
+        other lanes are left on the queue in their order.  Does nothing when the running command is itself a safety
+        command, so safety commands never interrupt each other and keep their order.  Must be called on this thread.
+
+        Returns
+        -------
+        bool
+            True if any safety command was run.
+
+        """
+        if self.running_priority == PRIORITY_SAFETY:
+            return False
+        ran = False
+        with self.queue_lock:
+            self.safety_pending.clear()
+        while True:
             try:
-                function, args, kwargs = self.q.get(timeout=self.timeout)
-                function(*args, **kwargs)
-                logging.debug('{} has been run on the {} thread'.format(function, self.label))
+                priority, count, command = self.q.get(block=False)
             except queue.Empty:
-                time.sleep(1)
-        pythoncom.CoUninitialize()
+                return ran
+            if priority != PRIORITY_SAFETY:
+                # The queue is ordered by lane, so there are no safety commands left
+                self.q.put((priority, count, command))
+                return ran
+            if command is None:
+                # Woken up by stop: hand it back to run
+                self.q.put((priority, count, command))
+                return ran
+            logging.info('Running a safety command on the {} thread ahead of the current one'.format(self.label))
+            self._run_command(priority, command)
+            ran = True
+
+    def wait_until(self, condition, interval=1):
+        """
+        Description
+        -----------
+        Cooperative wait for device methods: checks condition every interval seconds until it is True.  Safety
+        commands put on the queue in the meantime are run straight away, instead of after the waiting command, and
+        the wait ends as soon as they have: a safety command (i.e. closing the shutter or parking) usually undoes
+        what the waiting command was about to do next, so the waiting command has to give up instead of carrying
+        on with its move.
+
+        Parameters
+        ----------
+        condition : CALLABLE
+            Called with no arguments, returns True once the wait is over.
+        interval : INT or FLOAT, optional
+            Seconds between checks of condition.  The default is 1.
+
+        Returns
+        -------
+        bool
+            True if the wait was cut short because a safety command was run, False once condition is True.
+
+        """
+        # Commands can only be run on this thread, and a safety command does not give way to another one
+        cooperative = threading.current_thread() is self
+        while not condition():
+            if not cooperative or self.running_priority == PRIORITY_SAFETY:
+                time.sleep(interval)
+            elif self.safety_pending.wait(timeout=interval) and self._run_safety_commands():
+                return True
+        return False
+
+    def _close_queue(self):
+        """
+        Description
+        -----------
+        Stops onThread from taking function calls, and cancels the ones still on the queue, so nothing waits on
+        them forever.
+
+        Returns
+        -------
+        None.
+
+        """
+        with self.queue_lock:
+            self.queue_closed = True
+        while True:
+            try:
+                _, _, command = self.q.get(block=False)
+            except queue.Empty:
+                break
+            if command is not None:
+                command[0].cancel()
         
     def stop(self):
         """
         Description
         -----------
-        Sets self.running to False, which stops the run method from executing.
-        Should be called via onThread, otherwise a thread may be stopped before it can finish executing a previous
-        function call.
+        Sets self.stopping, which stops the run method from executing, and wakes the thread up if it is waiting
+        on its queue.  Should be called via onThread, otherwise a thread may be stopped before it can finish
+        executing a previous function call.
 
         Returns
         -------
@@ -126,6 +290,7 @@ class Hardware(threading.Thread):
         """
         logging.debug("Stopping {} thread".format(self.label))
         self.stopping.set()
+        self.q.put((PRIORITY_SAFETY, next(self.q_counter), None))
         
     def check_connection(self):
         """
@@ -141,22 +306,3 @@ class Hardware(threading.Thread):
         """
         logging.info('Checking connection for the {}'.format(self.label))
         raise NotImplementedError
-
-    @classmethod
-    def new_loop_time(cls, loop_time):
-        """
-        Description
-        -----------
-        Resets the Hardware loop time to the specified value for all Hardware classes.
-
-        Parameters
-        ----------
-        loop_time : INT or FLOAT
-            How quickly the queue will loop and check for new functions to execute, in seconds.
-
-        Returns
-        -------
-        None
-
-        """
-        cls.timeout = loop_time
@@ -6,9 +6,16 @@ import pywintypes
 import win32com.client
 
 from ..common.util import conversion_utils
+from ..common.util import guider_calibration
 from ..common.util import time_utils
 from .hardware import Hardware
 
+# ASCOM GuideDirections values
+PULSE_DIRECTIONS = {"north": 0, "south": 1, "east": 2, "west": 3}
+# Seconds between checks of whether a pulse guide has finished, and how long past its duration to keep waiting
+PULSE_POLL_INTERVAL = 0.05
+PULSE_TIMEOUT = 5
+
 
 class Telescope(Hardware):
     
@@ -22,9 +29,12 @@ class Telescope(Hardware):
 
         """
         self.slew_done = threading.Event()
-        self.movement_lock = threading.Lock()
+        # Reentrant, so a safety command run during a cooperative wait can take it again
+        self.movement_lock = threading.RLock()
         self.last_slew_status = None
         self.ra = self.dec = None
+        self.mount_guide_rates = None
+        self.last_pulses = []
         # Threading event sets flags and allows threads to interact with each other
         super(Telescope, self).__init__(name='Telescope')       # Calls Hardware.__init__ with the name 'Telescope'
 
@@ -111,17 +121,40 @@ class Telescope(Hardware):
         """
         Description
         -----------
-        Affirms that the telescope is done slewing and ready for another command before continuing.
+        Affirms that the telescope is done slewing and ready for another command before continuing.  Safety
+        commands, like abort or park, are run while waiting.
 
         Returns
         -------
-        None.
+        BOOL
+            True once the telescope is ready, False if a safety command was run in the meantime, in which case the
+            caller must abandon its move instead of undoing the safety command.
 
         """
-        while self.Telescope.Slewing:
-            time.sleep(1)
-        if not self.Telescope.Slewing:
-            return
+        if self.wait_until(lambda: not self.Telescope.Slewing, interval=1):
+            logging.warning('A safety command was run on the telescope...abandoning the current move.')
+            return False
+        return True
+
+    def guide_rates(self):
+        """
+        Description
+        -----------
+        Guide rates to convert distances into pulse lengths: the effective rates measured by the guider
+        calibration if there is one, otherwise the rates the mount reports, which are only read over COM once.
+
+        Returns
+        -------
+        TUPLE
+            (RA guide rate, Dec guide rate) in degrees per second.
+
+        """
+        calibration = guider_calibration.get_calibration()
+        if calibration is not None:
+            return calibration.ra_guide_rate, calibration.dec_guide_rate
+        if self.mount_guide_rates is None:
+            self.mount_guide_rates = (self.Telescope.GuideRateRightAscension, self.Telescope.GuideRateDeclination)
+        return self.mount_guide_rates
 
     def store_coords(self):
         self.ra = self.Telescope.RightAscension
@@ -141,7 +174,9 @@ class Telescope(Hardware):
             self.slew_done.set()
             logging.info("Telescope is at park")
             return True
-        self._is_ready()
+        if not self._is_ready():
+            self.slew_done.set()
+            return False
         with self.movement_lock:
             try:
                 self.Telescope.Park()
@@ -162,9 +197,9 @@ class Telescope(Hardware):
                                      "Gave up after {} attempts.".format(t // 5))
                     break
             logging.info('Telescope is parked, tracking off')
-            self._is_ready()
+            ready = self._is_ready()
             self.slew_done.set()
-            return True
+            return ready
         
     def unpark(self):
         """
@@ -175,7 +210,8 @@ class Telescope(Hardware):
             True if unpark was successful, False otherwise.
 
         """
-        self._is_ready()
+        if not self._is_ready():
+            return False
         try:
             with self.movement_lock:
                 self.Telescope.Unpark()
@@ -212,8 +248,9 @@ class Telescope(Hardware):
         if self.__check_coordinate_limit(ra, dec) is False:
             logging.error("Coordinates are outside of physical slew limits.")
             self.last_slew_status = False
+        elif not self._is_ready():
+            self.last_slew_status = False
         else:
-            self._is_ready()
             try:
                 with self.movement_lock:
                     logging.info('Slewing to RA/Dec')
@@ -221,8 +258,9 @@ class Telescope(Hardware):
                     self.Telescope.Tracking = tracking
             except (AttributeError, pywintypes.com_error):
                 logging.debug("ASCOM Error slewing to target.  You may safely ignore this warning.")
-            self._is_ready()
-            if abs(self.Telescope.RightAscension - ra) <= 0.05 and abs(self.Telescope.Declination - dec) <= 0.05:
+            if not self._is_ready():
+                self.last_slew_status = False
+            elif abs(self.Telescope.RightAscension - ra) <= 0.05 and abs(self.Telescope.Declination - dec) <= 0.05:
                 self.last_slew_status = True
             else:
                 self.last_slew_status = False
@@ -236,9 +274,42 @@ class Telescope(Hardware):
                 self.Telescope.Tracking = tracking
         except (AttributeError, pywintypes.com_error):
             logging.error('Could not set telescope tracking!')
-        self._is_ready()
-        return True
+        return self._is_ready()
     
+    def pause_tracking(self, duration):
+        """
+        Description
+        -----------
+        Turns tracking off for a set time, so the sky drifts past by a known distance (used by the guider
+        calibration), then back on.
+
+        Parameters
+        ----------
+        duration : FLOAT
+            Seconds to stop tracking for.
+
+        Returns
+        -------
+        BOOL
+            True if successful, False otherwise.
+
+        """
+        self.slew_done.clear()
+        if not self._is_ready():
+            self.slew_done.set()
+            return False
+        try:
+            with self.movement_lock:
+                self.Telescope.Tracking = False
+                time.sleep(duration)
+                self.Telescope.Tracking = True
+        except (AttributeError, pywintypes.com_error):
+            logging.error('Could not pause telescope tracking!')
+            self.slew_done.set()
+            return False
+        self.slew_done.set()
+        return True
+
     def pulse_guide(self, direction, duration):
         """
 
@@ -256,18 +327,18 @@ class Telescope(Hardware):
 
         """
         self.slew_done.clear()
-        direction_key = {"north": 0, "south": 1, "east": 2, "west": 3}
         # Converts str to int, used by internal telescope calls
-        
-        if direction in direction_key:
-            direction_num = direction_key[direction]
+        if direction in PULSE_DIRECTIONS:
+            direction_num = PULSE_DIRECTIONS[direction]
         else:
             logging.error("Invalid pulse guide direction")
             return False
         
         duration *= 1000
         # Convert seconds to milliseconds, used by internal telescope calls
-        self._is_ready()
+        if not self._is_ready():
+            self.slew_done.set()
+            return False
         try:
             with self.movement_lock:
                 self.Telescope.PulseGuide(direction_num, duration)
@@ -275,10 +346,10 @@ class Telescope(Hardware):
             logging.error("Could not pulse guide")
             return False
         else:
-            self._is_ready()
+            ready = self._is_ready()
             self.slew_done.set()
             logging.info('Telescope is pulse guiding')
-            return True
+            return ready
             
     def jog(self, direction, distance):
         """
@@ -297,8 +368,8 @@ class Telescope(Hardware):
         """
         self.slew_done.clear()
         logging.debug('Sending telescope jog request...')
-        rates_key = {**dict.fromkeys(["north", "south"], self.Telescope.GuideRateDeclination),
-                     **dict.fromkeys(["east", "west"], self.Telescope.GuideRateRightAscension)}
+        ra_rate, dec_rate = self.guide_rates()
+        rates_key = {**dict.fromkeys(["north", "south"], dec_rate), **dict.fromkeys(["east", "west"], ra_rate)}
         # Dictionaries to convert direction str to distance
         distance_key = {**dict.fromkeys(["north", "east"], distance),
                         **dict.fromkeys(["south", "west"], -distance)}
@@ -320,6 +391,94 @@ class Telescope(Hardware):
             elif direction in ("east", "west"):
                 self.slew(self.Telescope.RightAscension + distance/(15*3600), self.Telescope.Declination)
             logging.info('Telescope is jogging')
+
+    def guide_correction(self, ra_distance, dec_distance):
+        """
+        Description
+        -----------
+        Moves the telescope on both axes at once for a guider correction.  Both pulses are started before waiting
+        on either (ASCOM PulseGuide is asynchronous, and a pulse may run on each axis at the same time), so the
+        correction takes as long as the longer pulse instead of the sum of both.  slew_done is set once, when the
+        mount reports that neither axis is pulse guiding any more.  The pulses sent are kept in self.last_pulses as
+        (direction, milliseconds).
+
+        Parameters
+        ----------
+        ra_distance : FLOAT
+            Distance to move in RA in arcseconds.  Positive is east, negative is west.
+        dec_distance : FLOAT
+            Distance to move in Dec in arcseconds.  Positive is north, negative is south.
+
+        Returns
+        -------
+        BOOL
+            True if successful, False otherwise.
+
+        """
+        self.slew_done.clear()
+        self.last_pulses = []
+        moves = [('east' if ra_distance >= 0 else 'west', abs(ra_distance)),
+                 ('north' if dec_distance >= 0 else 'south', abs(dec_distance))]
+        if max(distance for _, distance in moves) >= 30*60:
+            # Too far to pulse guide, so slew one axis at a time
+            for direction, distance in moves:
+                if distance:
+                    self.jog(direction, distance)
+            self.slew_done.set()
+            return True
+        if not self._is_ready():
+            self.slew_done.set()
+            return False
+        try:
+            ra_rate, dec_rate = self.guide_rates()
+            rates = {'east': ra_rate, 'west': ra_rate, 'north': dec_rate, 'south': dec_rate}
+            pulses = [(direction, int(round(distance / 3600 / rates[direction] * 1000)))
+                      for direction, distance in moves if distance]
+            start = time.monotonic()
+            with self.movement_lock:
+                for direction, duration in pulses:
+                    self.Telescope.PulseGuide(PULSE_DIRECTIONS[direction], duration)
+        except (AttributeError, pywintypes.com_error):
+            logging.error("Could not pulse guide")
+            self.slew_done.set()
+            return False
+        self.last_pulses = pulses
+        logging.debug('Pulse guiding {}'.format(', '.join('{} for {} ms'.format(*pulse) for pulse in pulses)))
+        duration = max((duration for _, duration in pulses), default=0) / 1000
+        self._wait_for_pulse_guide(start + duration, start + duration + PULSE_TIMEOUT)
+        self.slew_done.set()
+        return True
+
+    def _wait_for_pulse_guide(self, end, deadline):
+        """
+        Description
+        -----------
+        Waits until the pulses should have finished, then until the mount reports that they have (IsPulseGuiding),
+        checking every PULSE_POLL_INTERVAL seconds instead of every second like _is_ready.
+
+        Parameters
+        ----------
+        end : FLOAT
+            time.monotonic() at which the longest pulse should finish.
+        deadline : FLOAT
+            time.monotonic() after which to stop waiting.
+
+        Returns
+        -------
+        None.
+
+        """
+        time.sleep(max(end - time.monotonic(), 0))
+        try:
+            while self.Telescope.IsPulseGuiding:
+                if time.monotonic() >= deadline:
+                    logging.warning('Telescope is still pulse guiding {} seconds after the pulses should have '
+                                    'finished'.format(PULSE_TIMEOUT))
+                    return
+                time.sleep(PULSE_POLL_INTERVAL)
+        except (AttributeError, pywintypes.com_error):
+            # Drivers without IsPulseGuiding: the pulses have had their full duration
+            pass
     
     def slewaltaz(self, az, alt, time=None, tracking=False):
         """
@@ -378,7 +537,9 @@ class Telescope(Hardware):
 
         """
         logging.debug('Disconnecting telescope...')
-        self._is_ready()
+        while not self._is_ready():
+            # A safety command (i.e. park) does not stop the telescope from disconnecting afterwards
+            continue
         if self.Telescope.AtPark:
             try: 
                 self.Telescope.Connected = False
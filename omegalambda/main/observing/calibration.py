@@ -2,9 +2,10 @@
 import os
 import threading
 import logging
+import collections
 
 from ..common.IO import config_reader
-from ..common.util import filereader_utils
+from ..common.util import filereader_utils, bad_pixel_map, fits_scanner
 from ..common.datatype import filter_wheel
 from ..controller.hardware import Hardware
 
@@ -160,39 +161,58 @@ class Calibration(Hardware):
         if not exp_times:
             logging.error('Wrong data type for exp_time(s) argument')
             return False
-        if not os.path.exists(os.path.join(self.image_directories[ticket], 'Darks_{}'.format(ticket.name))):
-            os.mkdir(os.path.join(self.image_directories[ticket], 'Darks_{}'.format(ticket.name)))
-        else:
-            logging.info('Dark folder already exists!  Assuming they have been collected, & aborting dark collection...')
-            self.darks_done.set()
-            return True
-        for f in filters:
-            for j in range(self.config_dict.calibration_num):
-                image_name = 'Dark_{0:.3f}s-{1:04d}.fits'.format(self.filter_exp_times[f], j + 1)
-                match = False
-                for name in os.listdir(os.path.join(self.image_directories[ticket], 'Darks_{}'.format(ticket.name))):
-                    if name == image_name:
-                        match = True
-                if match:
-                    continue
-                self.camera.onThread(self.camera.expose, self.filter_exp_times[f], 4,
-                                     save_path=os.path.join(self.image_directories[ticket], r'Darks_{}'.format(ticket.name),
-                                                            image_name), type='dark')
-                self.camera.image_done.wait()
-
-        for exp_time in exp_times:
-            for k in range(self.config_dict.calibration_num):
-                image_name = 'Dark_{0:.3f}s-{1:04d}.fits'.format(exp_time, k + 1)
-                match = False
-                for name in os.listdir(os.path.join(self.image_directories[ticket], 'Darks_{}'.format(ticket.name))):
-                    if name == image_name:
-                        match = True
-                if match:
+        dark_directory = os.path.join(self.image_directories[ticket], 'Darks_{}'.format(ticket.name))
+        if not os.path.exists(dark_directory):
+            os.mkdir(dark_directory)
+        # Darks left over from an earlier attempt (i.e. before a crash) count towards the total, unless their
+        # header shows they were not completely saved
+        existing = fits_scanner.scan(dark_directory, ('EXPTIME',))
+        complete = {os.path.basename(path) for path in existing.paths[existing.valid]}
+        counts = collections.Counter(round(float(exp_time), 3) for exp_time in existing['EXPTIME'][existing.valid])
+        if complete:
+            logging.info('Dark folder already exists!  Only taking the darks that are missing...')
+        taken = 0
+        exposures = [self.filter_exp_times[f] for f in filters] + list(exp_times)
+        for exp_time in dict.fromkeys(exposures):
+            j = 0
+            while counts[round(float(exp_time), 3)] < self.config_dict.calibration_num:
+                j += 1
+                image_name = 'Dark_{0:.3f}s-{1:04d}.fits'.format(exp_time, j)
+                if image_name in complete:
                     continue
                 self.camera.onThread(self.camera.expose, exp_time, 4,
-                                     save_path=os.path.join(self.image_directories[ticket],
-                                                            r'Darks_{}'.format(ticket.name),
-                                                            image_name), type='dark')
+                                     save_path=os.path.join(dark_directory, image_name), type='dark')
                 self.camera.image_done.wait()
+                counts[round(float(exp_time), 3)] += 1
+                taken += 1
+        if taken:
+            self.update_bad_pixel_map(dark_directory)
         self.darks_done.set()
         return True
+
+    @staticmethod
+    def update_bad_pixel_map(dark_directory):
+        """
+        Description
+        -----------
+        Rebuilds the camera's hot pixel masks from a folder of darks, one mask per exposure time.  Star finding
+        uses these masks in place of its per-star hot pixel check.
+
+        Parameters
+        ----------
+        dark_directory : STR
+            Path to the folder of dark frames.
+
+        Returns
+        -------
+        bool
+            True if at least one mask was built, otherwise False.
+
+        """
+        paths = [os.path.join(dark_directory, name) for name in os.listdir(dark_directory) if name.endswith('.fits')]
+        try:
+            updated = bad_pixel_map.build_from_darks(paths)
+        except (OSError, ValueError, KeyError) as error:
+            logging.warning('Could not update the bad pixel map from {}: {}'.format(dark_directory, error))
+            return False
+        return updated is not None
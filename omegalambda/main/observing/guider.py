@@ -1,11 +1,42 @@
 import threading
 import logging
+import math
+import time
 import os
 import numpy as np
+from concurrent import futures
 
 from ..controller.hardware import Hardware
 from ..common.IO import config_reader
-from ..common.util import filereader_utils
+from ..common.util import drift_model, filereader_utils, frame_feed, guide_telemetry, guider_calibration, \
+    image_registration
+from ..common.datatype import star_list
+
+# Median star ellipticity above which the guider warns about elongated stars
+ELONGATION_WARNING = 0.2
+# Lowest correlation with the reference that the "phase" guider mode still trusts, how many references in a row may
+# match no image before it falls back (from its region to the binned whole frame, then to "star" mode), and the
+# binning of that whole frame
+PHASE_MIN_QUALITY = 0.4
+PHASE_MAX_UNMATCHED_REFERENCES = 2
+PHASE_FALLBACK_BINNING = 4
+# Largest distance in pixels between a star and its match in the reference for the "multistar" guider mode, and the
+# fewest matched stars that are still trusted
+MULTISTAR_TOLERANCE = 3.0
+MULTISTAR_MIN_MATCHES = 5
+# With guider_prediction, seconds between corrections sent from the drift model while waiting for the next image,
+# and how long after the last measured image to keep sending them
+PREDICTION_INTERVAL = 10
+PREDICTION_HORIZON = 10*60
+# Guider calibration: distance in arcseconds of every guide pulse, longest exposure in seconds, and longest time in
+# seconds to stop tracking for (close to the poles, the sky drifts slowly)
+CALIBRATION_DISTANCE = 20
+CALIBRATION_MAX_EXPOSURE = 30
+CALIBRATION_MAX_DRIFT = 30
+# Seconds between saving the guide telemetry to the target's folder
+TELEMETRY_FLUSH_INTERVAL = 60
+# Longest time in seconds to wait for the telescope to finish a correction (on top of any time it stops tracking for)
+CORRECTION_TIMEOUT = 60
 
 
 class Guider(Hardware):
@@ -33,6 +64,14 @@ class Guider(Hardware):
         self.config_dict = config_reader.get_config()
         self.guiding = threading.Event()
         self.loop_done = threading.Event()
+        self.calibration_done = threading.Event()
+        self.frames = None
+        self.drift_model = None
+        self.telemetry = None
+        self.telemetry_flushed = 0
+        self.iteration_start = 0
+        self.iteration_ra = 0
+        self.iteration_dec = 0
 
         super(Guider, self).__init__(name='Guider')
 
@@ -67,40 +106,82 @@ class Guider(Hardware):
         Returns
         -------
         guider_star : TUPLE
-            Tuple with x-coordinate and y-coordinate of the star in the image.
+            Tuple with x-coordinate and y-coordinate of the star in the image, or in the subframe (relative to its
+            corner) if there is one.
 
         """
-        stars, peaks = filereader_utils.findstars(path, self.config_dict.saturation, subframe=subframe)
+        stars = filereader_utils.findstars(path, self.config_dict.saturation, subframe=subframe)
         guider_star = None
         if not subframe:
-            i = 1
-            j = 0
-            while i < len(stars) - 1 - j:
-                dist_next = np.sqrt((stars[i][0] - stars[i + 1][0]) ** 2 + (stars[i][1] - stars[i + 1][1]) ** 2)
-                dist_prev = np.sqrt((stars[i][0] - stars[i - 1][0]) ** 2 + (stars[i][1] - stars[i - 1][1]) ** 2)
-                if peaks[i] >= self.config_dict.saturation or dist_next < 100 or dist_prev < 100:
-                    peaks.pop(i)
-                    stars.pop(i)
-                    j += 1
-                else:
-                    i += 1
-            if len(peaks) >= 3:
-                maxindex = peaks.index(max(peaks[1:len(peaks)-1]))
-                guider_star = stars[maxindex]
-            else:
-                guider_star = None
+            # Stars with a neighbour within 100 pixels would confuse the guider once the field drifts
+            stars.flag_crowded(100)
+            stars.data['flags'][stars.peak >= self.config_dict.saturation] |= star_list.SATURATED
+            candidates = stars.without_flags(star_list.SATURATED | star_list.CROWDED)
+            if len(candidates) >= 3:
+                brightest = candidates[int(np.argmax(candidates.peak))]
+                guider_star = (float(brightest['x']), float(brightest['y']))
         else:
-            minsep = 1000
-            minstar = None
-            r = self.config_dict.guider_max_move / self.config_dict.plate_scale * 1.5
-            for star in stars:
-                distance = np.sqrt((star[0]-r)**2 + (star[1]-r)**2)
-                if distance < minsep:
-                    minsep = distance
-                    minstar = star
-            guider_star = minstar
+            index, distance = stars.nearest(*self.subframe_position(*subframe))
+            if distance < 1000:
+                guider_star = (float(stars.x[index]), float(stars.y[index]))
         return guider_star
 
+    def subframe_position(self, x, y):
+        """
+        Parameters
+        ----------
+        x : FLOAT
+            x-coordinate in the full image of the star a subframe is set around.
+        y : FLOAT
+            y-coordinate in the full image of the star a subframe is set around.
+
+        Returns
+        -------
+        TUPLE
+            Position of the star relative to the corner of the subframe findstars cuts around it, which is at the
+            whole pixel int(x - r) (clipped to the edge of the image), so the centroid of a star that has not moved
+            is found there to sub-pixel precision.
+
+        """
+        r = self.config_dict.guider_max_move / self.config_dict.plate_scale * 1.5
+        return x - max(int(x - r), 0), y - max(int(y - r), 0)
+
+    def check_image_shape(self, shape=None):
+        """
+        Description
+        -----------
+        Checks the star shapes the camera measured in an image, and warns if the stars are elongated, which
+        is the earliest sign of wind shake, tracking errors, or guider oscillation.
+
+        Parameters
+        ----------
+        shape : TUPLE or FUTURE, optional
+            (ellipticity, position angle, number of stars), or the future from Camera.measure_image_shape that
+            resolves to it, which is checked as soon as it does.  The default is None, which uses the camera's
+            newest image.
+
+        Returns
+        -------
+        ellipticity : FLOAT or None
+            Median star ellipticity of the newest image, or None if it could not be measured (yet).
+
+        """
+        shape = shape or self.camera.image_shape
+        if isinstance(shape, futures.Future):
+            if not shape.done():
+                shape.add_done_callback(self.check_image_shape)
+                return None
+            if shape.cancelled() or shape.exception() is not None:
+                return None
+            shape = shape.result()
+        if shape is None or shape[2] == 0:
+            return None
+        ellipticity, angle, n_stars = shape
+        if ellipticity >= ELONGATION_WARNING:
+            logging.warning('Stars are elongated (median ellipticity {:.2f} at {:.0f} deg over {} stars).  Check for '
+                            'wind shake, tracking errors, or guider oscillation.'.format(ellipticity, angle, n_stars))
+        return ellipticity
+
     @staticmethod
     def find_newest_image(image_path):
         """
@@ -129,7 +210,31 @@ class Guider(Hardware):
         Description
         -----------
         The guiding procedure.  Finds the guide star after each new image and pulse guides the telescope
-        if the star has moved too far.
+        if the star has moved too far.  Images come from the camera's frame feed rather than from listing the
+        folder, and only the latest one is analysed: images saved while the guider is still busy with an earlier
+        one are skipped.
+
+        Parameters
+        ----------
+        image_path : STR
+            Path to the folder where images are saved.
+
+        Returns
+        -------
+        None.
+
+        """
+        if self.config_dict.guider_mode == 'phase':
+            return self.phase_guiding_procedure(image_path)
+        if self.config_dict.guider_mode == 'multistar':
+            return self.multistar_guiding_procedure(image_path)
+        return self.star_guiding_procedure(image_path)
+
+    def star_guiding_procedure(self, image_path):
+        """
+        Description
+        -----------
+        Guiding procedure for guider_mode "star", and the one "phase" falls back to: follows a single guide star.
 
         Parameters
         ----------
@@ -142,11 +247,17 @@ class Guider(Hardware):
 
         """
         self.guiding.set()
+        # Focuser images, flats, and darks are saved in sub-folders, so they are not guided on
+        self.frames = frame_feed.get_feed().subscribe(accept=frame_feed.in_directory(image_path))
+        self.start_drift_model()
+        self.start_telemetry(image_path)
         x_initial = 0
         y_initial = 0
         while self.guiding.isSet():
-            self.camera.image_done.wait()
-            newest_image = self.find_newest_image(image_path)
+            frame = self.frames.get()
+            if frame is None:
+                continue
+            newest_image = frame.path
             star = self.find_guide_star(newest_image)
             if not star:
                 logging.warning('Guider could not find a suitable guide star...waiting for next image to try again.')
@@ -156,56 +267,41 @@ class Guider(Hardware):
                 break
         failures = 0
         while self.guiding.isSet():
-            self.camera.image_done.wait(timeout=30*60)
-            self.loop_done.clear()
-            newest_image = self.find_newest_image(image_path)
+            frame = self.next_frame()
+            if frame is None:
+                continue
+            self.start_iteration()
+            self.check_image_shape(frame.metadata.get('shape'))
+            if self.frames.dropped:
+                logging.debug('Guider skipped {} images that arrived while it was busy'.format(self.frames.dropped))
+            newest_image = frame.path
             subframe = None if failures >= 3 else (x_initial, y_initial)
             star = self.find_guide_star(newest_image, subframe=subframe)
             if not star:
                 logging.warning('Guider could not find a suitable guide star...waiting for next image to try again.')
                 failures += 1
-                self.loop_done.set()
+                self.end_iteration(frame, guide_telemetry.FAILED)
                 continue
             elif failures >= 3:
                 failures = 0
                 x_initial = star[0]
                 y_initial = star[1]
+                self.reset_drift_model()
                 logging.info('Guider has selected a new guide star.  Continuing to guide.')
-                self.loop_done.set()
+                self.end_iteration(frame, guide_telemetry.REFERENCE)
                 continue
             failures = 0
-            x_0 = y_0 = self.config_dict.guider_max_move / self.config_dict.plate_scale * 1.5
+            x_0, y_0 = self.subframe_position(x_initial, y_initial)
             x = star[0]
             y = star[1]
+            dx = x - x_0
+            dy = y - y_0
+            flags = 0
             logging.debug('Guide star relative coordinates: x={}, y={}'.format(x, y))
             logging.debug('Guide star absolute coordinates: x={}, y={}'.format(x_initial, y_initial))
             separation = np.sqrt((x - x_0)**2 + (y - y_0)**2)
-            if separation >= self.config_dict.guiding_threshold:
-                # Position vector
-                position = np.array([x - x_0, y - y_0])
-                if self.config_dict.guider_flip_y:
-                    position[1] *= -1
-                # Guider angle: between the +x camera axis and the +RA axis
-                gamma = self.config_dict.guider_angle
-                # Rotation matrix to rotate through gamma
-                rot = np.array([[np.cos(gamma), -np.sin(gamma)], [np.sin(gamma), np.cos(gamma)]])
-                # New position
-                rot_x, rot_y = np.matmul(rot, position)
-                # Assumes guider angle (angle b/w RA/Dec axes and Image X/Y axes) is constant
-                if rot_x < 0:
-                    # The pixel distance is positive in this case (for gamma = 180), but the RA distance is negative because RA increases
-                    # to the left.  So in order to move the star back to the left, we move the telescope right/west.
-                    xdirection = 'west'
-                else:
-                    xdirection = 'east'
-                if rot_y > 0:
-                    # The pixel distance is negative (for gamma = 180), but the declination distance is positive.
-                    # So to move the star back down, we move the telescope up/north.
-                    ydirection = 'north'
-                else:
-                    ydirection = 'south'
-                xjog_distance = abs(rot_x) * self.config_dict.plate_scale * self.config_dict.guider_ra_dampening
-                yjog_distance = abs(rot_y) * self.config_dict.plate_scale * self.config_dict.guider_dec_dampening
+            if separation >= self.config_dict.guiding_threshold or self.drift_model is not None:
+                xdirection, xjog_distance, ydirection, yjog_distance = self.correction(dx, dy)
                 jog_separation = np.sqrt(xjog_distance**2 + yjog_distance**2)
                 if jog_separation >= self.config_dict.guider_max_move:
                     logging.warning('Guide star has moved substantially between images...If the telescope did not move '
@@ -216,23 +312,694 @@ class Guider(Hardware):
                     if new_star:
                         x_initial = new_star[0]
                         y_initial = new_star[1]
+                        self.reset_drift_model()
+                        flags = guide_telemetry.JUMP | guide_telemetry.REFERENCE
                     else:
                         logging.warning(
                             'Guider could not find a suitable guide star...waiting for next image to try again.')
                         failures += 1
+                        flags = guide_telemetry.JUMP
+                elif self.drift_model is not None:
+                    self.predictive_correction(dx, dy, frame)
                 elif jog_separation < self.config_dict.guider_max_move:
-                    logging.debug('Guider is making an adjustment')
-                    logging.debug('xdistance: {}\"; ydistance: {}\"'.format(xjog_distance, yjog_distance))
                     logging.debug('Separation: {} px'.format(separation))
-                    logging.debug('Move Direction: {} {}'.format(xdirection, ydirection))
-                    logging.debug('Plate Scale: {}\"/px'.format(self.config_dict.plate_scale))
-                    logging.debug('RA Dampening: {}x'.format(self.config_dict.guider_ra_dampening))
-                    logging.debug('Dec Dampening: {}x\n'.format(self.config_dict.guider_dec_dampening))
-                    self.telescope.onThread(self.telescope.jog, xdirection, xjog_distance)
-                    self.telescope.slew_done.wait()
-                    self.telescope.onThread(self.telescope.jog, ydirection, yjog_distance)
-                    self.telescope.slew_done.wait()
-            self.loop_done.set()
+                    self.make_correction(xdirection, xjog_distance, ydirection, yjog_distance)
+            self.end_iteration(frame, flags, dx, dy)
+        self.frames.close()
+        self.telemetry.flush()
+
+    def phase_guiding_procedure(self, image_path):
+        """
+        Description
+        -----------
+        Guiding procedure for guider_mode "phase".  Stores the central region of the first image as the reference,
+        then measures the offset of every later image from it with phase correlation (see
+        common/util/image_registration.py) and pulse guides the telescope back.  No stars are detected, so it
+        works on crowded or defocused fields, and the cost per image does not depend on the number of stars.
+        After 3 images in a row that do not match the reference, or one that has moved too far, the next image
+        becomes the new reference.
+
+        The region (guider_phase_region and guider_phase_binning) must hold enough stars to correlate.  On sparse
+        fields the central region may not, so when PHASE_MAX_UNMATCHED_REFERENCES references in a row match no
+        image, the whole frame binned by PHASE_FALLBACK_BINNING is registered instead, and if that does not match
+        either, guiding carries on in "star" mode.  Several cloudy images in a row have the same effect.
+
+        Parameters
+        ----------
+        image_path : STR
+            Path to the folder where images are saved.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.guiding.set()
+        self.frames = frame_feed.get_feed().subscribe(accept=frame_feed.in_directory(image_path))
+        self.start_drift_model()
+        self.start_telemetry(image_path)
+        region_size = self.config_dict.guider_phase_region or None
+        binning = self.config_dict.guider_phase_binning or 1
+        reference = None
+        matched = False
+        unmatched_references = 0
+        failures = 0
+        while self.guiding.isSet():
+            frame = self.next_frame()
+            if frame is None:
+                continue
+            self.start_iteration()
+            self.check_image_shape(frame.metadata.get('shape'))
+            if failures >= 3 and not matched:
+                unmatched_references += 1
+                if unmatched_references >= PHASE_MAX_UNMATCHED_REFERENCES:
+                    unmatched_references = 0
+                    if region_size is None and binning == PHASE_FALLBACK_BINNING:
+                        logging.warning('Phase correlation does not match on this field.  Guiding on a single '
+                                        'star instead.')
+                        self.end_iteration(frame, guide_telemetry.FAILED)
+                        self.frames.close()
+                        self.telemetry.flush()
+                        return self.star_guiding_procedure(image_path)
+                    logging.warning('Too few stars to correlate in the guider region.  Registering the whole '
+                                    'frame binned {0}x{0} instead.'.format(PHASE_FALLBACK_BINNING))
+                    region_size, binning = None, PHASE_FALLBACK_BINNING
+            region = image_registration.read_region(frame.path, region_size, binning)
+            if reference is None or failures >= 3 or region.shape != reference.shape:
+                reference = image_registration.PhaseReference(region)
+                matched = False
+                failures = 0
+                self.reset_drift_model()
+                logging.info('Guider has stored a new reference image.  Continuing to guide.')
+                self.end_iteration(frame, guide_telemetry.REFERENCE)
+                continue
+            dx, dy, quality = reference.offset(region)
+            if quality < PHASE_MIN_QUALITY:
+                logging.warning('Image does not match the guider reference (correlation {:.2f})...waiting for next '
+                                'image to try again.'.format(quality))
+                failures += 1
+                self.end_iteration(frame, guide_telemetry.FAILED)
+                continue
+            failures = 0
+            matched = True
+            unmatched_references = 0
+            flags = 0
+            dx *= binning
+            dy *= binning
+            logging.debug('Image offset from the guider reference: dx={:.2f}, dy={:.2f} px (correlation {:.2f})'.format(
+                dx, dy, quality))
+            separation = np.sqrt(dx**2 + dy**2)
+            if separation >= self.config_dict.guiding_threshold or self.drift_model is not None:
+                xdirection, xjog_distance, ydirection, yjog_distance = self.correction(dx, dy)
+                if np.sqrt(xjog_distance**2 + yjog_distance**2) >= self.config_dict.guider_max_move:
+                    logging.warning('Image has moved substantially from the guider reference...If the telescope did '
+                                    'not move suddenly, the field has changed.  Storing a new reference.')
+                    failures = 3
+                    flags = guide_telemetry.JUMP
+                elif self.drift_model is not None:
+                    self.predictive_correction(dx, dy, frame)
+                else:
+                    logging.debug('Separation: {} px'.format(separation))
+                    self.make_correction(xdirection, xjog_distance, ydirection, yjog_distance)
+            self.end_iteration(frame, flags, dx, dy)
+        self.frames.close()
+        self.telemetry.flush()
+
+    def multistar_guiding_procedure(self, image_path):
+        """
+        Description
+        -----------
+        Guiding procedure for guider_mode "multistar".  Stores the isolated, unsaturated stars of the first image as
+        the reference, then matches the stars of every later image to it and fits the shift and rotation of the
+        whole field (see common/util/image_registration.py), clipping stars that do not agree.  A single star that
+        saturates or fades behind a cloud only drops out of the fit, instead of making the guider look for a new
+        guide star.  After 3 images in a row with too few matches, or one that has moved too far, the next image
+        becomes the new reference.
+
+        Parameters
+        ----------
+        image_path : STR
+            Path to the folder where images are saved.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.guiding.set()
+        self.frames = frame_feed.get_feed().subscribe(accept=frame_feed.in_directory(image_path))
+        self.start_drift_model()
+        self.start_telemetry(image_path)
+        max_shift = self.config_dict.guider_max_move / self.config_dict.plate_scale * 1.5
+        reference = None
+        failures = 0
+        while self.guiding.isSet():
+            frame = self.next_frame()
+            if frame is None:
+                continue
+            self.start_iteration()
+            self.check_image_shape(frame.metadata.get('shape'))
+            stars = filereader_utils.findstars(frame.path, self.config_dict.saturation)
+            stars.flags[stars.peak >= self.config_dict.saturation] |= star_list.SATURATED
+            if reference is None or failures >= 3:
+                candidate = image_registration.StarReference(stars, max_shift, MULTISTAR_TOLERANCE)
+                if len(candidate.stars) < MULTISTAR_MIN_MATCHES:
+                    logging.warning('Guider found only {} isolated stars...waiting for next image to try '
+                                    'again.'.format(len(candidate.stars)))
+                else:
+                    reference = candidate
+                    failures = 0
+                    self.reset_drift_model()
+                    logging.info('Guider has stored {} reference stars.  Continuing to guide.'.format(
+                        len(reference.stars)))
+                self.end_iteration(frame, guide_telemetry.REFERENCE if reference is candidate else
+                                   guide_telemetry.FAILED)
+                continue
+            dx, dy, rotation, n_matched = reference.offset(stars)
+            if n_matched < MULTISTAR_MIN_MATCHES:
+                logging.warning('Guider matched only {} stars to the reference...waiting for next image to try '
+                                'again.'.format(n_matched))
+                failures += 1
+                self.end_iteration(frame, guide_telemetry.FAILED)
+                continue
+            failures = 0
+            flags = 0
+            logging.debug('Field offset from the guider reference: dx={:.2f}, dy={:.2f} px, rotation={:.4f} deg '
+                          '({} stars)'.format(dx, dy, np.degrees(rotation), n_matched))
+            separation = np.sqrt(dx**2 + dy**2)
+            if separation >= self.config_dict.guiding_threshold or self.drift_model is not None:
+                xdirection, xjog_distance, ydirection, yjog_distance = self.correction(dx, dy)
+                if np.sqrt(xjog_distance**2 + yjog_distance**2) >= self.config_dict.guider_max_move:
+                    logging.warning('Field has moved substantially from the guider reference...If the telescope did '
+                                    'not move suddenly, the field has changed.  Storing a new reference.')
+                    failures = 3
+                    flags = guide_telemetry.JUMP
+                elif self.drift_model is not None:
+                    self.predictive_correction(dx, dy, frame)
+                else:
+                    logging.debug('Separation: {} px'.format(separation))
+                    self.make_correction(xdirection, xjog_distance, ydirection, yjog_distance)
+            self.end_iteration(frame, flags, dx, dy)
+        self.frames.close()
+        self.telemetry.flush()
+
+    def orientation(self):
+        """
+        Returns
+        -------
+        TUPLE
+            (guider angle in radians, y-axis flip, plate scale in arcseconds per pixel): from the guider calibration
+            if there is one, otherwise from the config.
+
+        """
+        calibration = guider_calibration.get_calibration()
+        if calibration is not None:
+            return calibration.angle, calibration.flip_y, calibration.plate_scale
+        return self.config_dict.guider_angle, self.config_dict.guider_flip_y, self.config_dict.plate_scale
+
+    def sky_offset(self, dx, dy):
+        """
+        Description
+        -----------
+        Converts the drift of the image in pixels into the distances the telescope has to move to bring the image
+        back, through the guider angle and the y-axis flip (see orientation), without any dampening.
+
+        Parameters
+        ----------
+        dx : FLOAT
+            Drift of the image along x in pixels.
+        dy : FLOAT
+            Drift of the image along y in pixels.
+
+        Returns
+        -------
+        TUPLE
+            (RA distance, Dec distance) in arcseconds, positive to the east and north.
+
+        """
+        gamma, flip_y, plate_scale = self.orientation()
+        # Position vector
+        position = np.array([dx, dy], dtype=float)
+        if flip_y:
+            position[1] *= -1
+        # Guider angle (gamma): between the +x camera axis and the +RA axis
+        # Rotation matrix to rotate through gamma
+        rot = np.array([[np.cos(gamma), -np.sin(gamma)], [np.sin(gamma), np.cos(gamma)]])
+        # New position
+        rot_x, rot_y = np.matmul(rot, position)
+        return rot_x * plate_scale, rot_y * plate_scale
+
+    def correction(self, dx, dy):
+        """
+        Description
+        -----------
+        Converts the drift of the image in pixels into telescope moves, through the guider angle, the y-axis flip,
+        and the RA and Dec dampening.
+
+        Parameters
+        ----------
+        dx : FLOAT
+            Drift of the image along x in pixels.
+        dy : FLOAT
+            Drift of the image along y in pixels.
+
+        Returns
+        -------
+        TUPLE
+            (RA direction, RA distance in arcseconds, Dec direction, Dec distance in arcseconds) to move the
+            telescope by to bring the image back.
+
+        """
+        rot_x, rot_y = self.sky_offset(dx, dy)
+        # Assumes guider angle (angle b/w RA/Dec axes and Image X/Y axes) is constant
+        if rot_x < 0:
+            # The pixel distance is positive in this case (for gamma = 180), but the RA distance is negative because RA increases
+            # to the left.  So in order to move the star back to the left, we move the telescope right/west.
+            xdirection = 'west'
+        else:
+            xdirection = 'east'
+        if rot_y > 0:
+            # The pixel distance is negative (for gamma = 180), but the declination distance is positive.
+            # So to move the star back down, we move the telescope up/north.
+            ydirection = 'north'
+        else:
+            ydirection = 'south'
+        xjog_distance = abs(rot_x) * self.config_dict.guider_ra_dampening
+        yjog_distance = abs(rot_y) * self.config_dict.guider_dec_dampening
+        return xdirection, xjog_distance, ydirection, yjog_distance
+
+    def make_correction(self, xdirection, xjog_distance, ydirection, yjog_distance):
+        """
+        Description
+        -----------
+        Moves the telescope by a correction from the correction method, on both axes at once.
+
+        Returns
+        -------
+        None.
+
+        """
+        logging.debug('Guider is making an adjustment')
+        logging.debug('xdistance: {}\"; ydistance: {}\"'.format(xjog_distance, yjog_distance))
+        logging.debug('Move Direction: {} {}'.format(xdirection, ydirection))
+        logging.debug('Plate Scale: {}\"/px'.format(self.config_dict.plate_scale))
+        logging.debug('RA Dampening: {}x'.format(self.config_dict.guider_ra_dampening))
+        logging.debug('Dec Dampening: {}x\n'.format(self.config_dict.guider_dec_dampening))
+        ra_distance = xjog_distance if xdirection == 'east' else -xjog_distance
+        dec_distance = yjog_distance if ydirection == 'north' else -yjog_distance
+        self.send_correction(ra_distance, dec_distance)
+
+    def send_correction(self, ra_distance, dec_distance):
+        """
+        Description
+        -----------
+        Sends a correction to the telescope and waits until the mount has finished it.  If the telescope fails
+        to make it (an error, a dead telescope thread, or no answer within CORRECTION_TIMEOUT), the correction is
+        logged and skipped.
+
+        Parameters
+        ----------
+        ra_distance : FLOAT
+            Distance to move in RA in arcseconds, positive to the east.
+        dec_distance : FLOAT
+            Distance to move in Dec in arcseconds, positive to the north.
+
+        Returns
+        -------
+        bool
+            True if the telescope made the correction, False if it was skipped.
+
+        """
+        if not self.wait_for_telescope(self.telescope.onThread(self.telescope.guide_correction, ra_distance,
+                                                               dec_distance), CORRECTION_TIMEOUT):
+            logging.warning('Skipped a guider correction of {:.2f}" RA, {:.2f}" Dec'.format(ra_distance, dec_distance))
+            return False
+        self.iteration_ra += ra_distance
+        self.iteration_dec += dec_distance
+        return True
+
+    @staticmethod
+    def wait_for_telescope(future, timeout):
+        """
+        Description
+        -----------
+        Waits for a telescope move put on the telescope thread with onThread.
+
+        Parameters
+        ----------
+        future : concurrent.futures.Future
+            The future onThread returned.
+        timeout : INT or FLOAT
+            Longest time in seconds to wait.
+
+        Returns
+        -------
+        bool
+            True if the telescope made the move, False if it failed, raised an error, or did not finish in time.
+
+        """
+        try:
+            return bool(future.result(timeout=timeout))
+        except futures.TimeoutError:
+            logging.error('The telescope did not finish moving within {} seconds'.format(timeout))
+        except futures.CancelledError:
+            logging.error('The telescope thread has stopped')
+        except Exception as exc:
+            logging.error('The telescope could not move: {}'.format(exc))
+        return False
+
+    def start_telemetry(self, image_path):
+        """
+        Description
+        -----------
+        Starts a new guide telemetry buffer (see common/util/guide_telemetry.py) for a guiding procedure, saved
+        every TELEMETRY_FLUSH_INTERVAL seconds to guide_telemetry.bin in the target's folder.
+
+        Parameters
+        ----------
+        image_path : STR
+            Path to the folder where images of the target are saved.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.telemetry = guide_telemetry.TelemetryBuffer(guide_telemetry.telemetry_path(image_path))
+        self.telemetry_flushed = time.time()
+
+    def start_iteration(self):
+        """
+        Description
+        -----------
+        Marks the start of a guider iteration, for its telemetry record.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.loop_done.clear()
+        self.iteration_start = time.perf_counter()
+        self.iteration_ra = 0
+        self.iteration_dec = 0
+
+    def end_iteration(self, frame, flags=0, dx=float('nan'), dy=float('nan')):
+        """
+        Description
+        -----------
+        Records the telemetry of a guider iteration, with the corrections sent since start_iteration, and saves
+        the telemetry if it is due.  Between images, only iterations that sent a correction are recorded.
+
+        Parameters
+        ----------
+        frame : Frame or None
+            The image of the iteration, or None between images.
+        flags : INT, optional
+            Flags from common/util/guide_telemetry.py.  CORRECTED is added if a correction was sent.  The default
+            is 0.
+        dx : FLOAT, optional
+            Measured offset along x in pixels.  The default is NaN, for nothing measured.
+        dy : FLOAT, optional
+            Measured offset along y in pixels.  The default is NaN, for nothing measured.
+
+        Returns
+        -------
+        None.
+
+        """
+        if self.iteration_ra or self.iteration_dec:
+            flags |= guide_telemetry.CORRECTED
+        if frame is not None or flags & guide_telemetry.CORRECTED:
+            now = time.time()
+            self.telemetry.record(now if frame is None else frame.time, 0 if frame is None else frame.sequence,
+                                  dx, dy, math.hypot(dx, dy), self.iteration_ra, self.iteration_dec,
+                                  time.perf_counter() - self.iteration_start, flags)
+            if now - self.telemetry_flushed >= TELEMETRY_FLUSH_INTERVAL:
+                self.telemetry.flush()
+                self.telemetry_flushed = now
+        self.loop_done.set()
+
+    def start_drift_model(self):
+        """
+        Description
+        -----------
+        With guider_prediction, starts a new drift model (see common/util/drift_model.py) for a guiding procedure.
+        The static dampening is only the starting guess for the gains, which the model then learns from how the
+        mount responds to its corrections.
+
+        Returns
+        -------
+        None.
+
+        """
+        if self.config_dict.guider_prediction:
+            self.drift_model = drift_model.DriftModel(1 / self.config_dict.guider_ra_dampening,
+                                                      1 / self.config_dict.guider_dec_dampening)
+        else:
+            self.drift_model = None
+
+    def reset_drift_model(self):
+        """
+        Description
+        -----------
+        Forgets the drift measured against the old guide star or reference, keeping the learned gains.
+
+        Returns
+        -------
+        None.
+
+        """
+        if self.drift_model is not None:
+            self.drift_model.reset()
+
+    def next_frame(self):
+        """
+        Description
+        -----------
+        Waits for the next image.  While the drift model knows the drift rate, it sends the correction for the drift
+        it expects every PREDICTION_INTERVAL seconds in the meantime, for up to PREDICTION_HORIZON seconds after the
+        last measured image.
+
+        Returns
+        -------
+        frame : Frame or None
+            The newest image, or None if the wait timed out or guiding was stopped.
+
+        """
+        while self.guiding.isSet():
+            if self.drift_model is None or not self.drift_model.ready or \
+                    time.time() - self.drift_model.time > PREDICTION_HORIZON:
+                return self.frames.get(timeout=30*60)
+            frame = self.frames.get(timeout=PREDICTION_INTERVAL)
+            if frame is not None or not self.guiding.isSet():
+                return frame
+            self.start_iteration()
+            self.anticipate()
+            self.end_iteration(None, guide_telemetry.PREDICTED)
+        return None
+
+    def predictive_correction(self, dx, dy, frame):
+        """
+        Description
+        -----------
+        Adds the drift measured in an image to the drift model, then corrects for the drift it expects.
+
+        Parameters
+        ----------
+        dx : FLOAT
+            Drift of the image along x in pixels.
+        dy : FLOAT
+            Drift of the image along y in pixels.
+        frame : Frame
+            The image the drift was measured in.  Its stars are at their mean position over the exposure, so the
+            drift is measured at the middle of it.
+
+        Returns
+        -------
+        None.
+
+        """
+        ra_error, dec_error = self.sky_offset(dx, dy)
+        exposure = frame.metadata.get('exposure_time') or 0
+        self.drift_model.update(frame.time - exposure / 2, ra_error, dec_error, exposure)
+        self.anticipate()
+
+    def anticipate(self):
+        """
+        Description
+        -----------
+        Corrects for the drift the model expects halfway to the next correction, if it is more than
+        guiding_threshold.  The corrections are divided by the learned gains instead of multiplied by the static
+        dampening.
+
+        Returns
+        -------
+        None.
+
+        """
+        now = time.time()
+        ra_distance, dec_distance, ra_error, dec_error = self.drift_model.correction(now, PREDICTION_INTERVAL / 2)
+        if np.sqrt(ra_error**2 + dec_error**2) < self.config_dict.guiding_threshold * self.config_dict.plate_scale:
+            return
+        if np.sqrt(ra_distance**2 + dec_distance**2) >= self.config_dict.guider_max_move:
+            logging.warning('Drift model expects a move of more than guider_max_move...Waiting for the next image to '
+                            'measure the drift again.')
+            self.drift_model.reset()
+            return
+        logging.debug('Guider is correcting for expected drift: RA {:.2f}", Dec {:.2f}" (gains {:.2f}, {:.2f})'.format(
+            ra_error, dec_error, *self.drift_model.gains))
+        # A correction the mount never made must not be learned from
+        if self.send_correction(ra_distance, dec_distance):
+            self.drift_model.apply(now, ra_distance, dec_distance)
+
+    @staticmethod
+    def calibration_timeout(exposure_time):
+        """
+        Parameters
+        ----------
+        exposure_time : FLOAT
+            Exposure time in seconds passed to calibrate.
+
+        Returns
+        -------
+        FLOAT
+            Longest time in seconds a calibration run can take: every image and telescope move in it timing out.
+
+        """
+        exposure_time = min(exposure_time, CALIBRATION_MAX_EXPOSURE)
+        images = 7 * (exposure_time*2 + 60)
+        moves = 6 * CORRECTION_TIMEOUT + CALIBRATION_MAX_DRIFT
+        return images + moves
+
+    def calibrate(self, image_path, exposure_time, filter, declination):
+        """
+        Description
+        -----------
+        Calibration run for guider_calibration.  Takes an image, then another after each of: a guide pulse of
+        CALIBRATION_DISTANCE east, the same west, north, and south, a few seconds with tracking off (the sky drifts
+        by a known distance, as if the telescope had moved east), and a pulse back west.  The displacements of the
+        stars between consecutive images are fit (see common/util/guider_calibration.py) for the guider angle, flip,
+        plate scale, and effective guide rates, which are saved in the data directory and used by the guider and
+        telescope from then on.  The images are saved in a sub-folder, so they are never guided on.
+
+        Parameters
+        ----------
+        image_path : STR
+            Path to the folder where images of the target are saved.
+        exposure_time : FLOAT
+            Exposure time in seconds, shortened to CALIBRATION_MAX_EXPOSURE.
+        filter : INT
+            Which filter to expose in.
+        declination : FLOAT
+            Declination of the telescope in degrees.
+
+        Returns
+        -------
+        calibration : GuiderCalibration or None
+            The new calibration, or None if it failed, in which case the old one (if any) is kept.
+
+        """
+        self.calibration_done.clear()
+        try:
+            return self._calibration_run(image_path, exposure_time, filter, declination)
+        finally:
+            self.calibration_done.set()
+
+    def _calibration_run(self, image_path, exposure_time, filter, declination):
+        directory = os.path.join(image_path, 'guider_calibration')
+        os.makedirs(directory, exist_ok=True)
+        exposure_time = min(exposure_time, CALIBRATION_MAX_EXPOSURE)
+        drift_distance = CALIBRATION_DISTANCE
+        drift_time = drift_distance / (guider_calibration.SIDEREAL_RATE * np.cos(np.radians(declination)))
+        if drift_time > CALIBRATION_MAX_DRIFT:
+            drift_time = CALIBRATION_MAX_DRIFT
+            drift_distance = drift_time * guider_calibration.SIDEREAL_RATE * np.cos(np.radians(declination))
+        # (RA distance, Dec distance) of each pulse, or None for tracking off
+        moves = [(CALIBRATION_DISTANCE, 0), (-CALIBRATION_DISTANCE, 0), (0, CALIBRATION_DISTANCE),
+                 (0, -CALIBRATION_DISTANCE), None, (-drift_distance, 0)]
+        signs = {'east': 1, 'west': -1, 'north': 1, 'south': -1}
+        max_shift = 3 * CALIBRATION_DISTANCE / self.config_dict.plate_scale
+        logging.info('Guider is calibrating')
+        with frame_feed.get_feed().subscribe(accept=frame_feed.in_directory(directory)) as frames:
+            stars = self.calibration_image(frames, directory, 0, exposure_time, filter)
+            reference = None
+            if stars is not None:
+                reference = image_registration.StarReference(stars, max_shift, MULTISTAR_TOLERANCE)
+            if reference is None or len(reference.stars) < MULTISTAR_MIN_MATCHES:
+                logging.warning('Guider calibration could not find enough isolated stars')
+                return None
+            positions = [(0.0, 0.0)]
+            seconds = []
+            for step, move in enumerate(moves, start=1):
+                if move is None:
+                    moved = self.wait_for_telescope(self.telescope.onThread(self.telescope.pause_tracking, drift_time),
+                                                    drift_time + CORRECTION_TIMEOUT)
+                else:
+                    moved = self.wait_for_telescope(self.telescope.onThread(self.telescope.guide_correction, *move),
+                                                    CORRECTION_TIMEOUT)
+                if not moved:
+                    logging.warning('Guider calibration could not move the telescope')
+                    return None
+                if move is not None:
+                    # Signed length of the pulse the telescope actually sent, positive for east or north
+                    seconds.append(sum(signs[direction] * duration / 1000
+                                       for direction, duration in self.telescope.last_pulses))
+                stars = self.calibration_image(frames, directory, step, exposure_time, filter)
+                if stars is None:
+                    logging.warning('Guider calibration did not get an image')
+                    return None
+                dx, dy, _, n_matched = reference.offset(stars)
+                if n_matched < MULTISTAR_MIN_MATCHES:
+                    logging.warning('Guider calibration matched only {} stars'.format(n_matched))
+                    return None
+                positions.append((dx, dy))
+        # Moves between consecutive images: east, west, north, south, tracking off, and west
+        displacements = np.diff(np.array(positions), axis=0)
+        try:
+            calibration = guider_calibration.fit(
+                [(*displacements[0], seconds[0]), (*displacements[1], seconds[1]), (*displacements[5], seconds[4])],
+                [(*displacements[2], seconds[2]), (*displacements[3], seconds[3])],
+                displacements[4], drift_distance, declination)
+        except ValueError as error:
+            logging.warning('Guider calibration failed: {}'.format(error))
+            return None
+        guider_calibration.save(calibration)
+        logging.info('Guider calibration: angle {:.1f} deg{}, plate scale {:.3f}"/px, guide rates {:.2f}"/s RA, '
+                     '{:.2f}"/s Dec'.format(np.degrees(calibration.angle), ', y flipped' if calibration.flip_y else '',
+                                            calibration.plate_scale, calibration.ra_guide_rate * 3600,
+                                            calibration.dec_guide_rate * 3600))
+        return calibration
+
+    def calibration_image(self, frames, directory, step, exposure_time, filter):
+        """
+        Parameters
+        ----------
+        frames : Subscription
+            Frame feed subscription for the calibration folder.
+        directory : STR
+            Path to the calibration folder.
+        step : INT
+            Number of the image in the calibration run.
+        exposure_time : FLOAT
+            Exposure time in seconds.
+        filter : INT
+            Which filter to expose in.
+
+        Returns
+        -------
+        stars : StarList or None
+            Stars in the new image, or None if the camera did not save one in time.
+
+        """
+        path = os.path.join(directory, 'guider_calibration-{:02d}.fits'.format(step))
+        self.camera.onThread(self.camera.expose, exposure_time, filter, save_path=path, type='light')
+        frame = frames.get(timeout=exposure_time*2 + 60)
+        if frame is None:
+            return None
+        stars = filereader_utils.findstars(frame.path, self.config_dict.saturation)
+        stars.flags[stars.peak >= self.config_dict.saturation] |= star_list.SATURATED
+        return stars
 
     def stop_guiding(self):
         """
@@ -248,3 +1015,6 @@ class Guider(Hardware):
 
         """
         self.guiding.clear()
+        if self.frames is not None:
+            # Wakes up the guiding procedure if it is waiting for an image
+            self.frames.close()
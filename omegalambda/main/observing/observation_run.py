@@ -7,11 +7,13 @@ import re
 import copy
 import logging
 import subprocess
+from concurrent import futures
 # import threading
 
-from ..common.util import time_utils, conversion_utils
+from ..common.util import time_utils, conversion_utils, frame_cache, analysis_service, guider_calibration
 from ..common.IO import config_reader
 from ..common.datatype import filter_wheel
+from ..controller.hardware import PRIORITY_SAFETY
 from ..controller.camera import Camera
 from ..controller.telescope import Telescope
 from ..controller.dome import Dome
@@ -25,6 +27,9 @@ from .calibration import Calibration
 from .guider import Guider
 from .condition_checker import Conditions
 
+# Longest time in seconds to wait for the telescope to slew to a target, including any commands queued ahead of it
+SLEW_TIMEOUT = 10*60
+
 
 class ObservationRun:
     def __init__(self, observation_request_list, image_directory, shutdown_toggle, calibration_toggle, focus_toggle):
@@ -69,6 +74,8 @@ class ObservationRun:
         self.conditions = Conditions()
         self.flatlamp = FlatLamp()
 
+        # Image analysis runs in its own processes so it cannot stall the hardware threads
+        analysis_service.start_service()
 
         # Initializes higher level structures - focuser, guider, and calibration
         self.focus_procedures = FocusProcedures(self.focuser, self.camera, self.conditions)
@@ -209,9 +216,11 @@ class ObservationRun:
         initial_check = self.everything_ok()
         if cooler:
             self.camera.onThread(self.camera.cooler_set, True)
-        self.dome.onThread(self.dome.shutter_position)
-        time.sleep(2)
-        initial_shutter = self.dome.shutter
+        try:
+            initial_shutter = self.dome.onThread(self.dome.shutter_position).result(timeout=30)
+        except (futures.TimeoutError, futures.CancelledError):
+            logging.warning('Could not read the dome shutter position.')
+            initial_shutter = self.dome.shutter
         if initial_shutter in (1, 3, 4) and initial_check is True:
             self.dome.onThread(self.dome.move_shutter, 'open')
             self.dome.onThread(self.dome.home)
@@ -238,10 +247,7 @@ class ObservationRun:
             True if slew was successful, otherwise False.
 
         """
-        self.telescope.onThread(self.telescope.slew, ticket.ra, ticket.dec)
-        self.telescope.slew_done.wait()
-        time.sleep(2)
-        slew = self.telescope.last_slew_status
+        slew = self._slew_and_wait(ticket.ra, ticket.dec)
         if not slew:
             logging.warning('Telescope cannot slew to target.  Waiting until slew conditions are acceptable.')
             while not slew:
@@ -249,12 +255,76 @@ class ObservationRun:
                 time.sleep(self.config_dict.weather_freq*60)
                 if not self.everything_ok():
                     return False
-                self.telescope.onThread(self.telescope.slew, ticket.ra, ticket.dec)
-                self.telescope.slew_done.wait()
-                time.sleep(2)
-                slew = self.telescope.last_slew_status
+                slew = self._slew_and_wait(ticket.ra, ticket.dec)
         return True
 
+    def _calibrate_guider(self, ticket):
+        """
+        Description
+        -----------
+        Runs a guider calibration on the target and waits for it, for no longer than the calibration run can take.
+        If it fails or does not finish in time, the guider keeps guiding with the calibration it had (or the
+        config's orientation and plate scale if there is none).
+
+        Parameters
+        ----------
+        ticket : ObservationTicket Object
+            The observation ticket of the target.
+
+        Returns
+        -------
+        bool
+            True if the guider was calibrated, False otherwise.
+
+        """
+        timeout = self.guider.calibration_timeout(ticket.exp_time[0])
+        future = self.guider.onThread(self.guider.calibrate, self.image_directories[ticket], ticket.exp_time[0],
+                                      self.filterwheel_dict[ticket.filter[0]], ticket.dec)
+        try:
+            calibration = future.result(timeout=timeout)
+        except futures.TimeoutError:
+            logging.error('Guider calibration did not finish within {:.0f} seconds'.format(timeout))
+            calibration = None
+        except futures.CancelledError:
+            logging.error('The guider thread stopped before the guider calibration ran')
+            calibration = None
+        except Exception:
+            logging.exception('Guider calibration raised an error')
+            calibration = None
+        if calibration is None:
+            logging.warning('Guiding without a new guider calibration')
+            return False
+        return True
+
+    def _slew_and_wait(self, ra, dec):
+        """
+
+        Parameters
+        ----------
+        ra : FLOAT
+            Right ascension of target in hours.
+        dec : FLOAT
+            Declination of target in degrees.
+
+        Returns
+        -------
+        bool
+            True if the telescope slewed to the target, False if the slew failed, did not finish within SLEW_TIMEOUT,
+            or the telescope thread stopped before it.
+
+        """
+        try:
+            return self.telescope.onThread(self.telescope.slew, ra, dec).result(timeout=SLEW_TIMEOUT)
+        except futures.TimeoutError:
+            logging.error('The telescope did not finish slewing within {} seconds.'.format(SLEW_TIMEOUT))
+            return False
+        except futures.CancelledError:
+            logging.error('The telescope thread stopped before it could slew.')
+            return False
+        except Exception:
+            logging.exception('The telescope raised an error while slewing.')
+            return False
+
     def check_start_time(self, ticket):
         """
         Checks the start time of the given ticket and waits if it has not been reached yet.
@@ -413,6 +483,8 @@ class ObservationRun:
         ticket.exp_time = [ticket.exp_time] if type(ticket.exp_time) in (int, float) else ticket.exp_time
         ticket.filter = [ticket.filter] if type(ticket.filter) is str else ticket.filter
         if ticket.self_guide:
+            if guider_calibration.needs_calibration(ticket.dec):
+                self._calibrate_guider(ticket)
             self.guider.onThread(self.guider.guiding_procedure, self.image_directories[ticket])
         header_info = self.get_general_header_info(ticket)
         if ticket.cycle_filter:
@@ -694,6 +766,8 @@ class ObservationRun:
         self.flatlamp.onThread(self.flatlamp.stop)
         self.calibration.onThread(self.calibration.stop)
         logging.debug(' Shutting down thread monitor. Number of thread restarts: {}'.format(self.monitor.n_restarts))
+        logging.debug('Frame analysis cache statistics: {}'.format(frame_cache.get_cache().stats()))
+        analysis_service.stop_service()
         time.sleep(5)
 
     def _shutdown_procedure(self, calibration, cooler=True):
@@ -715,16 +789,23 @@ class ObservationRun:
         """
         logging.info("Shutting down observatory.")
         time.sleep(5)
-        self.dome.onThread(self.dome.slave_dome_to_scope, False)
-        self.telescope.onThread(self.telescope.park)
-        self.dome.onThread(self.dome.park)
-        self.dome.onThread(self.dome.move_shutter, 'close')
+        # Safety commands go ahead of anything still queued, and run during the cooperative waits of an exposure or
+        # dome move that is running.  Telescope.slew blocks in the synchronous SlewToCoordinates, so the park only
+        # runs once a slew in progress has returned
+        if self.conditions.weather_alert.isSet():
+            # The shutter is about to close on any exposure in progress
+            self.camera.onThread(self.camera.abort, priority=PRIORITY_SAFETY)
+        self.dome.onThread(self.dome.slave_dome_to_scope, False, priority=PRIORITY_SAFETY)
+        self.telescope.onThread(self.telescope.park, priority=PRIORITY_SAFETY)
+        self.dome.onThread(self.dome.park, priority=PRIORITY_SAFETY)
+        self.dome.onThread(self.dome.move_shutter, 'close', priority=PRIORITY_SAFETY)
         time.sleep(2)
         self.telescope.slew_done.wait()
         self.dome.move_done.wait()
         self.dome.shutter_done.wait()
         time.sleep(2)
-        self.telescope.onThread(self.telescope.park)      # Backup in case a pulse guide interrupted the last park
+        # Backup in case a pulse guide interrupted the last park
+        self.telescope.onThread(self.telescope.park, priority=PRIORITY_SAFETY)
         self.telescope.slew_done.wait()
         if calibration:
             logging.info('Taking flats and darks...')
@@ -0,0 +1,51 @@
+import unittest
+import numpy as np
+
+from omegalambda.main.common.util.filereader_utils import background_stats
+
+
+class TestBackgroundStats(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.sky, self.noise = 1000, 20
+        self.image = rng.normal(self.sky, self.noise, (1024, 1024))
+        # A few bright stars and hot pixels for the clipping to reject
+        self.image[rng.integers(0, 1024, 500), rng.integers(0, 1024, 500)] += 30000
+
+    def test_fast_matches_exact(self):
+        mean, median, stdev = background_stats(self.image, method='exact')
+        fast_mean, fast_median, fast_stdev = background_stats(self.image, method='fast')
+        # Within the documented bounds: 0.5 ADU of binning plus the statistical error, and ~1% on the stdev
+        self.assertLess(abs(fast_median - median), 0.5 + 5 * 1.25 * self.noise / np.sqrt(2 ** 18))
+        self.assertLess(abs(fast_mean - mean), 0.5 + 5 * self.noise / np.sqrt(2 ** 18))
+        self.assertLess(abs(fast_stdev / stdev - 1), 0.02)
+
+    def test_exact_rejects_outliers(self):
+        mean, median, stdev = background_stats(self.image, method='exact')
+        self.assertAlmostEqual(median, self.sky, delta=1)
+        self.assertAlmostEqual(stdev, self.noise, delta=1)
+
+    def test_fast_integer_frame(self):
+        image = np.clip(np.rint(self.image), 0, 65535).astype(np.uint16)
+        mean, median, stdev = background_stats(image, method='fast')
+        self.assertAlmostEqual(median, self.sky, delta=1)
+        self.assertAlmostEqual(stdev, self.noise, delta=1)
+
+    def test_fast_ignores_nan(self):
+        image = self.image.copy()
+        image[:100] = np.nan
+        mean, median, stdev = background_stats(image, method='fast')
+        self.assertTrue(np.isfinite([mean, median, stdev]).all())
+        self.assertAlmostEqual(median, self.sky, delta=1)
+
+    def test_fast_empty(self):
+        self.assertTrue(np.isnan(background_stats(np.full((8, 8), np.nan), method='fast')).all())
+
+    def test_unknown_method(self):
+        with self.assertRaises(ValueError):
+            background_stats(self.image, method='median')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import unittest
+import numpy as np
+
+from omegalambda.main.common.util import filereader_utils
+
+# Tolerance accepted for the pyramid detector in crowded fields, as a fraction of the full-resolution star count
+PYRAMID_MISSED = 0.05
+PYRAMID_EXTRA = 0.05
+
+
+def synthetic_frame(xs, ys, amplitudes, size=1024, fwhm=5.0, seed=0):
+    rng = np.random.default_rng(seed)
+    image = rng.normal(1000, 15, (size, size))
+    sigma = fwhm / 2.3548
+    for x, y, amplitude in zip(xs, ys, amplitudes):
+        y0, x0 = int(y) - 20, int(x) - 20
+        yy, xx = np.mgrid[y0:y0 + 40, x0:x0 + 40]
+        image[y0:y0 + 40, x0:x0 + 40] += amplitude * np.exp(-((xx - x) ** 2 + (yy - y) ** 2) / (2 * sigma ** 2))
+    return np.clip(image, 0, 65535).astype(np.uint16)
+
+
+def unmatched(stars, others, radius=2.0):
+    if len(others) == 0:
+        return len(stars)
+    distance = np.hypot(stars.x[:, None] - others.x[None, :], stars.y[:, None] - others.y[None, :])
+    return int((distance.min(axis=1) > radius).sum())
+
+
+def detect(image):
+    mean, median, stdev = filereader_utils.background_stats(image, method='fast')
+    threshold = np.broadcast_to(np.float64(mean + 5 * stdev), image.shape)
+    full = filereader_utils._detect_stars(image, median, stdev, threshold, 40000, 50)
+    pyramid = filereader_utils._detect_stars_pyramid(image, median, stdev, threshold, 40000, 50)
+    return full, pyramid
+
+
+class TestPyramidDetection(unittest.TestCase):
+
+    def test_sparse_field_is_identical(self):
+        # Stars further apart than the 50 px peak separation
+        grid = np.arange(100, 1000, 120) + 0.3
+        xs, ys = [a.ravel() for a in np.meshgrid(grid, grid)]
+        amplitudes = np.random.default_rng(1).uniform(1000, 20000, len(xs))
+        full, pyramid = detect(synthetic_frame(xs, ys, amplitudes))
+        self.assertEqual(len(full), len(xs))
+        self.assertEqual(len(pyramid), len(full))
+        self.assertEqual(unmatched(full, pyramid, radius=0.01), 0)
+
+    def test_crowded_field_within_tolerance(self):
+        for seed in range(3):
+            rng = np.random.default_rng(seed)
+            xs, ys = rng.uniform(60, 964, 150), rng.uniform(60, 964, 150)
+            full, pyramid = detect(synthetic_frame(xs, ys, rng.uniform(1000, 20000, 150), seed=seed))
+            self.assertLessEqual(unmatched(full, pyramid), PYRAMID_MISSED * len(full))
+            self.assertLessEqual(unmatched(pyramid, full), PYRAMID_EXTRA * len(full))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+import unittest
+import numpy as np
+
+from omegalambda.main.common.util import drift_model
+from omegalambda.main.common.util.drift_model import AxisModel, DriftModel
+
+
+def simulate(model, rate, gain, steps, interval=10.0, exposure=0.0, seed=0, noise=0.0):
+    """
+    Guides a mount that drifts at rate arcseconds per second and makes gain of every correction, sending the
+    corrections the model asks for after each measurement.  Returns the true error after each measurement.
+    """
+    rng = np.random.default_rng(seed)
+    error, errors = 0.0, []
+    for step in range(steps):
+        time = step * interval
+        model.update(time, error + rng.normal(0, noise), error + rng.normal(0, noise), exposure)
+        ra, dec, _, _ = model.correction(time, lead=interval / 2)
+        model.apply(time, ra, dec)
+        error += rate * interval - gain * ra
+        errors.append(error)
+    return np.array(errors)
+
+
+class TestAxisModel(unittest.TestCase):
+
+    def test_not_ready_until_two_measurements(self):
+        axis = AxisModel()
+        self.assertEqual(axis.predict(0), 0)
+        self.assertEqual(axis.uncertainty(0), np.inf)
+        axis.update(0, 1.0)
+        self.assertFalse(axis.ready)
+        axis.update(10, 1.5)
+        self.assertTrue(axis.ready)
+
+    def test_steady_drift(self):
+        axis = AxisModel(measurement_noise=0.01)
+        for time in range(0, 100, 10):
+            axis.update(time, 0.05 * time)
+        self.assertAlmostEqual(axis.state[1], 0.05, delta=0.002)
+        self.assertAlmostEqual(axis.predict(120), 6.0, delta=0.1)
+        self.assertLess(axis.uncertainty(90), axis.uncertainty(120))
+
+    def test_corrections_are_predicted(self):
+        axis = AxisModel()
+        axis.update(0, 2.0)
+        axis.apply(1, 2.0)
+        self.assertAlmostEqual(axis.predict(1), 0.0)
+        # Applied corrections are only forgotten once a measurement after them has been made
+        axis.update(0.5, 2.0)
+        self.assertEqual(len(axis.pending), 1)
+        axis.update(5, 0.0)
+        self.assertEqual(axis.pending, [])
+
+    def test_jump_resets_error(self):
+        axis = AxisModel()
+        for time in range(0, 50, 10):
+            axis.update(time, 0.0)
+        rate = axis.state[1]
+        axis.update(50, 20.0)
+        self.assertAlmostEqual(axis.state[0], 20.0)
+        # The jump is not blamed on the drift rate
+        self.assertAlmostEqual(axis.state[1], rate)
+        self.assertAlmostEqual(axis.uncertainty(50), drift_model.MEASUREMENT_NOISE, places=6)
+
+    def test_reset_keeps_gain(self):
+        axis = AxisModel(gain=0.7)
+        axis.update(0, 1.0)
+        axis.update(10, 2.0)
+        axis.reset()
+        self.assertIsNone(axis.time)
+        self.assertFalse(axis.ready)
+        self.assertEqual(axis.gain, 0.7)
+
+
+class TestDriftModel(unittest.TestCase):
+
+    def test_learns_gain(self):
+        model = DriftModel()
+        # Large jumps between measurements so the corrections are big enough to learn from
+        rng = np.random.default_rng(0)
+        error = 0.0
+        for step in range(60):
+            time = step * 10.0
+            error += rng.choice([-1, 1]) * 5.0 * (step % 5 == 0)
+            model.update(time, error, error)
+            ra, dec, _, _ = model.correction(time)
+            model.apply(time, ra, dec)
+            error -= 0.5 * ra
+        self.assertAlmostEqual(model.gains[0], 0.5, delta=0.1)
+        self.assertAlmostEqual(model.gains[1], 0.5, delta=0.1)
+
+    def test_gain_is_clipped(self):
+        model = DriftModel(ra_gain=10, dec_gain=0.01)
+        model.update(0, 0, 0)
+        model.update(10, 0, 0)
+        low, high = drift_model.GAIN_LIMITS
+        self.assertLessEqual(model.gains[0], high)
+        self.assertGreaterEqual(model.gains[1], low)
+
+    def test_guiding_keeps_up_with_drift(self):
+        model = DriftModel()
+        errors = simulate(model, rate=0.05, gain=1.0, steps=50, noise=0.1)
+        self.assertTrue(model.ready)
+        # Once the rate is known the error stays within a fraction of one interval's drift
+        self.assertLess(np.abs(errors[10:]).max(), 0.5)
+
+    def test_no_correction_within_noise(self):
+        model = DriftModel()
+        model.update(0, 0.1, -0.1)
+        model.update(10, -0.1, 0.1)
+        ra, dec, expected_ra, expected_dec = model.correction(10)
+        self.assertEqual((ra, dec), (0.0, 0.0))
+        self.assertEqual((expected_ra, expected_dec), (0.0, 0.0))
+
+    def test_correction_divides_by_gain(self):
+        model = DriftModel(ra_gain=0.5, dec_gain=2.0)
+        model.update(0, 10.0, 10.0)
+        ra, dec, expected_ra, expected_dec = model.correction(0)
+        self.assertAlmostEqual(expected_ra, 10.0)
+        self.assertAlmostEqual(ra, 20.0)
+        self.assertAlmostEqual(dec, 5.0)
+
+    def test_reset(self):
+        model = DriftModel()
+        model.update(0, 1.0, 1.0)
+        self.assertEqual(model.time, 0)
+        model.reset()
+        self.assertIsNone(model.time)
+        self.assertEqual(model.predict(10), (0.0, 0.0))
+
+
+if __name__ == '__main__':
+    unittest.main()
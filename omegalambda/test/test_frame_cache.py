@@ -0,0 +1,82 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+from omegalambda.main.common.util.frame_cache import FrameAnalysisCache
+
+
+class TestFrameAnalysisCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'frame.fits')
+        self._write(b'a' * 100)
+        self.cache = FrameAnalysisCache(max_bytes=1024 ** 2)
+        self.calls = 0
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _write(self, content, mtime_ns=None):
+        with open(self.path, 'wb') as file:
+            file.write(content)
+        if mtime_ns is not None:
+            os.utime(self.path, ns=(mtime_ns, mtime_ns))
+
+    def _compute(self):
+        self.calls += 1
+        return np.full(10, self.calls)
+
+    def test_hit(self):
+        first = self.cache.get(self.path, 'data', self._compute)
+        second = self.cache.get(self.path, 'data', self._compute)
+        self.assertIs(first, second)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(self.cache.stats()['hits'], 1)
+        self.assertFalse(first.flags.writeable)
+
+    def test_items_are_separate(self):
+        self.cache.get(self.path, 'data', self._compute)
+        self.cache.get(self.path, ('stars', 60000, None), self._compute)
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(self.cache.stats()['frames'], 1)
+
+    def test_invalidated_by_mtime(self):
+        self._write(b'a' * 100, mtime_ns=1_000_000_000)
+        self.cache.get(self.path, 'data', self._compute)
+        self._write(b'b' * 100, mtime_ns=2_000_000_000)
+        value = self.cache.get(self.path, 'data', self._compute)
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(value[0], 2)
+        # The stale entry for the old file is dropped, not kept alongside the new one
+        self.assertEqual(self.cache.stats()['frames'], 1)
+
+    def test_invalidated_by_size(self):
+        self._write(b'a' * 100, mtime_ns=1_000_000_000)
+        self.cache.get(self.path, 'data', self._compute)
+        self._write(b'a' * 200, mtime_ns=1_000_000_000)
+        self.cache.get(self.path, 'data', self._compute)
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(self.cache.stats()['frames'], 1)
+
+    def test_eviction(self):
+        cache = FrameAnalysisCache(max_bytes=150)
+        other = os.path.join(self.directory, 'other.fits')
+        with open(other, 'wb') as file:
+            file.write(b'c')
+        cache.get(self.path, 'data', lambda: np.zeros(10))
+        cache.get(other, 'data', lambda: np.zeros(10))
+        self.assertEqual(cache.stats()['frames'], 1)
+        self.assertLessEqual(cache.nbytes, 150)
+
+    def test_not_a_path(self):
+        self.cache.get(np.zeros(4), 'data', self._compute)
+        self.cache.get(np.zeros(4), 'data', self._compute)
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(self.cache.stats()['frames'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+from omegalambda.main.common.util import guide_telemetry
+from omegalambda.main.common.util.guide_telemetry import TelemetryBuffer, FAILED, CORRECTED, PREDICTED
+
+
+def record(buffer, i, flags=CORRECTED):
+    buffer.record(1000.0 + i, i, 0.5, -0.5, np.hypot(0.5, 0.5), 1.0, -1.0, 0.01, flags)
+
+
+class TestTelemetryBuffer(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = guide_telemetry.telemetry_path(self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_records_before_wrap(self):
+        buffer = TelemetryBuffer(capacity=8)
+        self.assertEqual(len(buffer.records()), 0)
+        for i in range(5):
+            record(buffer, i)
+        self.assertEqual(len(buffer), 5)
+        np.testing.assert_array_equal(buffer.records()['sequence'], range(5))
+        np.testing.assert_array_equal(buffer.records(3)['sequence'], [3, 4])
+        self.assertEqual(len(buffer.records(5)), 0)
+
+    def test_wrap_keeps_newest(self):
+        buffer = TelemetryBuffer(capacity=8)
+        for i in range(19):
+            record(buffer, i)
+        self.assertEqual(len(buffer), 8)
+        np.testing.assert_array_equal(buffer.records()['sequence'], range(11, 19))
+        # Records that were overwritten are not returned
+        np.testing.assert_array_equal(buffer.records(2)['sequence'], range(11, 19))
+        np.testing.assert_array_equal(buffer.records(15)['sequence'], range(15, 19))
+        np.testing.assert_allclose(buffer.records()['time'], 1000.0 + np.arange(11, 19))
+
+    def test_wrap_on_exact_capacity(self):
+        buffer = TelemetryBuffer(capacity=8)
+        for i in range(16):
+            record(buffer, i)
+        np.testing.assert_array_equal(buffer.records()['sequence'], range(8, 16))
+
+    def test_records_are_copies(self):
+        buffer = TelemetryBuffer(capacity=8)
+        record(buffer, 0)
+        records = buffer.records()
+        record(buffer, 1)
+        records['sequence'][0] = 99
+        self.assertEqual(buffer.records()['sequence'][0], 0)
+
+    def test_flush_appends_new_records(self):
+        buffer = TelemetryBuffer(self.path, capacity=8)
+        self.assertEqual(buffer.flush(), 0)
+        self.assertFalse(os.path.exists(self.path))
+        for i in range(5):
+            record(buffer, i)
+        self.assertEqual(buffer.flush(), 5)
+        self.assertEqual(buffer.flush(), 0)
+        for i in range(5, 9):
+            record(buffer, i)
+        self.assertEqual(buffer.flush(), 4)
+        records = guide_telemetry.read_telemetry(self.directory)
+        np.testing.assert_array_equal(records['sequence'], range(9))
+        self.assertAlmostEqual(float(records['separation'][0]), np.hypot(0.5, 0.5), places=6)
+
+    def test_flush_after_wrap_warns(self):
+        buffer = TelemetryBuffer(self.path, capacity=8)
+        for i in range(3):
+            record(buffer, i)
+        buffer.flush()
+        for i in range(3, 20):
+            record(buffer, i)
+        with self.assertLogs(level='WARNING') as logs:
+            self.assertEqual(buffer.flush(), 8)
+        self.assertIn('9 guide telemetry records', logs.output[0])
+        np.testing.assert_array_equal(guide_telemetry.read_telemetry(self.path)['sequence'],
+                                      list(range(3)) + list(range(12, 20)))
+
+    def test_flush_without_path(self):
+        buffer = TelemetryBuffer(capacity=8)
+        record(buffer, 0)
+        self.assertEqual(buffer.flush(), 0)
+
+    def test_truncated_record_is_dropped(self):
+        buffer = TelemetryBuffer(self.path, capacity=8)
+        for i in range(3):
+            record(buffer, i)
+        buffer.flush()
+        with open(self.path, 'ab') as file:
+            file.write(b'\0' * 5)
+        self.assertEqual(len(guide_telemetry.read_telemetry(self.path)), 3)
+
+
+class TestTelemetryQuery(unittest.TestCase):
+
+    def setUp(self):
+        buffer = TelemetryBuffer(capacity=16)
+        record(buffer, 0, flags=0)
+        record(buffer, 1, flags=FAILED)
+        record(buffer, 2, flags=CORRECTED)
+        record(buffer, 3, flags=CORRECTED | PREDICTED)
+        self.records = buffer.records()
+
+    def test_query(self):
+        self.assertEqual(len(guide_telemetry.query(self.records, start=1001, end=1002)), 2)
+        self.assertEqual(len(guide_telemetry.query(self.records, flags=CORRECTED)), 2)
+        self.assertEqual(len(guide_telemetry.query(self.records, flags=CORRECTED, without=PREDICTED)), 1)
+
+    def test_summary(self):
+        summary = guide_telemetry.summary(self.records)
+        self.assertEqual(summary['images'], 3)
+        self.assertEqual(summary['failures'], 1)
+        self.assertEqual(summary['corrections'], 2)
+        self.assertAlmostEqual(summary['rms_separation'], np.hypot(0.5, 0.5), places=6)
+        self.assertAlmostEqual(summary['ra_total'], 2.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from astropy.io import fits
+from concurrent import futures
+
+from omegalambda.main.common.util.drift_model import DriftModel
+from omegalambda.main.observing.guider import Guider
+
+
+def star_frame(stars, size=1536, fwhm=4.0, seed=0):
+    """
+    Gaussian stars on a noisy background.  Full-frame detection skips a 500 px border, so the guide star candidates
+    have to be in the middle.
+    """
+    rng = np.random.default_rng(seed)
+    image = rng.normal(1000, 10, (size, size))
+    sigma = fwhm / 2.3548
+    for x, y, amplitude in stars:
+        y_0, x_0 = max(int(y) - 20, 0), max(int(x) - 20, 0)
+        yy, xx = np.mgrid[y_0:int(y) + 20, x_0:int(x) + 20]
+        image[y_0:int(y) + 20, x_0:int(x) + 20] += amplitude * np.exp(-((xx - x) ** 2 + (yy - y) ** 2) /
+                                                                      (2 * sigma ** 2))
+    return np.clip(image, 0, 65535).astype(np.uint16)
+
+
+class TestGuideStar(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.guider = Guider(None, None)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, stars):
+        path = os.path.join(self.directory, name)
+        fits.writeto(path, star_frame(stars), overwrite=True)
+        return path
+
+    def test_unmoved_star_has_no_offset(self):
+        # Guide stars at fractional positions, one close enough to the edge for the subframe to be clipped
+        stars = [(700.7, 750.3, 15000), (600.2, 900.6, 8000), (900.4, 600.8, 8000), (40.6, 60.3, 5000)]
+        path = self.write('frame.fits', stars)
+        star = self.guider.find_guide_star(path)
+        self.assertAlmostEqual(star[0], 700.7, delta=0.05)
+        self.assertAlmostEqual(star[1], 750.3, delta=0.05)
+        for reference in (star, (40.6, 60.3)):
+            x, y = self.guider.find_guide_star(path, subframe=reference)
+            x_0, y_0 = self.guider.subframe_position(*reference)
+            self.assertLess(np.hypot(x - x_0, y - y_0), 0.05)
+
+    def test_moved_star_offset(self):
+        stars = [(700.7, 750.3, 15000), (600.2, 900.6, 8000), (900.4, 600.8, 8000)]
+        star = self.guider.find_guide_star(self.write('first.fits', stars))
+        moved = self.write('second.fits', [(x + 0.4, y - 0.3, amplitude) for x, y, amplitude in stars])
+        x, y = self.guider.find_guide_star(moved, subframe=star)
+        x_0, y_0 = self.guider.subframe_position(*star)
+        self.assertAlmostEqual(x - x_0, 0.4, delta=0.05)
+        self.assertAlmostEqual(y - y_0, -0.3, delta=0.05)
+
+
+
+class TestImageShape(unittest.TestCase):
+
+    def setUp(self):
+        self.guider = Guider(None, None)
+
+    def test_measured_shape(self):
+        self.assertEqual(self.guider.check_image_shape((0.05, 10.0, 40)), 0.05)
+        self.assertIsNone(self.guider.check_image_shape((np.nan, np.nan, 0)))
+
+    def test_pending_measurement_is_checked_when_done(self):
+        shape = futures.Future()
+        self.assertIsNone(self.guider.check_image_shape(shape))
+        with self.assertLogs(level='WARNING') as logs:
+            shape.set_result((0.5, 30.0, 40))
+        self.assertIn('elongated', logs.output[0])
+
+    def test_failed_measurement(self):
+        shape = futures.Future()
+        shape.set_exception(RuntimeError('analysis error'))
+        self.assertIsNone(self.guider.check_image_shape(shape))
+
+
+
+class FakeTelescope:
+    """
+    Telescope thread stand-in whose corrections resolve at once, to True if it works or to an error if not.
+    """
+
+    def __init__(self, works):
+        self.works = works
+        self.sent = []
+
+    def guide_correction(self, ra_distance, dec_distance):
+        pass
+
+    def onThread(self, function, *args, **kwargs):
+        future = futures.Future()
+        self.sent.append(args)
+        if self.works:
+            future.set_result(True)
+        else:
+            future.set_exception(RuntimeError('mount error'))
+        return future
+
+
+class TestAnticipate(unittest.TestCase):
+
+    def guider(self, works):
+        guider = Guider(None, FakeTelescope(works))
+        guider.drift_model = DriftModel()
+        # An error of 5" on both axes, far outside the noise
+        guider.drift_model.update(time.time(), 5.0, 5.0)
+        return guider
+
+    def test_correction_is_learned(self):
+        guider = self.guider(works=True)
+        guider.anticipate()
+        self.assertEqual(len(guider.telescope.sent), 1)
+        self.assertEqual(len(guider.drift_model.axes[0].pending), 1)
+
+    def test_failed_correction_is_not_learned(self):
+        guider = self.guider(works=False)
+        with self.assertLogs(level='WARNING'):
+            guider.anticipate()
+        self.assertEqual(len(guider.telescope.sent), 1)
+        self.assertEqual(guider.drift_model.axes[0].pending, [])
+        self.assertEqual(guider.drift_model.axes[1].pending, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
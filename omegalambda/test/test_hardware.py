@@ -0,0 +1,292 @@
+import time
+import types
+import threading
+import unittest
+from unittest import mock
+from concurrent import futures
+
+from omegalambda.main.common.util import frame_feed
+from omegalambda.main.controller import hardware, dome, camera
+from omegalambda.main.controller.hardware import Hardware, PRIORITY_SAFETY, PRIORITY_NORMAL, PRIORITY_BACKGROUND
+
+# Seconds any test waits for a device thread before failing
+TIMEOUT = 5
+
+
+class Device(Hardware):
+    """
+    Hardware thread without hardware: connecting always works.
+    """
+
+    def __init__(self):
+        self.ran = []
+        self.release = threading.Event()
+        self.waiting = threading.Event()
+        super(Device, self).__init__(name='Device')
+
+    def _class_connect(self):
+        return True
+
+    def command(self, name):
+        self.ran.append(name)
+        return name
+
+    def block(self):
+        # Holds the thread until the test releases it, so commands can be queued behind it
+        self.release.wait(TIMEOUT)
+
+    def fail(self):
+        raise RuntimeError('device error')
+
+    def wait(self, name):
+        # A long move, waited on cooperatively until the test releases it
+        self.waiting.set()
+        interrupted = self.wait_until(self.release.is_set, interval=0.01)
+        self.ran.append((name, interrupted))
+        return interrupted
+
+
+class TestFutures(unittest.TestCase):
+
+    def setUp(self):
+        self.device = Device()
+        self.device.start()
+
+    def tearDown(self):
+        self.device.release.set()
+        if self.device.is_alive():
+            self.device.onThread(self.device.stop)
+        self.device.join(TIMEOUT)
+
+    def test_result(self):
+        self.assertEqual(self.device.onThread(self.device.command, 'a').result(timeout=TIMEOUT), 'a')
+
+    def test_exception_ends_thread_and_cancels_later_calls(self):
+        # The crash is expected, so it is not reported as an unhandled thread exception
+        with mock.patch('threading.excepthook'):
+            future = self.device.onThread(self.device.fail)
+            with self.assertRaises(RuntimeError):
+                future.result(timeout=TIMEOUT)
+            self.device.join(TIMEOUT)
+        self.assertFalse(self.device.is_alive())
+        # Nothing restarts the thread: calls put on it from now on are cancelled at once instead of blocking
+        later = self.device.onThread(self.device.command, 'b')
+        self.assertTrue(later.cancelled())
+        with self.assertRaises(futures.CancelledError):
+            later.result(timeout=TIMEOUT)
+
+    def test_calls_queued_at_stop_are_cancelled(self):
+        self.device.onThread(self.device.block)
+        self.device.onThread(self.device.stop)
+        queued = self.device.onThread(self.device.command, 'a')
+        self.device.release.set()
+        self.device.join(TIMEOUT)
+        with self.assertRaises(futures.CancelledError):
+            queued.result(timeout=TIMEOUT)
+        self.assertEqual(self.device.ran, [])
+
+    def test_caller_cancels_queued_call(self):
+        self.device.onThread(self.device.block)
+        queued = self.device.onThread(self.device.command, 'a')
+        self.assertTrue(queued.cancel())
+        self.device.release.set()
+        self.device.onThread(self.device.command, 'b').result(timeout=TIMEOUT)
+        self.assertEqual(self.device.ran, ['b'])
+
+
+
+class TestPriorityQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.device = Device()
+        self.device.start()
+
+    def tearDown(self):
+        self.device.release.set()
+        self.device.onThread(self.device.stop)
+        self.device.join(TIMEOUT)
+
+    def test_lanes_then_fifo(self):
+        self.device.onThread(self.device.block)
+        for name, priority in [('a', PRIORITY_NORMAL), ('b', PRIORITY_BACKGROUND), ('c', PRIORITY_SAFETY),
+                               ('d', PRIORITY_NORMAL), ('e', PRIORITY_SAFETY), ('f', PRIORITY_BACKGROUND)]:
+            last = self.device.onThread(self.device.command, name, priority=priority)
+        self.device.release.set()
+        last.result(timeout=TIMEOUT)
+        self.assertEqual(self.device.ran, ['c', 'e', 'a', 'd', 'b', 'f'])
+
+    def test_safety_command_interrupts_wait(self):
+        waiting = self.device.onThread(self.device.wait, 'move')
+        self.assertTrue(self.device.waiting.wait(TIMEOUT))
+        safety = self.device.onThread(self.device.command, 'abort', priority=PRIORITY_SAFETY)
+        normal = self.device.onThread(self.device.command, 'next')
+        self.assertEqual(safety.result(timeout=TIMEOUT), 'abort')
+        # The wait ends as soon as the safety command has run, so the move can be abandoned
+        self.assertTrue(waiting.result(timeout=TIMEOUT))
+        normal.result(timeout=TIMEOUT)
+        self.assertEqual(self.device.ran, ['abort', ('move', True), 'next'])
+
+    def test_normal_command_does_not_interrupt_wait(self):
+        waiting = self.device.onThread(self.device.wait, 'move')
+        self.assertTrue(self.device.waiting.wait(TIMEOUT))
+        normal = self.device.onThread(self.device.command, 'next')
+        time.sleep(0.1)
+        self.assertFalse(normal.done())
+        self.device.release.set()
+        self.assertFalse(waiting.result(timeout=TIMEOUT))
+        normal.result(timeout=TIMEOUT)
+        self.assertEqual(self.device.ran, [('move', False), 'next'])
+
+    def test_safety_commands_do_not_interrupt_each_other(self):
+        first = self.device.onThread(self.device.wait, 'park', priority=PRIORITY_SAFETY)
+        self.assertTrue(self.device.waiting.wait(TIMEOUT))
+        second = self.device.onThread(self.device.command, 'close', priority=PRIORITY_SAFETY)
+        time.sleep(0.1)
+        self.assertFalse(second.done())
+        self.device.release.set()
+        self.assertFalse(first.result(timeout=TIMEOUT))
+        second.result(timeout=TIMEOUT)
+        self.assertEqual(self.device.ran, [('park', False), 'close'])
+
+    def test_wait_off_thread_runs_nothing(self):
+        self.device.onThread(self.device.block)
+        safety = self.device.onThread(self.device.command, 'abort', priority=PRIORITY_SAFETY)
+        self.device.release.set()
+        # Called from the test thread: commands can only run on the device thread
+        self.assertFalse(self.device.wait_until(lambda: safety.done(), interval=0.01))
+        self.assertEqual(self.device.ran, ['abort'])
+
+
+class FakeDome:
+    """
+    ASCOM dome whose shutter moves at once, and which reports that it is slewing until the test says otherwise.
+    """
+
+    def __init__(self):
+        self.ShutterStatus = 1
+        self.slewing = threading.Event()
+        self.slewing.set()
+        self.polled = threading.Event()
+        self.AtPark = True
+
+    @property
+    def Slewing(self):
+        self.polled.set()
+        return self.slewing.is_set()
+
+    def OpenShutter(self):
+        self.ShutterStatus = 0
+
+    def CloseShutter(self):
+        self.ShutterStatus = 1
+
+
+class StubDome(dome.Dome):
+
+    def _class_connect(self):
+        self.Dome = FakeDome()
+        return True
+
+
+class TestDomeSafety(unittest.TestCase):
+
+    def setUp(self):
+        # The dome's waits take seconds, so the tests run them on a fast clock
+        fast = types.SimpleNamespace(sleep=lambda seconds: time.sleep(min(seconds, 0.01)), monotonic=time.monotonic)
+        for module in (hardware, dome):
+            patcher = mock.patch.object(module, 'time', fast)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.dome = StubDome()
+        self.dome.start()
+
+    def tearDown(self):
+        self.dome.Dome.slewing.clear()
+        self.dome.onThread(self.dome.stop)
+        self.dome.join(TIMEOUT)
+
+    def test_safety_close_during_pending_open_leaves_shutter_closed(self):
+        opening = self.dome.onThread(self.dome.move_shutter, 'open')
+        # The open is waiting for the dome to finish slewing when the safety close arrives
+        self.assertTrue(self.dome.Dome.polled.wait(TIMEOUT))
+        closing = self.dome.onThread(self.dome.move_shutter, 'close', priority=PRIORITY_SAFETY)
+        self.dome.Dome.slewing.clear()
+        self.assertTrue(closing.result(timeout=TIMEOUT))
+        self.assertFalse(opening.result(timeout=TIMEOUT))
+        self.assertEqual(self.dome.Dome.ShutterStatus, 1)
+        self.assertTrue(self.dome.shutter_done.is_set())
+
+    def test_open_without_interruption(self):
+        self.dome.Dome.slewing.clear()
+        self.assertTrue(self.dome.onThread(self.dome.move_shutter, 'open').result(timeout=TIMEOUT))
+        self.assertEqual(self.dome.Dome.ShutterStatus, 0)
+
+
+
+class FakeMaxIm:
+    """
+    MaxIm DL camera whose exposures are ready at once.  Reading the image buffer fails the test, since the camera
+    thread must not transfer it.
+    """
+
+    def __init__(self):
+        self.ImageReady = True
+        self.calls = []
+
+    def __getattr__(self, name):
+        if name == 'ImageArray':
+            raise AssertionError('The camera thread read the image buffer')
+        return lambda *args: self.calls.append((name, args))
+
+
+class StubCamera(camera.Camera):
+
+    def _class_connect(self):
+        self.Camera = FakeMaxIm()
+        return True
+
+
+class TestCameraShape(unittest.TestCase):
+
+    def setUp(self):
+        self.camera = StubCamera()
+        self.camera.start()
+        self.measured = futures.Future()
+        self.service = mock.Mock()
+        self.service.frame_shape.return_value = self.measured
+        patcher = mock.patch.object(camera.analysis_service, 'get_service', return_value=self.service)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.camera.onThread(self.camera.stop)
+        self.camera.join(TIMEOUT)
+
+    def test_shape_is_measured_after_saving_without_blocking(self):
+        with frame_feed.get_feed().subscribe() as frames:
+            self.camera.onThread(self.camera.expose, 10, 1, save_path='frame.fits', OBJECT='target').result(
+                timeout=TIMEOUT)
+            frame = frames.get(timeout=TIMEOUT)
+        # The frame was saved and published while the measurement was still running
+        names = [name for name, _ in self.camera.Camera.calls]
+        self.assertEqual(names[-2:], ['SetFITSKey', 'SaveImage'])
+        self.service.frame_shape.assert_called_once_with('frame.fits', self.camera.config_dict.saturation)
+        self.assertIs(frame.metadata['shape'], self.measured)
+        self.assertIsNone(self.camera.image_shape)
+        self.measured.set_result((0.05, 10.0, 40))
+        self.assertEqual(self.camera.image_shape, (0.05, 10.0, 40))
+
+    def test_failed_measurement_is_ignored(self):
+        self.camera.onThread(self.camera.expose, 10, 1, save_path='frame.fits').result(timeout=TIMEOUT)
+        with self.assertLogs(level='WARNING'):
+            self.measured.set_exception(RuntimeError('analysis error'))
+        self.assertIsNone(self.camera.image_shape)
+        self.assertTrue(self.camera.is_alive())
+
+    def test_darks_are_not_measured(self):
+        self.camera.onThread(self.camera.expose, 10, 1, save_path='dark.fits', type='dark').result(timeout=TIMEOUT)
+        self.service.frame_shape.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+import unittest
+import numpy as np
+
+from omegalambda.main.common.util import image_registration
+from omegalambda.main.common.datatype import star_list
+
+
+def star_field(n_stars, size=256, shift=(0.0, 0.0), fwhm=4.0, seed=0, noise_seed=None):
+    """
+    The same field of Gaussian stars for a given seed, moved by shift (dx, dy) pixels, with fresh noise.
+    """
+    rng = np.random.default_rng(seed)
+    noise = np.random.default_rng(noise_seed)
+    sigma = fwhm / 2.3548
+    yy, xx = np.mgrid[0:size, 0:size]
+    frame = noise.normal(1000, 10, (size, size))
+    for x, y, amp in zip(rng.uniform(0, size, n_stars) + shift[0], rng.uniform(0, size, n_stars) + shift[1],
+                         rng.uniform(2000, 20000, n_stars)):
+        frame += amp * np.exp(-((xx - x) ** 2 + (yy - y) ** 2) / (2 * sigma ** 2))
+    return frame.astype(np.float32)
+
+
+class TestPhaseReference(unittest.TestCase):
+
+    def test_known_shift(self):
+        reference = image_registration.PhaseReference(star_field(100, noise_seed=1))
+        dx, dy, quality = reference.offset(star_field(100, shift=(3.3, -1.8), noise_seed=2))
+        self.assertAlmostEqual(dx, 3.3, delta=0.1)
+        self.assertAlmostEqual(dy, -1.8, delta=0.1)
+        self.assertGreater(quality, 0.4)
+
+    def test_no_shift(self):
+        reference = image_registration.PhaseReference(star_field(100, noise_seed=1))
+        dx, dy, quality = reference.offset(star_field(100, noise_seed=2))
+        self.assertLess(np.hypot(dx, dy), 0.1)
+
+    def test_different_field_has_low_quality(self):
+        reference = image_registration.PhaseReference(star_field(100, seed=0, noise_seed=1))
+        _, _, quality = reference.offset(star_field(100, seed=5, noise_seed=2))
+        self.assertLess(quality, 0.4)
+
+    def test_binned_region(self):
+        image = star_field(100, size=512, noise_seed=1)
+        region = image_registration.read_region(image, None, 4)
+        self.assertEqual(region.shape, (128, 128))
+        self.assertAlmostEqual(float(region.sum()), float(image.sum()), delta=1e-4 * float(image.sum()))
+        self.assertEqual(image_registration.read_region(image, 128).shape, (128, 128))
+
+    def test_shape_mismatch(self):
+        reference = image_registration.PhaseReference(star_field(10))
+        with self.assertRaises(ValueError):
+            reference.offset(star_field(10, size=128))
+
+
+class TestStarReference(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.x, self.y = rng.uniform(0, 2000, 80), rng.uniform(0, 2000, 80)
+        self.peak = rng.uniform(1000, 30000, 80)
+        self.reference = image_registration.StarReference(star_list.StarList.from_arrays(self.x, self.y, self.peak),
+                                                          max_shift=30)
+
+    def moved(self, dx, dy, rotation=0.0, keep=None):
+        center = self.reference.center
+        cos, sin = np.cos(rotation), np.sin(rotation)
+        x = center[0] + (self.x - center[0]) * cos - (self.y - center[1]) * sin + dx
+        y = center[1] + (self.x - center[0]) * sin + (self.y - center[1]) * cos + dy
+        keep = slice(None) if keep is None else keep
+        return star_list.StarList.from_arrays(x[keep], y[keep], self.peak[keep])
+
+    def test_known_shift(self):
+        dx, dy, rotation, n_matched = self.reference.offset(self.moved(12.4, -7.9))
+        self.assertAlmostEqual(dx, 12.4, places=3)
+        self.assertAlmostEqual(dy, -7.9, places=3)
+        self.assertAlmostEqual(rotation, 0, places=5)
+        self.assertEqual(n_matched, len(self.reference.stars))
+
+    def test_shift_and_rotation(self):
+        dx, dy, rotation, _ = self.reference.offset(self.moved(-5.0, 3.0, rotation=np.radians(0.05)))
+        self.assertAlmostEqual(dx, -5.0, places=2)
+        self.assertAlmostEqual(dy, 3.0, places=2)
+        self.assertAlmostEqual(rotation, np.radians(0.05), places=5)
+
+    def test_missing_and_saturated_stars(self):
+        stars = self.moved(4.0, 4.0, keep=np.arange(80) % 3 != 0)
+        stars.flags[:5] |= star_list.SATURATED
+        # A star that has moved on its own (i.e. a cosmic ray matched by chance) is clipped
+        stars.data['x'][10] += 2
+        dx, dy, _, n_matched = self.reference.offset(stars)
+        self.assertAlmostEqual(dx, 4.0, places=2)
+        self.assertAlmostEqual(dy, 4.0, places=2)
+        self.assertGreater(n_matched, 30)
+
+    def test_no_match(self):
+        self.assertEqual(self.reference.offset(star_list.StarList())[3], 0)
+        far = self.moved(500, 500)
+        self.assertLess(self.reference.offset(far)[3], 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import unittest
+import numpy as np
+
+from omegalambda.main.common.util.filereader_utils import second_moments
+
+
+def gaussian_stamps(sigma_a, sigma_b, angles, dx, dy, r=15, amplitude=1000.0):
+    """
+    Noise-free elliptical Gaussian stamps of shape (number of stars, 2r, 2r), centered (dx, dy) from the center pixel.
+    """
+    offsets = np.arange(-r, r, dtype=float)
+    x = offsets[None, None, :] - np.asarray(dx, dtype=float)[:, None, None]
+    y = offsets[None, :, None] - np.asarray(dy, dtype=float)[:, None, None]
+    theta = np.radians(np.asarray(angles, dtype=float))[:, None, None]
+    u = x * np.cos(theta) + y * np.sin(theta)
+    v = -x * np.sin(theta) + y * np.cos(theta)
+    sigma_a = np.asarray(sigma_a, dtype=float)[:, None, None]
+    sigma_b = np.asarray(sigma_b, dtype=float)[:, None, None]
+    return amplitude * np.exp(-u ** 2 / (2 * sigma_a ** 2) - v ** 2 / (2 * sigma_b ** 2))
+
+
+class TestSecondMoments(unittest.TestCase):
+
+    def test_round_star(self):
+        stamps = gaussian_stamps([2.0], [2.0], [0], [0.3], [-0.2])
+        ellipticity, angle = second_moments(stamps, np.ones(stamps.shape, bool), [0.3], [-0.2], np.array([4.71]))
+        self.assertLess(ellipticity[0], 0.01)
+
+    def test_elongated_stars(self):
+        angles = np.array([0.0, 30.0, -45.0, 80.0])
+        sigma_a, sigma_b = np.full(4, 3.0), np.full(4, 2.0)
+        dx, dy = np.array([0.0, 0.4, -0.3, 0.1]), np.array([0.0, -0.2, 0.25, 0.45])
+        stamps = gaussian_stamps(sigma_a, sigma_b, angles, dx, dy)
+        fwhm = 2.3548 * np.sqrt(sigma_a * sigma_b)
+        ellipticity, angle = second_moments(stamps, np.ones(stamps.shape, bool), dx, dy, fwhm)
+        # The weighting is divided back out, which is exact for Gaussian stars
+        np.testing.assert_allclose(ellipticity, 1 - 2.0 / 3.0, atol=0.01)
+        np.testing.assert_allclose(angle, angles, atol=1.0)
+
+    def test_unknown_fwhm(self):
+        stamps = gaussian_stamps([3.0], [2.0], [20], [0], [0])
+        ellipticity, angle = second_moments(stamps, np.ones(stamps.shape, bool), [0], [0], np.array([np.nan]))
+        self.assertAlmostEqual(ellipticity[0], 1 / 3, delta=0.01)
+        self.assertAlmostEqual(angle[0], 20, delta=1)
+
+    def test_empty_stamp_is_nan(self):
+        stamps = np.zeros((1, 30, 30))
+        ellipticity, angle = second_moments(stamps, np.ones(stamps.shape, bool), [0], [0], np.array([4.0]))
+        self.assertTrue(np.isnan(ellipticity[0]))
+        self.assertTrue(np.isnan(angle[0]))
+
+
+if __name__ == '__main__':
+    unittest.main()
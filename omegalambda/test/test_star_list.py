@@ -0,0 +1,60 @@
+import unittest
+import numpy as np
+
+from omegalambda.main.common.datatype.star_list import StarList, SATURATED, BAD_PIXEL, CROWDED
+
+
+class TestStarList(unittest.TestCase):
+
+    def setUp(self):
+        self.stars = StarList.from_arrays([10, 50, 53, 200], [10, 50, 54, 20], peak=[100, 400, 300, 200],
+                                          flags=[0, SATURATED, 0, BAD_PIXEL])
+
+    def test_from_arrays(self):
+        self.assertEqual(len(self.stars), 4)
+        self.assertEqual((self.stars[1][0], self.stars[1][1]), (50, 50))
+        self.assertTrue(np.isnan(self.stars.fwhm).all())
+        self.assertEqual(self.stars.positions.shape, (4, 2))
+        self.assertEqual(self.stars.to_list()[3], (200.0, 20.0))
+
+    def test_empty(self):
+        stars = StarList()
+        self.assertEqual(len(stars), 0)
+        self.assertEqual(stars.nearest(0, 0), (None, np.inf))
+        self.assertEqual(len(stars.neighbour_distances()), 0)
+
+    def test_indexing(self):
+        self.assertIsInstance(self.stars[1:3], StarList)
+        self.assertEqual(len(self.stars[self.stars.peak > 150]), 3)
+        np.testing.assert_array_equal(self.stars['peak'], [100, 400, 300, 200])
+
+    def test_sort(self):
+        np.testing.assert_array_equal(self.stars.sort().peak, [400, 300, 200, 100])
+        np.testing.assert_array_equal(self.stars.sort('x', descending=False).x, [10, 50, 53, 200])
+
+    def test_without_flags(self):
+        np.testing.assert_array_equal(self.stars.without_flags(SATURATED).peak, [100, 300, 200])
+        np.testing.assert_array_equal(self.stars.without_flags(SATURATED | BAD_PIXEL).peak, [100, 300])
+
+    def test_nearest(self):
+        index, distance = self.stars.nearest(52, 52)
+        self.assertEqual(index, 2)
+        self.assertAlmostEqual(distance, np.hypot(1, 2))
+        self.assertEqual(self.stars.nearest(190, 25)[0], 3)
+
+    def test_neighbour_distances_and_crowding(self):
+        np.testing.assert_allclose(self.stars.neighbour_distances()[1:3], 5)
+        self.stars.flag_crowded(10)
+        crowded = (self.stars.flags & CROWDED) != 0
+        np.testing.assert_array_equal(crowded, [False, True, True, False])
+        # Flags already set are kept
+        self.assertTrue(self.stars.flags[1] & SATURATED)
+
+    def test_copy_is_independent(self):
+        copy = self.stars.copy()
+        copy.data['peak'][0] = 0
+        self.assertEqual(self.stars.peak[0], 100)
+
+
+if __name__ == '__main__':
+    unittest.main()